@@ -1,20 +1,22 @@
 import os
+import gzip
 import json
-import redis
+import time
+import queue
+import threading
 from datetime import datetime, timedelta
-from flask import Flask, render_template, redirect, url_for, request, flash, session, send_from_directory, jsonify, abort
-from flask_sqlalchemy import SQLAlchemy
-from flask_mail import Mail, Message
+from flask import Flask, render_template, redirect, url_for, request, flash, session, send_from_directory, jsonify, abort, g, make_response, Response
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import stripe
 import uuid
 import secrets
 import logging
 from werkzeug.security import generate_password_hash, check_password_hash
-from presis.time_tracker import TimeTracker
-from presis.redis_backend import RedisBackend
-from presis.redis_user import RedisUser, RedisUserRepository
-from presis.redis_time_tracker import RedisTimeTracker
+from presis.lazy import LazyModule
+from presis import manual_entries, export, outbox
+from presis.reports import DailyReport, GROUPINGS, grouped_hours
+from presis.timesheet_queries import DEFAULT_SUMMARY_FIELDS
+from presis.report_cache import ReportCache
+from presis.compression import GzipRequestMiddleware
 
 logging.basicConfig()
 logger = logging.getLogger()
@@ -32,19 +34,35 @@ def inject_now():
     return {'now': datetime.now()}
 
 # Set up database and user model based on configuration
+# Storage modules are only imported for the configured storage
 if USE_REDIS:
-    # Use Redis for storage
-    redis_host = os.environ.get('REDIS_HOST', 'localhost')
-    redis_port = int(os.environ.get('REDIS_PORT', 6379))
-    redis_db = int(os.environ.get('REDIS_DB', 0))
-    redis_password = os.environ.get('REDIS_PASSWORD', None)
-    
-    redis_backend = RedisBackend(host=redis_host, port=redis_port, db=redis_db, password=redis_password)
+    from presis.redis_backend import RedisBackend
+    from presis.redis_user import RedisUser, RedisUserRepository
+    from presis.timesheet_events import EventHub, format_sse
+    from presis import open_sessions, stale_sessions
+    # Use Redis for storage, through a connection pool configured by the REDIS_* variables
+    redis_backend = RedisBackend.from_env()
+    # Optionally keep decoded timesheets in memory, invalidated by the other workers' writes
+    timesheet_cache_size = int(os.environ.get('TIMESHEET_CACHE_SIZE', 0))
+    if timesheet_cache_size:
+        redis_backend.enable_timesheet_cache(
+            maxsize=timesheet_cache_size,
+            ttl=float(os.environ.get('TIMESHEET_CACHE_TTL', 60))
+        )
     redis_user_repository = RedisUserRepository(redis_backend)
+    # Timesheet events of every worker, passed to the /events streams of this one
+    event_hub = EventHub(redis_backend)
+    # With REDIS_REPLICAS, read-only pages may be served from replicas; after a write, a
+    # client reads from the primary for this many seconds so it sees its own changes
+    REPLICA_READS = any(node.replicas for node in redis_backend.nodes())
+    REPLICA_READ_AFTER_WRITE = float(os.environ.get('REDIS_REPLICA_READ_AFTER_WRITE', 5))
     User = RedisUser
     # Define a global variable to access the repository
     user_repository = redis_user_repository
 else:
+    from flask_sqlalchemy import SQLAlchemy
+    from presis.time_tracker import TimeTracker
+    REPLICA_READS = False
     # Use SQLAlchemy for storage
     db = SQLAlchemy(app)
     # Define the User model normally
@@ -92,7 +110,45 @@ else:
         email = db.Column(db.String(120), nullable=False)
         token = db.Column(db.String(120), unique=True, nullable=False)
 
-mail = Mail(app)
+def reset_after_fork():
+    """Give a worker forked from a preloaded app its own Redis or database connections"""
+    if USE_REDIS:
+        redis_backend.reset_after_fork()
+    else:
+        with app.app_context():
+            # Leave the parent's connections open for the parent
+            db.engine.dispose(close=False)
+
+# Project reports of this worker, keyed by project version (0 disables the cache)
+report_cache = ReportCache(maxsize=int(os.environ.get('REPORT_CACHE_SIZE', 256)))
+
+# The CLI gzips large sync requests; this bounds what one may inflate to
+app.wsgi_app = GzipRequestMiddleware(app.wsgi_app, max_size=int(os.environ.get('GZIP_MAX_BODY', 64 * 1024 * 1024)))
+# Responses smaller than this are sent uncompressed by gzip_response views
+GZIP_MIN_SIZE = 1024
+
+# An /events stream holds a worker thread: it ends after this many seconds and the browser reconnects
+EVENTS_MAX_AGE = int(os.environ.get('EVENTS_MAX_AGE', 300))
+# Streams open at once in this worker, by default half its threads so that other requests always
+# find one; pages over the limit poll /events/version every EVENTS_POLL_INTERVAL seconds instead
+EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', int(os.environ.get('GUNICORN_THREADS', 4)) // 2))
+EVENTS_POLL_INTERVAL = 30
+event_streams = threading.BoundedSemaphore(EVENTS_MAX_STREAMS) if EVENTS_MAX_STREAMS > 0 else None
+# Comment lines sent this often keep idle streams from being closed by proxies
+EVENTS_KEEPALIVE = 15
+
+# Payment and mail libraries are slow to import and only used by a few routes
+stripe = LazyModule('stripe', setup=lambda module: setattr(module, 'api_key', app.config['STRIPE_API_KEY']))
+mail = None
+
+def get_mail():
+    """The Flask-Mail extension, set up on first use"""
+    global mail
+    if mail is None:
+        from flask_mail import Mail
+        mail = Mail(app)
+    return mail
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
@@ -102,7 +158,6 @@ if not USE_REDIS:
     with app.app_context():
         db.create_all()
 
-stripe.api_key = app.config['STRIPE_API_KEY']
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -141,6 +196,126 @@ def auth_token_required(f):
     
     return decorated
 
+def replica_reads(f):
+    """Decorator for read-only routes whose Redis reads may be served by replicas"""
+    from functools import wraps
+    
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        # Clients that wrote recently read from the primary, as a replica may lag behind
+        g.replica_reads = REPLICA_READS and not recently_wrote()
+        return f(*args, **kwargs)
+    
+    return decorated
+
+def gzip_response(f):
+    """Decorator for views returning large JSON, such as sync payloads, to gzip it for clients that accept it"""
+    from functools import wraps
+    
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        response = make_response(f(*args, **kwargs))
+        response.vary.add('Accept-Encoding')
+        if ('gzip' in request.accept_encodings and not response.direct_passthrough
+                and 'Content-Encoding' not in response.headers
+                and (response.content_length or 0) >= GZIP_MIN_SIZE):
+            response.set_data(gzip.compress(response.get_data(), compresslevel=5))
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
+    
+    return decorated
+
+def recently_wrote():
+    """True if this client changed data within the replica read-after-write window"""
+    return time.time() - session.get('last_write_at', 0) < REPLICA_READ_AFTER_WRITE
+
+def get_time_tracker(user):
+    """Get the time tracker of a user for the current request
+    
+    The tracker is loaded once per request and shared by everything that runs in it.
+    Changes are held in memory and written once, when the request finishes.
+    """
+    trackers = g.setdefault('time_trackers', {})
+    if user.id not in trackers:
+        # load_user already runs once per request: Flask-Login keeps the user in g
+        tracker = user.get_time_tracker()
+        tracker.autoflush = False
+        if USE_REDIS and is_session_user(user.id):
+            # Never serve this browser a cached timesheet older than its own last write
+            tracker.min_version = session.get('timesheet_version', 0)
+        if USE_REDIS:
+            tracker.replica_reads = g.get('replica_reads', False)
+        trackers[user.id] = tracker
+    return trackers[user.id]
+
+def timesheet_etag(user, project_name=None):
+    """ETag of a user's timesheet, or of one of its projects, found without loading the timesheet"""
+    tracker = get_time_tracker(user)
+    version = tracker.current_version(project_name)
+    if USE_REDIS:
+        # The copy read next, from a cache or a replica, must be at least as new as the ETag says
+        tracker.min_version = max(tracker.min_version, version)
+    return version_etag(user, version, project_name)
+
+def version_etag(user, version, project_name=None):
+    """ETag of a version of a user's timesheet or of one of its projects"""
+    kind = 'project' if project_name else 'timesheet'
+    return f"{kind}-{user.id}-{version}"
+
+def not_modified(etag):
+    """A 304 response if the client already has this version, otherwise None"""
+    if request.if_none_match.contains_weak(etag):
+        return with_etag(app.response_class(status=304), etag)
+    return None
+
+def with_etag(response, etag):
+    """Tag a response so that clients can revalidate it with If-None-Match"""
+    response.set_etag(etag)
+    # Per-user data: clients may keep it, but must check it is current before using it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def parse_date_args(since_arg, until_arg):
+    """Two YYYY-MM-DD query arguments as dates, None when absent; raises ValueError"""
+    return tuple(
+        datetime.strptime(request.args[arg], '%Y-%m-%d').date() if request.args.get(arg) else None
+        for arg in (since_arg, until_arg)
+    )
+
+def get_daily_report(user, project_name, version, project=None):
+    """A project's DailyReport from the report cache, built on a miss; None if there is no such project
+    
+    ``version`` is the project's ETag. Pass ``project`` if the timesheet is loaded already.
+    """
+    report = report_cache.get(user.id, project_name, version)
+    if report is None:
+        project = project or get_time_tracker(user).get_project(project_name)
+        if not project:
+            return None
+        report = DailyReport(project['sessions'])
+        report_cache.put(user.id, project_name, version, report)
+    return report
+
+def is_session_user(user_id):
+    """True if the user is the one logged in through the session cookie"""
+    return current_user.is_authenticated and current_user.id == user_id
+
+@app.after_request
+def flush_time_trackers(response):
+    """Write the changes the request made to any time tracker, in one go"""
+    wrote = request.method not in ('GET', 'HEAD', 'OPTIONS')
+    for tracker in g.pop('time_trackers', {}).values():
+        if not tracker.dirty:
+            continue
+        tracker.flush()
+        wrote = True
+        if USE_REDIS and is_session_user(tracker.user_id):
+            session['timesheet_version'] = tracker.version
+    if REPLICA_READS and wrote:
+        # Keep this client on the primary until replicas have caught up
+        session['last_write_at'] = time.time()
+    return response
+
 @app.route('/favicon.ico')
 def favicon():
     return send_from_directory(
@@ -150,25 +325,65 @@ def favicon():
     )
 
 @app.route('/')
+@replica_reads
 def index():
     if not current_user.is_authenticated:
         return redirect(url_for('login'))
     
     # Get the user's time tracker and projects
-    time_tracker = current_user.get_time_tracker()
+    time_tracker = get_time_tracker(current_user)
     projects = time_tracker.projects
     
-    # Get active project (if any)
-    active_project = None
-    for project in projects:
-        if project['sessions'] and project['sessions'][-1]['end'] is None:
-            active_project = project['project_name']
-            break
+    # Running projects, from the index kept by every write with Redis storage
+    active_projects = time_tracker.active_sessions()
     
-    return render_template('index.html', projects=projects, active_project=active_project)
+    return render_template(
+        'index.html', projects=projects, active_projects=active_projects, live_updates=USE_REDIS,
+        timesheet_version=time_tracker.version if USE_REDIS else None, poll_interval=EVENTS_POLL_INTERVAL)
+
+@app.route('/events')
+@login_required
+def timesheet_events():
+    """Server-Sent Events stream of the user's timesheet changes, made from any client (see EventHub)"""
+    if not USE_REDIS:
+        return jsonify({"error": "Live updates need Redis storage"}), 404
+    if event_streams is None or not event_streams.acquire(blocking=False):
+        # The browser does not retry after an error status, and the page polls instead
+        return jsonify({"error": "Too many live update streams, poll /events/version"}), 503
+    user_id = current_user.id
+    events = event_hub.subscribe(user_id)
+    
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            deadline = time.monotonic() + EVENTS_MAX_AGE
+            while time.monotonic() < deadline:
+                try:
+                    yield format_sse(events.get(timeout=EVENTS_KEEPALIVE))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            event_hub.unsubscribe(user_id, events)
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    # Called even if the stream never started
+    response.call_on_close(event_streams.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/events/version')
+@login_required
+def timesheet_version():
+    """Version of the user's timesheet, polled by pages that could not open an /events stream"""
+    if not USE_REDIS:
+        return jsonify({"error": "Live updates need Redis storage"}), 404
+    return jsonify({"version": get_time_tracker(current_user).current_version()})
 
 @app.route('/admin')
 @login_required
+@replica_reads
 def admin():
     # Only admin users can access this page
     if not current_user.is_admin:
@@ -177,12 +392,24 @@ def admin():
     
     # Get all users
     if USE_REDIS:
-        users = user_repository.all()
+        users = user_repository.all(replica=g.replica_reads)
     else:
         users = User.query.all()
     
     return render_template('admin.html', users=users)
 
+@app.route('/admin/stats')
+@login_required
+def admin_stats():
+    """Storage counters for monitoring, such as timesheet write conflicts and retries"""
+    if not current_user.is_admin:
+        abort(403)
+    
+    if not USE_REDIS:
+        return jsonify({"backend": "filesystem"})
+    
+    return jsonify({"backend": "redis", "open_sessions": open_sessions.count(redis_backend), **redis_backend.get_stats()})
+
 @app.route('/admin/toggle-admin/<int:user_id>', methods=['POST'])
 @login_required
 def toggle_admin(user_id):
@@ -245,7 +472,7 @@ def create_project():
         flash('Project name is required')
         return redirect(url_for('index'))
     
-    time_tracker = current_user.get_time_tracker()
+    time_tracker = get_time_tracker(current_user)
     
     # Check if project already exists
     if time_tracker.get_project(project_name):
@@ -263,7 +490,7 @@ def create_project():
 @login_required
 def toggle_project(project_name):
     comment = request.form.get('comment', '')
-    time_tracker = current_user.get_time_tracker()
+    time_tracker = get_time_tracker(current_user)
     
     # Check if project exists
     project = time_tracker.get_project(project_name)
@@ -277,10 +504,11 @@ def toggle_project(project_name):
     # Determine if we started or stopped
     project = time_tracker.get_project(project_name)
     last_session = project['sessions'][-1]
-    if last_session['end'] is None:
-        flash(f'Started time tracking for "{project_name}"')
-    else:
-        flash(f'Stopped time tracking for "{project_name}"')
+    status = "started" if last_session['end'] is None else "stopped"
+    if request.accept_mimetypes.best == 'application/json':
+        # Sent by the index page, which shows the change when its event arrives
+        return jsonify({"status": status})
+    flash(f'{status.capitalize()} time tracking for "{project_name}"')
     
     return redirect(url_for('index'))
 
@@ -299,7 +527,7 @@ def merge_projects():
         flash('Cannot merge a project with itself')
         return redirect(url_for('index'))
     
-    time_tracker = current_user.get_time_tracker()
+    time_tracker = get_time_tracker(current_user)
     success, message = time_tracker.merge_projects(source_project, destination_project)
     
     if success:
@@ -325,7 +553,7 @@ def add_manual_entry(project_name):
         flash('All date and time fields are required')
         return redirect(url_for('project_report', project_name=project_name))
     
-    time_tracker = current_user.get_time_tracker()
+    time_tracker = get_time_tracker(current_user)
     
     # Check if project exists
     project = time_tracker.get_project(project_name)
@@ -373,88 +601,87 @@ def edit_manual_entry(project_name):
 
 @app.route('/project/<project_name>/report')
 @login_required
+@replica_reads
 def project_report(project_name):
-    time_tracker = current_user.get_time_tracker()
-    
-    # Check if project exists
-    project = time_tracker.get_project(project_name)
-    if not project:
+    etag = timesheet_etag(current_user, project_name)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    # Reports are cached per project version, so the timesheet is only loaded after a change
+    report = get_daily_report(current_user, project_name, etag)
+    if report is None:
         flash(f'Project "{project_name}" not found')
         return redirect(url_for('index'))
     
-    # Get daily hours
-    daily_hours = time_tracker.assemble_total_hours_per_day(project_name)
+    # Running sessions are added to the cached hours as of now
+    days = report.days()
+    daily_report = [
+        {'date': date.strftime('%Y-%m-%d'), 'hours': round(hours.total_seconds() / 3600, 2), 'sessions': sessions}
+        for date, hours, sessions in days
+    ]
+    total_hours = sum((hours for _, hours, _ in days), timedelta()).total_seconds() / 3600
     
-    # Get all sessions for the project
-    sessions = project['sessions']
+    response = make_response(render_template(
+        'project_report.html', 
+        project_name=project_name, 
+        daily_report=daily_report, 
+        total_hours=round(total_hours, 2)
+    ))
+    # The hours of a running session grow by the minute, so only stopped projects are tagged
+    if not report.running:
+        with_etag(response, etag)
+    return response
+
+@app.route('/project/<project_name>/events')
+@login_required
+@replica_reads
+def project_events(project_name):
+    """Calendar events for the sessions overlapping a window
     
-    # Group sessions by date
-    sessions_by_date = {}
-    for session in sessions:
-        start_date = datetime.strptime(session['start'], "%d/%m/%y - %H:%M:%S").date()
-        
-        # Handle sessions that span multiple days
-        if session['end'] is not None:
-            end_date = datetime.strptime(session['end'], "%d/%m/%y - %H:%M:%S").date()
-            current_date = start_date
-            while current_date <= end_date:
-                date_str = current_date.strftime('%Y-%m-%d')
-                if date_str not in sessions_by_date:
-                    sessions_by_date[date_str] = []
-                
-                # Add session to this date
-                sessions_by_date[date_str].append(session)
-                current_date += timedelta(days=1)
-        else:
-            # For active sessions
-            date_str = start_date.strftime('%Y-%m-%d')
-            if date_str not in sessions_by_date:
-                sessions_by_date[date_str] = []
-            sessions_by_date[date_str].append(session)
-    
-    # Format for display
-    daily_report = []
-    for date, hours in daily_hours:
-        date_str = date.strftime('%Y-%m-%d')
-        hours_decimal = hours.total_seconds() / 3600
-        
-        # Get sessions for this date
-        date_sessions = sessions_by_date.get(date_str, [])
-        
-        daily_report.append({
-            'date': date_str,
-            'hours': round(hours_decimal, 2),
-            'sessions': date_sessions
-        })
+    Called by FullCalendar with the visible range as ``start`` and ``end``
+    (ISO 8601), so only the sessions on screen are sent, one event each.
+    """
+    try:
+        start, end = (parse_calendar_time(request.args[arg]) for arg in ('start', 'end'))
+    except (KeyError, ValueError):
+        return jsonify({"error": "start and end must be ISO 8601 dates"}), 400
     
-    # Calculate total hours
-    total_hours = time_tracker.calculate_total_hours(project_name).total_seconds() / 3600
-    
-    # Prepare calendar events data in JSON format
-    calendar_events = []
-    for day in daily_report:
-        for session in day['sessions']:
-            event = {
-                'title': session.get('comment', 'Work session'),
-                'date': day['date'],
-                'hours': day['hours'],
-                'timeRange': f"{session['start']} - {session.get('end', 'ongoing')}",
-                'comment': session.get('comment', ''),
-                'closingComment': session.get('closing_comment', '')
-            }
-            calendar_events.append(event)
+    etag = timesheet_etag(current_user, project_name)
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    import json
-    calendar_events_json = json.dumps(calendar_events)
+    time_tracker = get_time_tracker(current_user)
+    if not time_tracker.get_project(project_name):
+        return jsonify({"error": f"Project '{project_name}' not found"}), 404
     
-    return render_template(
-        'project_report.html', 
-        project_name=project_name, 
-        daily_report=daily_report, 
-        total_hours=round(total_hours, 2),
-        project=project,
-        calendar_events_json=calendar_events_json
-    )
+    events = []
+    active = False
+    for project_session, session_start, session_end in time_tracker.sessions_between(project_name, start, end):
+        active = active or project_session['end'] is None
+        events.append({
+            'title': project_session.get('comment') or 'Work session',
+            'start': session_start.isoformat(),
+            'end': session_end.isoformat(),
+            'extendedProps': {
+                'date': session_start.strftime('%Y-%m-%d'),
+                'hours': round((session_end - session_start).total_seconds() / 3600, 2),
+                'timeRange': f"{project_session['start']} - {project_session.get('end') or 'ongoing'}",
+                'comment': project_session.get('comment', ''),
+                'closingComment': project_session.get('closing_comment', '')
+            }
+        })
+    
+    response = jsonify(events)
+    # A running session's event grows without a write
+    if not active:
+        with_etag(response, etag)
+    return response
+
+def parse_calendar_time(value):
+    """Parse a FullCalendar range boundary as a naive local datetime, like session timestamps"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -637,9 +864,10 @@ def invite():
             db.session.commit()
 
         # Send invitation email
+        from flask_mail import Message
         msg = Message('Invitation to join Presis', sender='noreply@example.com', recipients=[email])
         msg.body = f'You have been invited to join Presis by {current_user.email}. Please register using the following link: {request.host_url}register/{token}'
-        mail.send(msg)
+        get_mail().send(msg)
 
         flash('Invitation sent')
     return render_template('invite.html')
@@ -767,13 +995,8 @@ def webhook():
         if USE_REDIS:
             # Find user with the given subscription_id
             # This is inefficient, but subscription events are rare
-            all_user_ids = redis_backend.r.keys("user:*")
-            for user_key in all_user_ids:
-                if not user_key.startswith("user:") or user_key.startswith("user_email:"):
-                    continue
-                user_id = user_key.split(":")[1]
-                user = user_repository.get(user_id)
-                if user and user.subscription_id == subscription['id']:
+            for user in user_repository.all():
+                if user.subscription_id == subscription['id']:
                     user.subscription_id = None
                     user.has_paid_plan = False
                     user.save()
@@ -837,11 +1060,8 @@ def delete_account():
         # For Redis, we need to handle this deletion
         user = user_repository.get(user_id)
         if user:
-            # Delete all user data from Redis
-            redis_backend.r.delete(f"user:{user_id}")
-            redis_backend.r.delete(f"user_email:{user.email}")
-            # Also delete any timesheet data
-            redis_backend.r.delete(f"timesheet:user:{user_id}")
+            # Delete all user data from Redis, including any timesheet data
+            user_repository.delete(user)
     else:
         # For SQLAlchemy
         user = User.query.get(user_id)
@@ -856,7 +1076,7 @@ def delete_account():
 @login_required
 def profile():
     """User profile page with API token management"""
-    return render_template('profile.html')
+    return render_template('profile.html', stale_sessions=USE_REDIS)
 
 @app.route('/profile/generate-token', methods=['POST'])
 @login_required
@@ -866,6 +1086,26 @@ def generate_api_token():
     flash('New API token generated successfully')
     return redirect(url_for('profile'))
 
+@app.route('/profile/stale-sessions', methods=['POST'])
+@login_required
+def set_stale_session_hours():
+    """Set after how many hours a forgotten running session is closed by the maintenance job"""
+    if not USE_REDIS:
+        abort(404)
+    value = request.form.get('stale_session_hours', '').strip()
+    try:
+        hours = float(value) if value else None
+        if hours is not None and not stale_sessions.MIN_HOURS <= hours <= stale_sessions.MAX_HOURS:
+            raise ValueError
+    except ValueError:
+        flash(f'Enter a number of hours from {stale_sessions.MIN_HOURS} to {stale_sessions.MAX_HOURS}, or nothing for the default')
+        return redirect(url_for('profile'))
+    current_user.stale_session_hours = hours
+    current_user.save()
+    flash('Running sessions will be closed after the default time' if hours is None
+          else f'Running sessions will be closed after {hours:g} hours')
+    return redirect(url_for('profile'))
+
 @app.route('/logout')
 @login_required
 def logout():
@@ -900,23 +1140,148 @@ def api_auth():
         "email": user.email
     })
 
+# Query parameters that switch /api/projects to paginated summaries
+PROJECT_QUERY_ARGS = {'limit', 'cursor', 'fields', 'since', 'until'}
+API_PROJECTS_DEFAULT_LIMIT = 100
+API_PROJECTS_MAX_LIMIT = 500
+
 @app.route('/api/projects', methods=['GET'])
 @auth_token_required
+@replica_reads
 def api_get_projects(user):
-    """Get all projects for the authenticated user"""
-    time_tracker = user.get_time_tracker()
-    return jsonify({"projects": time_tracker.projects})
+    """Get all projects for the authenticated user
+    
+    Without query parameters every project is returned with its full history.
+    With any of ``limit``, ``cursor``, ``fields``, ``since`` or ``until``, projects
+    are returned by name in pages of summaries, with a ``next_cursor`` to pass back.
+    Summaries hold the name, active flag and session count unless ``fields``
+    asks for others; session histories are only included with ``fields=sessions``.
+    """
+    etag = timesheet_etag(user)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    time_tracker = get_time_tracker(user)
+    if not PROJECT_QUERY_ARGS.intersection(request.args):
+        return with_etag(jsonify({"projects": time_tracker.projects}), etag)
+    
+    try:
+        limit = min(int(request.args.get('limit', API_PROJECTS_DEFAULT_LIMIT)), API_PROJECTS_MAX_LIMIT)
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or None
+        since, until = parse_date_args('since', 'until')
+        projects, next_cursor = time_tracker.project_summaries(
+            fields=fields, limit=limit, cursor=request.args.get('cursor'), since=since, until=until)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    response = jsonify({"projects": projects, "next_cursor": next_cursor})
+    # Hours of running sessions change without a write, whatever fields were asked for
+    if not ('total_hours' in (fields or DEFAULT_SUMMARY_FIELDS) and time_tracker.active_sessions()):
+        with_etag(response, etag)
+    return response
 
 @app.route('/api/projects/<project_name>', methods=['GET'])
 @auth_token_required
+@replica_reads
 def api_get_project(user, project_name):
     """Get a specific project for the authenticated user"""
-    time_tracker = user.get_time_tracker()
+    etag = timesheet_etag(user, project_name)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    time_tracker = get_time_tracker(user)
     project = time_tracker.get_project(project_name)
     if not project:
         return jsonify({"error": f"Project '{project_name}' not found"}), 404
     
-    return jsonify({"project": project})
+    return with_etag(jsonify({"project": project}), etag)
+
+@app.route('/api/projects/<project_name>/report', methods=['GET'])
+@auth_token_required
+@replica_reads
+def api_project_report(user, project_name):
+    """Hours of a project grouped by day, week or month
+    
+    ``group_by`` is day (default), week or month, and ``from``/``to``
+    (YYYY-MM-DD) limit the days counted. Overlapping sessions are counted once.
+    """
+    try:
+        group_by, since, until = parse_report_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    etag = timesheet_etag(user, project_name)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    report = get_daily_report(user, project_name, etag)
+    if report is None:
+        return jsonify({"error": f"Project '{project_name}' not found"}), 404
+    
+    response = jsonify(dict(
+        report_json(report, group_by, since, until),
+        project=project_name, group_by=group_by))
+    # The hours of a running session grow without a write
+    if not report.running:
+        with_etag(response, etag)
+    return response
+
+@app.route('/api/report', methods=['GET'])
+@auth_token_required
+@replica_reads
+def api_report(user):
+    """Hours of every project grouped by day, week or month, see api_project_report"""
+    try:
+        group_by, since, until = parse_report_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Project versions first: the timesheet read after the ETag is at least as new as them
+    versions = get_time_tracker(user).current_versions()
+    etag = timesheet_etag(user)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    projects = []
+    running = False
+    for project in sorted(get_time_tracker(user).projects, key=lambda p: p['project_name']):
+        name = project['project_name']
+        report = get_daily_report(user, name, version_etag(user, versions.get(name, 0), name), project)
+        running = running or bool(report.running)
+        projects.append(dict(report_json(report, group_by, since, until), project=name))
+    
+    response = jsonify({
+        "group_by": group_by,
+        "total_hours": round(sum(p['total_hours'] for p in projects), 2),
+        "projects": projects,
+    })
+    if not running:
+        with_etag(response, etag)
+    return response
+
+def parse_report_args():
+    """The group_by, from and to arguments of the report APIs; raises ValueError"""
+    group_by = request.args.get('group_by', 'day')
+    if group_by not in GROUPINGS:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUPINGS)}")
+    return (group_by,) + parse_date_args('from', 'to')
+
+def report_json(report, group_by, since, until):
+    """Total and per-period hours of a DailyReport, as of now"""
+    periods = grouped_hours(report.days(), group_by, since, until)
+    return {
+        "total_hours": round(sum((hours for _, hours in periods), timedelta()).total_seconds() / 3600, 2),
+        "periods": [
+            {"start": start.isoformat(), "hours": round(hours.total_seconds() / 3600, 2)}
+            for start, hours in periods
+        ],
+    }
 
 @app.route('/api/projects/<project_name>/toggle', methods=['POST'])
 @auth_token_required
@@ -925,28 +1290,28 @@ def api_toggle_project(user, project_name):
     data = request.get_json() or {}
     comment = data.get('comment', '')
     
-    time_tracker = user.get_time_tracker()
-    project = time_tracker.get_project(project_name)
+    time_tracker = get_time_tracker(user)
+    created = time_tracker.get_project(project_name) is None
     
-    # If project doesn't exist, create it
-    if not project:
-        time_tracker.add_or_update_project(project_name, comment)
-        return jsonify({
-            "message": f"Project '{project_name}' created and time tracking started",
-            "status": "started"
-        })
-    
-    # Toggle the project (start or stop)
+    # Toggle the project (start or stop), creating it if it doesn't exist
     time_tracker.add_or_update_project(project_name, comment)
+    # Write now, so that clients get the session as stored and can skip a sync
+    time_tracker.flush()
     
     # Determine if we started or stopped
-    project = time_tracker.get_project(project_name)
-    last_session = project['sessions'][-1]
+    last_session = time_tracker.get_project(project_name)['sessions'][-1]
     status = "started" if last_session['end'] is None else "stopped"
+    if created:
+        message = f"Project '{project_name}' created and time tracking started"
+    else:
+        message = f"Time tracking for '{project_name}' {status}"
     
     return jsonify({
-        "message": f"Time tracking for '{project_name}' {status}",
-        "status": status
+        "message": message,
+        "status": status,
+        "session": last_session,
+        # Sync cursor including this toggle; clients whose cursor is just below it are up to date
+        "cursor": time_tracker.version if USE_REDIS else None
     })
 
 @app.route('/api/projects/<project_name>/manual-entry', methods=['POST'])
@@ -969,14 +1334,11 @@ def api_add_manual_entry(user, project_name):
     if not all([start_date, start_time, end_date, end_time]):
         return jsonify({"error": "All date and time fields are required"}), 400
     
-    time_tracker = user.get_time_tracker()
+    time_tracker = get_time_tracker(user)
     
-    # Check if project exists
-    project = time_tracker.get_project(project_name)
-    if not project:
-        # Create project if it doesn't exist
+    # Create project if it doesn't exist
+    if not time_tracker.get_project(project_name):
         time_tracker.add_or_update_project(project_name, comment)
-        project = time_tracker.get_project(project_name)
     
     # Add manual session
     time_tracker.add_manual_session(
@@ -988,12 +1350,73 @@ def api_add_manual_entry(user, project_name):
         comment,
         closing_comment
     )
+    # Write now, so that the project is returned as stored
+    time_tracker.flush()
     
     return jsonify({
         "message": f"Time entry added to '{project_name}'",
-        "project": project
+        # Fetched again: a change may replace the project, e.g. a copy of one shared with the cache
+        "project": time_tracker.get_project(project_name)
     })
 
+@app.route('/api/entries', methods=['POST'])
+@auth_token_required
+def api_add_entries(user):
+    """Add many manual time entries, across projects, in one write
+    
+    The body is a JSON array of entries (or ``{"entries": [...]}``), or one
+    entry per line with Content-Type application/x-ndjson. Entries have the
+    fields of the manual-entry endpoint plus ``project``. All of them are
+    validated first; entries matching an existing session are skipped. The
+    response reports a status for each entry by its index.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        try:
+            entries = manual_entries.read_ndjson(request.stream)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 413
+    else:
+        data = request.get_json(silent=True)
+        entries = data.get('entries') if isinstance(data, dict) else data
+        if not isinstance(entries, list):
+            return jsonify({"error": "Expected a list of entries"}), 400
+        if len(entries) > manual_entries.MAX_ENTRIES:
+            return jsonify({"error": f"At most {manual_entries.MAX_ENTRIES} entries can be added at once"}), 413
+    
+    results = manual_entries.ingest(get_time_tracker(user), entries)
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("added", "duplicate", "error")}
+    return jsonify(dict(counts, results=results))
+
+@app.route('/api/export', methods=['GET'])
+@auth_token_required
+@replica_reads
+def api_export(user):
+    """Stream sessions as NDJSON or CSV, one session per line
+    
+    ``format`` is ndjson (default) or csv; ``from`` and ``to`` (YYYY-MM-DD)
+    keep the sessions overlapping those dates and ``project`` keeps one project.
+    Lines are encoded as they are sent, so large accounts start receiving
+    data straight away.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in export.FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(export.FORMATS)}"}), 400
+    try:
+        since, until = parse_date_args('from', 'to')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    time_tracker = get_time_tracker(user)
+    project_name = request.args.get('project')
+    if project_name is not None and not time_tracker.get_project(project_name):
+        return jsonify({"error": f"Project '{project_name}' not found"}), 404
+    
+    mimetype, encode = export.FORMATS[export_format]
+    records = export.session_records(time_tracker.projects, since, until, project_name)
+    response = Response(encode(records), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="sessions.{export_format}"'
+    return response
+
 @app.route('/api/sync', methods=['POST'])
 @auth_token_required
 def api_sync_data(user):
@@ -1002,7 +1425,9 @@ def api_sync_data(user):
     if not data or 'projects' not in data:
         return jsonify({"error": "Invalid sync data format"}), 400
     
-    time_tracker = user.get_time_tracker()
+    # Taken before loading, so the data sent back is at least this version
+    etag = timesheet_etag(user)
+    time_tracker = get_time_tracker(user)
     client_projects = data['projects']
     
     # Merge client projects with server projects
@@ -1017,25 +1442,113 @@ def api_sync_data(user):
                 for s in server_project['sessions']
             }
             
-            # Add new sessions from client
+            # Add new sessions from client, without changing the server's copy in place
+            merged_project = dict(server_project, sessions=list(server_project['sessions']))
             for client_session in client_project['sessions']:
                 session_key = f"{client_session.get('start')}_{client_session.get('end')}"
                 if session_key not in existing_sessions:
-                    server_project['sessions'].append(client_session)
+                    merged_project['sessions'].append(client_session)
             
-            # Update server project
-            time_tracker.update_project_raw(project_name, server_project)
+            # Update server project, unless the client had nothing new
+            if len(merged_project['sessions']) > len(server_project['sessions']):
+                time_tracker.update_project_raw(project_name, merged_project)
         else:
             # If project doesn't exist on server, add it
             time_tracker.add_project_raw(client_project)
     
+    # Nothing changed on the server and the client has seen this version already
+    if not time_tracker.dirty:
+        cached = not_modified(etag)
+        if cached:
+            return cached
+    
     # After merging, get updated server data
     server_data = {"projects": time_tracker.projects}
-    
-    return jsonify({
+    response = jsonify({
         "message": "Sync successful",
         "data": server_data
     })
+    if time_tracker.dirty:
+        # The ETag of the merged timesheet is only known once it is written
+        return response
+    return with_etag(response, etag)
+
+@app.route('/api/v2/sync', methods=['POST'])
+@gzip_response
+@auth_token_required
+def api_sync_v2(user):
+    """Exchange only the sessions changed since the client's last sync
+    
+    The client sends ``cursor``, the value returned by its previous sync (null
+    the first time), and ``changes``: its projects with only the sessions it
+    changed since then. The server merges them and answers with a new cursor and
+    the sessions changed after the client's cursor, plus removed projects. When
+    it cannot compute a delta, ``full`` is true and ``projects`` is the whole dataset.
+    """
+    data = request.get_json(silent=True)
+    try:
+        cursor, changes = parse_sync_request(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    time_tracker = get_time_tracker(user)
+    return jsonify(time_tracker.sync(cursor, changes))
+
+@app.route('/api/ops', methods=['POST'])
+@gzip_response
+@auth_token_required
+def api_ops(user):
+    """Apply a batch of operations queued by a client, then sync like /api/v2/sync
+    
+    Besides ``cursor`` and ``changes``, the body holds ``ops`` (see presis.outbox).
+    They are applied before the changes, each key only once, and ``results``
+    gives the status of each in order: applied, duplicate or, for an operation
+    that can never be applied, error.
+    """
+    data = request.get_json(silent=True)
+    try:
+        cursor, changes = parse_sync_request(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    ops = data.get('ops', [])
+    if not isinstance(ops, list):
+        return jsonify({"error": "ops must be a list of operations"}), 400
+    if len(ops) > outbox.MAX_OPS:
+        return jsonify({"error": f"At most {outbox.MAX_OPS} operations can be sent at once"}), 413
+    
+    valid, errors = [], {}
+    for index, op in enumerate(ops):
+        try:
+            valid.append(outbox.parse_op(op))
+        except ValueError as e:
+            key = op.get('key') if isinstance(op, dict) else None
+            errors[index] = {"key": key, "status": "error", "error": str(e)}
+    
+    time_tracker = get_time_tracker(user)
+    response = time_tracker.sync(cursor, changes, valid)
+    applied = iter(response.get("results", []))
+    response["results"] = [errors[index] if index in errors else next(applied) for index in range(len(ops))]
+    return jsonify(response)
+
+def parse_sync_request(data):
+    """Validate a v2 sync request and return its cursor and changes"""
+    if not isinstance(data, dict):
+        raise ValueError("Invalid sync data format")
+    cursor = data.get('cursor')
+    if cursor is not None and (not isinstance(cursor, int) or isinstance(cursor, bool) or cursor < 0):
+        raise ValueError("cursor must be a non-negative integer or null")
+    changes = data.get('changes', [])
+    if not isinstance(changes, list):
+        raise ValueError("changes must be a list of projects")
+    for change in changes:
+        if (not isinstance(change, dict) or not isinstance(change.get('project_name'), str)
+                or not isinstance(change.get('sessions', []), list)):
+            raise ValueError("Each change needs a project_name and a list of sessions")
+        change.setdefault('sessions', [])
+        for client_session in change['sessions']:
+            if not isinstance(client_session, dict) or not isinstance(client_session.get('start'), str):
+                raise ValueError(f"Sessions of '{change['project_name']}' need a start timestamp")
+    return cursor, changes
 
 if __name__ == '__main__':
     app.run(debug=True)
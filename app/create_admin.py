@@ -8,7 +8,7 @@ import json
 from pathlib import Path
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash
-import redis
+from presis.redis_backend import RedisBackend
 
 def create_admin_user():
     """
@@ -40,18 +40,11 @@ def create_admin_user_redis(admin_email, admin_password):
     # Configure Redis connection
     redis_host = os.environ.get('REDIS_HOST', 'localhost')
     redis_port = int(os.environ.get('REDIS_PORT', 6379))
-    redis_db = int(os.environ.get('REDIS_DB', 0))
-    redis_password = os.environ.get('REDIS_PASSWORD', None)
     
     try:
-        # Connect to Redis
-        r = redis.StrictRedis(
-            host=redis_host, 
-            port=redis_port, 
-            db=redis_db, 
-            password=redis_password,
-            decode_responses=True
-        )
+        # Connect to Redis through the shared connection pool
+        backend = RedisBackend.from_env()
+        r = backend.r
         
         # Check if Redis is running by pinging it
         if not r.ping():
@@ -63,19 +56,18 @@ def create_admin_user_redis(admin_email, admin_password):
         # Check if any admin user exists
         admin_exists = False
         
-        # Get all user keys
-        user_keys = r.keys("user:*")
-        for user_key in user_keys:
-            if not user_key.startswith("user:") or user_key.startswith("user_email:"):
-                continue
-                
-            user_data = r.get(user_key)
-            if user_data:
-                user_data = json.loads(user_data)
-                if user_data.get('is_admin'):
-                    admin_exists = True
-                    print(f"Admin user already exists: {user_data.get('email')}")
-                    break
+        # Get all user records, in one round trip per server
+        for node in backend.nodes():
+            user_keys = [key for key in node.r.scan_iter(match="user:*") if key.split(":")[1].isdigit()]
+            for user_data in (node.r.mget(user_keys) if user_keys else []):
+                if user_data:
+                    user_data = json.loads(user_data)
+                    if user_data.get('is_admin'):
+                        admin_exists = True
+                        print(f"Admin user already exists: {user_data.get('email')}")
+                        break
+            if admin_exists:
+                break
         
         if admin_exists:
             return True
@@ -85,23 +77,23 @@ def create_admin_user_redis(admin_email, admin_password):
         
         if user_id:
             # Make existing user an admin
-            user_data = r.get(f"user:{user_id}")
+            shard = backend.shard_for_user(user_id).r
+            user_data = shard.get(f"user:{user_id}")
             if user_data:
                 user_data = json.loads(user_data)
                 user_data['is_admin'] = True
                 user_data['has_paid_plan'] = True
-                r.set(f"user:{user_id}", json.dumps(user_data))
+                shard.set(f"user:{user_id}", json.dumps(user_data))
                 print(f"Existing user {admin_email} promoted to admin")
                 return True
         
         # Create a new admin user
-        # First, get the next available user ID
-        next_id = r.get("next_user_id")
-        if not next_id:
-            next_id = 1
-            r.set("next_user_id", next_id)
-        else:
-            next_id = int(next_id)
+        # First, atomically claim the next available user ID
+        with backend.pipeline() as pipe:
+            pipe.setnx("next_user_id", 1)
+            pipe.incr("next_user_id")
+            _, next_id = pipe.execute()
+        next_id -= 1
         
         # Hash the password
         hashed_password = generate_password_hash(admin_password)
@@ -118,13 +110,10 @@ def create_admin_user_redis(admin_email, admin_password):
             'api_token': None
         }
         
-        # Save the user to Redis
-        r.set(f"user:{next_id}", json.dumps(user_data))
+        # Save the user to Redis: the record on the user's shard, the email index on the primary
+        backend.shard_for_user(next_id).r.set(f"user:{next_id}", json.dumps(user_data))
         r.set(f"user_email:{admin_email}", next_id)
         
-        # Increment the next user ID
-        r.set("next_user_id", next_id + 1)
-        
         print(f"Created new admin user in Redis: {admin_email}")
         return True
         
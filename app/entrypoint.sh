@@ -6,6 +6,12 @@ echo "Setting up admin user if needed..."
 cd /app
 python ./app/create_admin.py
 
-# Run the Flask application
-echo "Starting Flask application..."
-exec flask run --host=0.0.0.0 --port=3000
+# The single-process development server, for debugging only
+if [ "${PRESIS_DEV_SERVER:-false}" = "true" ]; then
+    echo "Starting Flask development server..."
+    exec flask run --host=0.0.0.0 --port=3000
+fi
+
+# Run the Flask application with gunicorn, see app/gunicorn.conf.py for the GUNICORN_* settings
+echo "Starting Flask application with gunicorn..."
+exec gunicorn -c ./app/gunicorn.conf.py
@@ -0,0 +1,51 @@
+"""
+Gunicorn settings for serving the app in production:
+
+    gunicorn -c app/gunicorn.conf.py
+
+Each setting below can be changed through the GUNICORN_* environment
+variable next to it. Workers are forked from a master that has already
+imported the app (preload), so they start quickly and share its memory;
+post_fork() then gives each worker its own Redis or database connections.
+
+Send SIGHUP to the master to replace the workers gracefully: running requests
+are finished within the graceful timeout. With preload, the workers are
+forked from the code loaded by the master, so deploy new code with SIGUSR2
+(start a new master) followed by SIGTERM to the old one, or set
+GUNICORN_PRELOAD=false to have SIGHUP load new code too.
+"""
+import os
+import multiprocessing
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The app module and its config live in this directory, presis one level up
+wsgi_app = "wsgi:application"
+chdir = APP_DIR
+pythonpath = os.path.dirname(APP_DIR)
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:3000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Threads serve the requests that wait on Redis or the network while others run.
+# Each open /events stream (live updates of the index page) holds one of them, so the
+# app opens at most EVENTS_MAX_STREAMS (default: half of GUNICORN_THREADS) per worker
+# and further pages poll; raise both for many open pages per worker
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+# Recycle workers after this many requests (0: never), with jitter so they do not restart together
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    """Drop the connections a preloaded app inherited from the master"""
+    if preload_app:
+        from wsgi import reset_after_fork
+        reset_after_fork()
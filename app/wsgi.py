@@ -0,0 +1,11 @@
+"""
+WSGI entry point for production servers, configured by gunicorn.conf.py:
+
+    gunicorn -c app/gunicorn.conf.py
+
+The app is built when app.py is imported; ``application`` is that app.
+"""
+from app import app as application, reset_after_fork
+
+
+__all__ = ["application", "reset_after_fork"]
@@ -0,0 +1,127 @@
+"""
+Latency and bytes on the wire of CLI syncs, with and without presis.client.
+
+    python benchmarks/bench_client.py [--requests 200] [--sessions 2000] [--delay-ms 0]
+
+A local HTTP/1.1 server answers sync-like requests with a timesheet of the
+given size, gzipped when the client accepts it (as the app's sync views do).
+"bare requests" opens a connection per request and sends plain JSON, like
+the CLI used to; "presis.client" reuses one keep-alive connection and gzips
+large bodies. --delay-ms adds a delay to every new connection, standing in
+for the TCP and TLS handshakes of a remote server.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import requests
+from presis import client
+
+
+def make_timesheet(sessions):
+    return {"cursor": 1, "full": True, "deleted_projects": [], "projects": [{
+        "project_name": "bench",
+        "sessions": [
+            {"start": f"{1 + i % 28:02d}/01/25 - 09:{i % 60:02d}:00", "end": f"{1 + i % 28:02d}/01/25 - 10:00:00",
+             "comment": f"session {i}", "rev": i}
+            for i in range(sessions)
+        ],
+    }]}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive
+    # Headers and body are written separately: without this, Nagle's algorithm
+    # holds the body back until the client's delayed ACK on reused connections
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        # Once per connection
+        time.sleep(self.server.connect_delay)
+        self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.bytes_received += len(body)
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        json.loads(body)
+        payload = self.server.payload
+        encoding = "gzip" in self.headers.get("Accept-Encoding", "") and self.server.compress
+        if encoding:
+            payload = self.server.gzipped_payload
+        self.server.bytes_sent += len(payload)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if encoding:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(server, send, count):
+    """Latencies in ms of ``count`` requests sent by ``send``"""
+    server.connections = server.bytes_received = server.bytes_sent = 0
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = send()
+        response.json()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--sessions", type=int, default=2000, help="sessions in each request and response")
+    parser.add_argument("--delay-ms", type=float, default=0, help="added to every new connection")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.connect_delay = args.delay_ms / 1000
+    server.payload = json.dumps(make_timesheet(args.sessions)).encode()
+    server.gzipped_payload = gzip.compress(server.payload, compresslevel=5)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = {"server_url": f"http://127.0.0.1:{server.server_port}", "token": "bench"}
+    body = {"cursor": None, "changes": make_timesheet(args.sessions)["projects"]}
+
+    def bare():
+        # Like the CLI before: a new connection per request, plain JSON both ways
+        return requests.post(f"{config['server_url']}/api/v2/sync", json=body,
+                             headers={"Authorization": "Bearer bench", "Accept-Encoding": "identity"}, timeout=5)
+
+    cases = [
+        ("bare requests", bare, False),
+        ("presis.client", lambda: client.post(config, "/api/v2/sync", body, compress=True), True),
+    ]
+    print(f"{args.requests} syncs of {args.sessions} sessions, {args.delay_ms:g}ms per new connection")
+    print(f"{'client':>14} {'p50':>8} {'p95':>8} {'conns':>6} {'sent':>9} {'received':>9}")
+    for name, send, compress in cases:
+        server.compress = compress
+        run(server, send, 3)  # warm up
+        latencies = run(server, send, args.requests)
+        p50 = statistics.median(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{name:>14} {p50:>6.2f}ms {p95:>6.2f}ms {server.connections:>6} "
+              f"{server.bytes_received / args.requests / 1024:>7.1f}KB {server.bytes_sent / args.requests / 1024:>7.1f}KB")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
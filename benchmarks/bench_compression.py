@@ -0,0 +1,64 @@
+"""
+Size and speed of stored timesheet values, legacy plain JSON versus compressed.
+
+    python benchmarks/bench_compression.py
+"""
+import os
+import sys
+import json
+import random
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from presis.compression import compress_value, decompress_value
+
+FMT = "%d/%m/%y - %H:%M:%S"
+COMMENTS = ["", "code review", "meeting with client", "bug fixing", "deploy", "planning"]
+
+
+def make_timesheet(days, projects=5, sessions_per_day=3, seed=1):
+    """A user who tracked a few sessions a day across several projects"""
+    rng = random.Random(seed)
+    data = {"projects": [{"project_name": f"project-{i}", "sessions": []} for i in range(projects)]}
+    start_day = datetime(2020, 1, 1)
+    for day in range(days):
+        clock = start_day + timedelta(days=day, hours=8)
+        for _ in range(sessions_per_day):
+            start = clock + timedelta(minutes=rng.randint(0, 60))
+            end = start + timedelta(minutes=rng.randint(15, 180))
+            clock = end
+            data["projects"][rng.randrange(projects)]["sessions"].append({
+                "start": start.strftime(FMT),
+                "end": end.strftime(FMT),
+                "comment": rng.choice(COMMENTS),
+                "closing_comment": rng.choice(COMMENTS),
+            })
+    return data
+
+
+def main():
+    print(f"{'history':>10} {'legacy':>10} {'compact':>10} {'zlib':>10} {'saved':>7} {'encode':>9} {'decode':>9}")
+    for days in (30, 365, 3 * 365, 10 * 365):
+        data = make_timesheet(days)
+        legacy = json.dumps(data).encode("utf-8")
+        compact = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        stored = compress_value(compact, 1024)
+        assert json.loads(decompress_value(stored)) == data
+
+        runs = 20
+        encode = timeit.timeit(
+            lambda: compress_value(json.dumps(data, separators=(",", ":")).encode("utf-8"), 1024), number=runs) / runs
+        decode = timeit.timeit(lambda: json.loads(decompress_value(stored)), number=runs) / runs
+        legacy_decode = timeit.timeit(lambda: json.loads(legacy), number=runs) / runs
+
+        print(
+            f"{days:>6} days {len(legacy):>10,} {len(compact):>10,} {len(stored):>10,} "
+            f"{1 - len(stored) / len(legacy):>6.0%} {encode * 1000:>7.2f}ms {decode * 1000:>7.2f}ms"
+            f"  (legacy decode {legacy_decode * 1000:.2f}ms)"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Requests per second of the app under concurrent load, by server and worker count.
+
+    python benchmarks/bench_serving.py [--workers 1,2,4] [--clients 32] [--seconds 5]
+
+Compares the Flask development server with gunicorn (app/gunicorn.conf.py)
+at each worker count. Needs gunicorn and a Redis server given by REDIS_HOST
+and REDIS_PORT; a benchmark user with a year of sessions is created in
+database REDIS_DB (default 15) and removed afterwards.
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import subprocess
+import http.client
+import multiprocessing
+import threading
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from presis.redis_backend import RedisBackend
+from presis.redis_user import RedisUserRepository
+from presis.redis_time_tracker import RedisTimeTracker
+
+FMT = "%d/%m/%y - %H:%M:%S"
+
+
+def make_user(backend, days=365, projects=5):
+    """A user who tracked three sessions a day across several projects"""
+    user = RedisUserRepository(backend).create(f"bench-{uuid.uuid4().hex[:8]}@example.com", "bench")
+    token = user.generate_api_token()
+    rng = random.Random(1)
+    data = [{"project_name": f"project-{i}", "sessions": []} for i in range(projects)]
+    for day in range(days):
+        clock = datetime(2024, 1, 1, 8) + timedelta(days=day)
+        for _ in range(3):
+            start = clock + timedelta(minutes=rng.randint(0, 60))
+            clock = start + timedelta(minutes=rng.randint(15, 180))
+            data[rng.randrange(projects)]["sessions"].append(
+                {"start": start.strftime(FMT), "end": clock.strftime(FMT), "comment": "bench"})
+    tracker = RedisTimeTracker(user.id, backend)
+    for project in data:
+        tracker.add_project_raw(project)
+    return user, token
+
+
+def start_server(command, port, env):
+    """Start a server on port and wait until it answers"""
+    process = subprocess.Popen(command, cwd=os.path.join(ROOT, "app"), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/login")
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server did not start: {' '.join(command)}")
+
+
+def client_process(port, path, headers, connections, seconds, results):
+    """Send requests over keep-alive connections for a while; puts the latencies on results"""
+    latencies = []
+    deadline = time.monotonic() + seconds
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(latencies)
+
+
+def load(port, path, headers, clients, seconds):
+    """Requests per second and latency percentiles with this many concurrent clients"""
+    processes = max(1, min(clients, multiprocessing.cpu_count()))
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=client_process, args=(
+            port, path, headers, clients // processes + (i < clients % processes), seconds, results))
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    latencies = sorted(latency for _ in workers for latency in results.get())
+    for worker in workers:
+        worker.join()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return len(latencies) / seconds, percentile(0.5), percentile(0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="gunicorn worker counts to compare")
+    parser.add_argument("--threads", default="4", help="threads per gunicorn worker")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent keep-alive connections")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--path", default="/api/projects?fields=name,active,total_hours")
+    parser.add_argument("--port", type=int, default=3900)
+    args = parser.parse_args()
+
+    db = os.environ.get("REDIS_DB", "15")
+    backend = RedisBackend(host=os.environ.get("REDIS_HOST", "localhost"),
+                           port=int(os.environ.get("REDIS_PORT", 6379)), db=int(db))
+    user, token = make_user(backend)
+    headers = {"Authorization": f"Bearer {token}"}
+    env = dict(os.environ, PRESIS_NO_FSDB="true", REDIS_DB=db, PYTHONPATH=ROOT,
+               SECRET_KEY=os.environ.get("SECRET_KEY", "bench"),
+               STRIPE_API_KEY=os.environ.get("STRIPE_API_KEY", "bench"),
+               GUNICORN_BIND=f"127.0.0.1:{args.port}", GUNICORN_ACCESS_LOG="",
+               GUNICORN_THREADS=args.threads)
+
+    servers = [("flask run", 1, [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(args.port)])]
+    servers += [
+        ("gunicorn", int(workers), [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"])
+        for workers in args.workers.split(",")
+    ]
+    print(f"{args.clients} clients, GET {args.path}, {multiprocessing.cpu_count()} CPUs")
+    print(f"{'server':>10} {'workers':>8} {'req/s':>9} {'p50':>9} {'p99':>9}")
+    try:
+        for name, workers, command in servers:
+            process = start_server(command, args.port, dict(env, GUNICORN_WORKERS=str(workers)))
+            try:
+                load(args.port, args.path, headers, args.clients, 1)  # warm up
+                rps, p50, p99 = load(args.port, args.path, headers, args.clients, args.seconds)
+            finally:
+                process.terminate()
+                process.wait()
+            print(f"{name:>10} {workers:>8} {rps:>9.0f} {p50:>7.1f}ms {p99:>7.1f}ms")
+    finally:
+        RedisUserRepository(backend).delete(user)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Cold start time and memory of the presis CLI and of the web app.
+
+    python benchmarks/bench_startup.py [--runs 10]
+
+Each case runs in a fresh interpreter; the time is the median wall time of
+the whole process and the memory its peak RSS. "every dependency" imports
+what presis and the app used to load up front, for comparison. The Redis
+case needs a Redis server given by REDIS_HOST/REDIS_PORT and is skipped
+without one.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+# Printed by every case on its last line
+REPORT = (
+    "import resource, sys, json; "
+    "rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss; "
+    "print(json.dumps({'rss_kb': rss // 1024 if sys.platform == 'darwin' else rss, "
+    "'heavy': sorted(m for m in %r if m in sys.modules)}))"
+)
+HEAVY = ("matplotlib", "requests", "redis", "stripe", "sqlalchemy", "flask_mail")
+
+
+def run_case(code, env, cwd, runs):
+    """Median wall time, peak RSS and heavy modules loaded of running code in a fresh interpreter"""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", f"{code}\n{REPORT % (HEAVY,)}"],
+                                cwd=cwd, env=env, capture_output=True, text=True)
+        times.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return (statistics.median(times), report["rss_kb"], report["heavy"]), None
+
+
+def redis_available(env):
+    try:
+        import redis
+        redis.Redis(host=env.get("REDIS_HOST", "localhost"), port=int(env.get("REDIS_PORT", 6379)),
+                    socket_connect_timeout=0.5).ping()
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp()
+    data_file = os.path.join(home, "data.json")
+    with open(data_file, "w") as f:
+        json.dump({"projects": []}, f)
+    # A HOME without ~/.presis/config.json keeps the CLI offline
+    env = dict(os.environ, HOME=home, PYTHONPATH=ROOT, SECRET_KEY="bench", STRIPE_API_KEY="bench",
+               MPLBACKEND="Agg")
+    app_dir = os.path.join(ROOT, "app")
+    toggle = f"import sys; sys.argv = ['presis', 'bench', '-c', 'x', '-p', {data_file!r}]; import presis; presis.main()"
+
+    cases = [
+        ("python", "pass", env, ROOT),
+        ("import presis", "import presis", env, ROOT),
+        ("presis toggle", toggle, env, ROOT),
+        ("every dependency", "import presis, requests, redis, presis.timesheet_plotter", env, ROOT),
+        ("app (sqlalchemy)", "import app", dict(env, SQLALCHEMY_DATABASE_URI="sqlite:///:memory:"), app_dir),
+    ]
+    if redis_available(env):
+        cases.append(("app (redis)", "import app", dict(env, PRESIS_NO_FSDB="true"), app_dir))
+    cases.append((
+        "app, every dependency",
+        "import stripe, flask_mail, flask_sqlalchemy, matplotlib.pyplot, requests, app",
+        dict(env, SQLALCHEMY_DATABASE_URI="sqlite:///:memory:"), app_dir,
+    ))
+
+    print(f"{'case':>22} {'time':>9} {'rss':>8}  heavy modules loaded")
+    for name, code, case_env, cwd in cases:
+        result, error = run_case(code, case_env, cwd, args.runs)
+        if result is None:
+            print(f"{name:>22}  failed: {error}")
+            continue
+        seconds, rss_kb, heavy = result
+        print(f"{name:>22} {seconds * 1000:>7.0f}ms {rss_kb / 1024:>6.1f}MB  {', '.join(heavy) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
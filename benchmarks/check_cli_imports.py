@@ -0,0 +1,82 @@
+"""
+Regression check of what the presis CLI imports on its fast paths.
+
+    python benchmarks/check_cli_imports.py [--budget-ms 25] [--runs 5]
+
+Runs toggle and status in fresh interpreters under ``python -X importtime``
+and fails when one of them imports a module that only --plot, --sync or
+--login need, or when the modules imported for presis take longer than the
+budget (the best of several runs, to leave out noise). Prints the slowest
+imports either way.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Only loaded by the commands that use them
+FORBIDDEN = ("requests", "urllib3", "matplotlib", "numpy", "redis", "getpass")
+
+
+def import_times(code, env):
+    """``{module: (self_us, cumulative_us)}`` of what running code imported after
+    interpreter startup, and the total time of those imports"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    modules = {}
+    total = 0
+    lines = result.stderr.splitlines()
+    # Interpreter startup ends with importing site; only what comes after is ours
+    started = next(i for i, line in enumerate(lines) if line.endswith("| site")) + 1
+    for line in lines[started:]:
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+        if not name.startswith("  "):
+            total += int(cumulative_us)
+    return modules, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=25)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp()
+    data_file = os.path.join(home, "data.json")
+    with open(data_file, "w") as f:
+        json.dump({"projects": []}, f)
+    # A HOME without ~/.presis/config.json keeps the CLI offline
+    env = dict(os.environ, HOME=home, PYTHONPATH=ROOT)
+    run = "import sys; sys.argv = ['presis'] + {!r}; import presis; presis.main()"
+    cases = [
+        ("toggle", run.format(["bench", "-c", "x", "-p", data_file])),
+        ("status", run.format(["--status", "-p", data_file])),
+    ]
+
+    failed = False
+    for name, code in cases:
+        runs = [import_times(code, env) for _ in range(args.runs)]
+        modules, _ = runs[-1]
+        total_ms = min(total for _, total in runs) / 1000
+        forbidden = [module for module in modules if module.split(".")[0] in FORBIDDEN]
+        slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:5]
+        print(f"{name}: {total_ms:.1f}ms of imports (budget {args.budget_ms:.0f}ms); slowest: "
+              + ", ".join(f"{module} {self_us / 1000:.1f}ms" for module, (self_us, _) in slowest))
+        if forbidden:
+            print(f"  FAIL: imports {', '.join(sorted(forbidden))}")
+            failed = True
+        if total_ms > args.budget_ms:
+            print("  FAIL: over budget")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,7 @@ from kivy_presis.auth.jwt_utils import JwtUtils
 class LoginForm(BoxLayout):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.redis_backend = RedisBackend()
+        self.redis_backend = RedisBackend.shared()
 
     def login(self, username, password):
         """Authenticate the user against Redis."""
@@ -41,7 +41,7 @@ class TimesheetScreen(BoxLayout):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.redis_backend = RedisBackend()
+        self.redis_backend = RedisBackend.shared()
 
     def save_timesheet(self, project_name):
         """Save the timesheet to Redis."""
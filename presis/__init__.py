@@ -3,22 +3,40 @@
 import os
 import argparse
 import json
-import getpass
-import requests
 import sys
+from datetime import datetime
 from pathlib import Path
 from .time_tracker import TimeTracker
-from .timesheet_plotter import TimesheetPlotter
-from .redis_backend import RedisBackend
+from .sync import unsynced_changes
+from .timesheet_queries import parse_timestamp
+from . import manual_entries, export, client
 
 __all__ = ["TimeTracker", "TimesheetPlotter", "RedisBackend"]
 
+
+def __getattr__(name):
+    """Import the exports that pull in matplotlib, redis or requests only when they are used"""
+    if name == "TimesheetPlotter":
+        from .timesheet_plotter import TimesheetPlotter
+        return TimesheetPlotter
+    if name == "RedisBackend":
+        from .redis_backend import RedisBackend
+        return RedisBackend
+    if name == "requests":
+        import requests
+        return requests
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # Default server URL
 DEFAULT_SERVER_URL = "http://localhost:5002"
 
 # Config file for storing API token and server URL
 CONFIG_DIR = os.path.expanduser("~/.presis")
 CONFIG_FILE = os.path.join(CONFIG_DIR, "config.json")
+# Operations waiting to be sent to the server (see presis.outbox)
+OUTBOX_FILE = os.path.join(CONFIG_DIR, "outbox.ndjson")
+# Socket of the local agent, when one runs (see presis.agent)
+AGENT_SOCKET = os.path.join(CONFIG_DIR, "agent.sock")
 
 def get_config():
     """Get the configuration from the config file"""
@@ -45,20 +63,22 @@ def save_config(config):
 
 def authenticate(config):
     """Authenticate with the server and get an API token"""
+    import getpass
     print("Authentication required")
     email = input("Email: ")
     password = getpass.getpass("Password: ")
     
+    import requests
     try:
-        response = requests.post(
-            f"{config['server_url']}/api/auth",
-            json={"email": email, "password": password},
-            timeout=5
-        )
+        response = client.post(config, "/api/auth", {"email": email, "password": password})
         
         if response.status_code == 200:
             data = response.json()
             config["token"] = data["token"]
+            # Sync positions and versions belong to the previous account
+            config.pop("sync_cursors", None)
+            config.pop("sync_pending", None)
+            config.pop("sync_etags", None)
             save_config(config)
             print("Authentication successful!")
             return True
@@ -71,12 +91,15 @@ def authenticate(config):
         print("You can still work offline, but changes won't sync to the server.")
         return False
 
-def create_data_file(path):
+def create_data_file(path, config=None):
+    """Create the data file if it is missing; with ``config``, forget what was synced into an earlier one"""
     path = append_filename_to_path(path)
     dirname = os.path.dirname(path)
     if dirname and not os.path.exists(dirname):
         os.makedirs(dirname)
     if not os.path.exists(path):
+        if config is not None and forget_sync_state(config, path):
+            save_config(config)
         try:
             f = open(path, "a")
             empty_content = '''
@@ -96,6 +119,17 @@ def create_data_file(path):
         return path
 
 
+def forget_sync_state(config, path):
+    """Drop the sync cursor, ETag and pending mark of a data file; returns True if there were any"""
+    data_file = os.path.abspath(path)
+    found = False
+    for key in ("sync_cursors", "sync_etags"):
+        found = config.get(key, {}).pop(data_file, None) is not None or found
+    if data_file in config.get("sync_pending", []):
+        config["sync_pending"].remove(data_file)
+        found = True
+    return found
+
 def is_dir(path):
     """Returns True if path has no extension."""
     return len(os.path.basename(path).split('.')) == 1
@@ -113,30 +147,97 @@ def append_filename_to_path(path, default_name="data.json"):
     return path
 
 
-def sync_with_server(config, tracker, project_name=None):
-    """Sync data with the server"""
+def sync_with_server(config, tracker, project_name=None, retry=True):
+    """Sync data with the server, exchanging only what changed since the last sync
+
+    Operations queued in the outbox are sent in the same request. With
+    ``retry=False``, a failed request is not retried.
+    """
     if not config["token"]:
         print("Not authenticated. Use --login to authenticate first.")
         return False
     
+    # Where the server's history was last synced into this data file (None: never)
+    cursors = config.setdefault("sync_cursors", {})
+    data_file = os.path.abspath(tracker.json_file)
+    cursor = cursors.get(data_file)
+    if cursor is None:
+        changes = tracker.projects
+    elif tracker.changed_locally or data_file in config.get("sync_pending", []):
+        changes = unsynced_changes(tracker.projects)
+    else:
+        # Nothing was changed offline: no need to read the local history at all
+        changes = []
+    
+    from .outbox import Outbox, MAX_OPS
+    queue = Outbox(OUTBOX_FILE)
+    ops = queue.pending()[:MAX_OPS]
+    body = {"cursor": cursor, "changes": changes}
+    if ops:
+        body["ops"] = [{k: v for k, v in op.items() if k != "local"} for op in ops]
+    
+    import requests
+    try:
+        response = client.post(config, "/api/ops" if ops else "/api/v2/sync", body, compress=True, retry=retry)
+        
+        if response.status_code == 404:
+            if ops:
+                # The server predates queued operations: send them as local changes instead
+                apply_ops_locally(config, tracker, queue, ops)
+                return sync_with_server(config, tracker, project_name, retry)
+            # The server predates delta sync
+            return sync_with_server_v1(config, tracker)
+        elif response.status_code == 200:
+            data = response.json()
+            if data["full"]:
+                tracker.projects = data["projects"]
+                tracker.save_data()
+            else:
+                # Only the changed sessions are written, appended to the data file's journal
+                tracker.apply_server_changes(data["projects"], data["deleted_projects"])
+            cursors[data_file] = data["cursor"]
+            tracker.changed_locally = False
+            if data_file in config.get("sync_pending", []):
+                config["sync_pending"].remove(data_file)
+            save_config(config)
+            if ops:
+                queue.discard(op["key"] for op in ops)
+                print_op_results(data.get("results", []))
+            print("Data synced with server.")
+            return True
+        else:
+            error = response.json().get("error", "Unknown error")
+            print(f"Sync failed: {error}")
+            return False
+    except requests.exceptions.RequestException as e:
+        print(f"Error connecting to server: {e}")
+        print("Working in offline mode. Changes will only be saved locally.")
+        return False
+
+def sync_with_server_v1(config, tracker):
+    """Sync data with a server that only supports full uploads"""
+    import requests
+    # Version of the server data last received into this data file
+    etags = config.setdefault("sync_etags", {})
+    data_file = os.path.abspath(tracker.json_file)
     try:
-        headers = {"Authorization": f"Bearer {config['token']}"}
+        headers = {}
+        if etags.get(data_file):
+            # Lets the server skip sending its data back if it has not changed since the last sync
+            headers["If-None-Match"] = etags[data_file]
         
         # Sync data by sending local data and receiving server data
-        response = requests.post(
-            f"{config['server_url']}/api/sync",
-            headers=headers,
-            json={"projects": tracker.projects},
-            timeout=5
-        )
+        response = client.post(config, "/api/sync", {"projects": tracker.projects}, compress=True, headers=headers)
         
-        if response.status_code == 200:
-            data = response.json()
-            # Get server data
-            server_data = data["data"]
-            
-            # TODO: Update local data with merged result
-            # For now we just show a message
+        if response.status_code == 304:
+            print("Data already in sync with server.")
+            return True
+        elif response.status_code == 200:
+            if response.headers.get("ETag") != etags.get(data_file):
+                etags[data_file] = response.headers.get("ETag")
+                save_config(config)
+            # The server sends back every project merged with ours; its copy of a session wins
+            tracker.apply_server_changes(response.json()["data"]["projects"])
             print("Data synced with server.")
             return True
         else:
@@ -148,44 +249,202 @@ def sync_with_server(config, tracker, project_name=None):
         print("Working in offline mode. Changes will only be saved locally.")
         return False
 
-def toggle_project_tracking(config, tracker, project_name, comment=None):
-    """Toggle project tracking, using the API if available, or local file otherwise"""
-    # Try to use the API if authenticated
+def apply_ops_locally(config, tracker, queue, ops):
+    """Record queued operations in the local data, to be sent by a sync, and drop them from the outbox"""
+    for op in ops:
+        # Toggles queued while offline were recorded locally already
+        if not op.get("local"):
+            tracker.add_or_update_project(op["project_name"], op["comment"], at=op["at"])
+    queue.discard(op["key"] for op in ops)
+    mark_sync_pending(config, tracker)
+
+def print_op_results(results):
+    """Print what the server did with the queued operations it was sent"""
+    for result in results:
+        if result["status"] == "applied":
+            session = result["session"]
+            if session["end"] is None:
+                print(f"Started time tracking for '{result['project_name']}' at {session['start']}")
+            else:
+                print(f"Stopped time tracking for '{result['project_name']}' at {session['end']}")
+        elif result["status"] == "error":
+            print(f"The server rejected a queued operation: {result['error']}")
+
+def mark_sync_pending(config, tracker):
+    """Remember that a data file was changed offline and must send its changes on the next sync"""
+    data_file = os.path.abspath(tracker.json_file)
+    pending = config.setdefault("sync_pending", [])
+    if data_file in config.get("sync_cursors", {}) and data_file not in pending:
+        pending.append(data_file)
+        save_config(config)
+
+def toggle_project_tracking(config, tracker, project_name, comment=None, send=True):
+    """Toggle project tracking, through the server if authenticated, or in the local file otherwise
+
+    The toggle is queued in the outbox first and sent with a sync, in one
+    request. If that fails it is also recorded locally, and stays queued to be
+    sent by the next command that syncs. With ``send=False`` (the agent, which
+    syncs in the background) it is queued and recorded locally straight away.
+    """
+    at = None
+    if config["token"]:
+        from .outbox import Outbox
+        queue = Outbox(OUTBOX_FILE)
+        op = queue.append("toggle", project_name=project_name, comment=comment or "",
+                          at=tracker.current_timestamp(), local=not send)
+        if send:
+            # No retries: if the server cannot be reached the toggle stays queued, so fail fast
+            if sync_with_server(config, tracker, retry=False):
+                return True
+            if op["key"] not in {entry["key"] for entry in queue.pending()}:
+                # Already recorded locally, for a server that does not take queued operations
+                return False
+            print("The toggle will be sent to the server on the next sync.")
+            queue.update(op["key"], local=True)
+        comment, at = op["comment"], op["at"]
+    
+    # Fall back to local mode if the server cannot be reached or not authenticated
+    tracker.add_or_update_project(project_name, comment, at=at)
+    mark_sync_pending(config, tracker)
+    # Print status based on project state
+    project = tracker.get_project(project_name)
+    last_session = project['sessions'][-1]
+    if last_session['end'] is None:
+        print(f"Started time tracking for '{project_name}'")
+    else:
+        print(f"Stopped time tracking for '{project_name}'")
+    return True
+
+def read_entries_file(path):
+    """Read manual entries from a JSON array or an NDJSON file ("-" for stdin)"""
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, "r") as f:
+            text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return manual_entries.read_ndjson(text.splitlines())
+    entries = data.get("entries") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        # A single-line NDJSON file
+        entries = [data]
+    return entries
+
+def print_import_results(results):
+    """Print a summary of the per-entry results of an import"""
+    added = sum(1 for r in results if r["status"] == "added")
+    duplicates = sum(1 for r in results if r["status"] == "duplicate")
+    for result in results:
+        if result["status"] == "error":
+            print(f"Entry {result['index']}: {result['error']}")
+    print(f"Imported {added} entries, skipped {duplicates} duplicates.")
+
+def import_entries(config, tracker, path, project_name=None):
+    """Add the manual entries of a file in one batch, on the server if possible
+
+    ``project_name`` is used for entries that do not name a project.
+    """
+    try:
+        entries = read_entries_file(path)
+    except (IOError, ValueError) as e:
+        print(f"Could not read entries: {e}")
+        return False
+    if project_name:
+        for entry in entries:
+            if isinstance(entry, dict):
+                entry.setdefault("project", project_name)
+    
     if config["token"]:
+        import requests
         try:
-            headers = {"Authorization": f"Bearer {config['token']}"}
-            data = {"comment": comment} if comment else {}
-            
-            response = requests.post(
-                f"{config['server_url']}/api/projects/{project_name}/toggle",
-                headers=headers,
-                json=data,
-                timeout=5
+            response = client.post(
+                config, "/api/entries",
+                {"entries": [e if isinstance(e, dict) else None for e in entries]},
+                compress=True, read_timeout=30
             )
-            
             if response.status_code == 200:
-                data = response.json()
-                print(data["message"])
-                # Update local data by syncing
+                results = response.json()["results"]
+                for result, entry in zip(results, entries):
+                    if isinstance(entry, ValueError):
+                        result["error"] = str(entry)
+                print_import_results(results)
+                # Bring the imported sessions into the local data
                 sync_with_server(config, tracker)
                 return True
-            else:
+            elif response.status_code != 404:
                 error = response.json().get("error", "Unknown error")
                 print(f"API error: {error}")
-                print("Falling back to local mode...")
+                return False
         except requests.exceptions.RequestException as e:
             print(f"Error connecting to server: {e}")
-            print("Falling back to local mode...")
+        print("Importing into local data...")
     
-    # Fall back to local mode if API fails or not authenticated
-    tracker.add_or_update_project(project_name, comment)
-    # Print status based on project state
-    project = tracker.get_project(project_name)
-    last_session = project['sessions'][-1]
-    if last_session['end'] is None:
-        print(f"Started time tracking for '{project_name}'")
+    results = manual_entries.ingest(tracker, entries)
+    if any(r["status"] == "added" for r in results):
+        mark_sync_pending(config, tracker)
+    print_import_results(results)
+    return True
+
+def export_sessions(tracker, export_format, project_name=None, since=None, until=None, out=None):
+    """Write the local sessions to ``out`` (stdout by default), one line at a time"""
+    out = out or sys.stdout
+    _, encode = export.FORMATS[export_format]
+    for line in encode(export.session_records(tracker.projects, since, until, project_name)):
+        out.write(line)
+    out.flush()
+
+def print_status(tracker, project_name=None):
+    """Print the running session of a project, or of every project, from the local data only"""
+    now = datetime.now()
+    running = [
+        (project["project_name"], project["sessions"][-1])
+        for project in tracker.projects
+        if project["sessions"] and project["sessions"][-1]["end"] is None
+        and project_name in (None, project["project_name"])
+    ]
+    if not running:
+        print(f"'{project_name}' is not being tracked" if project_name else "No project is being tracked")
+    for name, session in running:
+        minutes = int((now - parse_timestamp(session["start"])).total_seconds() // 60)
+        print(f"'{name}' running since {session['start']} ({minutes // 60}:{minutes % 60:02d})")
+
+def parse_date(value):
+    """argparse type for YYYY-MM-DD dates"""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD")
+
+def run_through_agent(args):
+    """Hand toggles, status and syncs to a running agent; returns True if it ran the command
+
+    Other commands run in this process, once the agent has written the
+    changes it holds.
+    """
+    from . import agent
+    path = os.path.abspath(append_filename_to_path(args.path))
+    if args.status:
+        payload = {"cmd": "status", "project": args.project}
+    elif args.sync:
+        payload = {"cmd": "sync", "project": args.project}
+    elif args.project and not (args.report or args.daily_report or args.plot or args.import_file or args.export):
+        payload = {"cmd": "toggle", "project": args.project, "comment": args.comment}
     else:
-        print(f"Stopped time tracking for '{project_name}'")
+        agent.request(AGENT_SOCKET, {"cmd": "flush"})
+        return False
+    payload["path"] = path
+    response = agent.request(AGENT_SOCKET, payload)
+    if response and "prompt" in response:
+        payload["comment"] = input(response["prompt"])
+        response = agent.request(AGENT_SOCKET, payload)
+    if not response:
+        return False  # No agent after all: run the command here
+    if not response["ok"]:
+        print(f"Error: {response.get('error')}")
+        return True
+    print(response["output"], end="")
     return True
 
 def main():
@@ -226,6 +485,12 @@ def main():
         help="Comment for creating or closing a time entry",
         type=str
     )
+    parser.add_argument(
+        "-s",
+        "--status",
+        help="Show the running session of the project, or of every project, without changing it",
+        action="store_true"
+    )
     parser.add_argument(
         "--login",
         help="Authenticate with the time tracking server",
@@ -241,6 +506,39 @@ def main():
         help="Sync data with the server",
         action="store_true"
     )
+    parser.add_argument(
+        "--import",
+        dest="import_file",
+        metavar="FILE",
+        help="Add the manual entries of a JSON or NDJSON file (- for stdin); "
+             "the project argument names the project of entries without one",
+        type=str
+    )
+    parser.add_argument(
+        "--export",
+        help="Write every session (or the project's) to stdout, one per line",
+        choices=sorted(export.FORMATS),
+    )
+    parser.add_argument(
+        "--from",
+        dest="since",
+        metavar="YYYY-MM-DD",
+        help="With --export, only sessions from this date",
+        type=parse_date
+    )
+    parser.add_argument(
+        "--to",
+        dest="until",
+        metavar="YYYY-MM-DD",
+        help="With --export, only sessions up to this date",
+        type=parse_date
+    )
+    parser.add_argument(
+        "--daemon",
+        help="Run a local agent that keeps the data loaded and syncs in the background; "
+             "toggles, --status and --sync then go through it",
+        action="store_true"
+    )
     
     args = parser.parse_args()
     
@@ -250,6 +548,10 @@ def main():
     # Handle server URL setting
     if args.set_server:
         config["server_url"] = args.set_server
+        # Sync positions and versions belong to the previous server
+        config.pop("sync_cursors", None)
+        config.pop("sync_pending", None)
+        config.pop("sync_etags", None)
         save_config(config)
         print(f"Server URL set to {args.set_server}")
         return
@@ -259,9 +561,25 @@ def main():
         authenticate(config)
         return
     
+    # Run the local agent
+    if args.daemon:
+        from . import agent
+        print(f"presis agent listening on {AGENT_SOCKET}")
+        if not agent.serve(AGENT_SOCKET, sync_interval=config.get("agent_sync_interval", 300)):
+            print("An agent is already running.")
+        return
+    
+    if not is_valid_path(args.path):
+        print("Path not valid")
+        return
+    
+    # A running agent holds the data and the server connection
+    if os.path.exists(AGENT_SOCKET) and run_through_agent(args):
+        return
+    
     # Prepare the tracker
     if is_valid_path(args.path):
-        path = create_data_file(args.path)
+        path = create_data_file(args.path, config)
         tracker = TimeTracker(path)
     else:
         print("Path not valid")
@@ -275,10 +593,25 @@ def main():
             sync_with_server(config, tracker)
         return
     
+    # Handle bulk import
+    if args.import_file:
+        import_entries(config, tracker, args.import_file, args.project)
+        return
+    
+    # Handle export
+    if args.export:
+        export_sessions(tracker, args.export, args.project, args.since, args.until)
+        return
+    
+    # Handle status, which only reads the local data
+    if args.status:
+        print_status(tracker, args.project)
+        return
+    
     # Require project for other operations
     if not args.project:
         parser.print_help()
-        print("\nError: project name is required unless using --login, --set-server, or --sync")
+        print("\nError: project name is required unless using --login, --set-server, --sync, --status, --import or --export")
         return
     
     # Execute the command based on arguments
@@ -287,6 +620,7 @@ def main():
     elif args.daily_report or args.plot:
         tracker.print_daily_report(args.project)
         if args.plot:
+            from .timesheet_plotter import TimesheetPlotter
             plotter = TimesheetPlotter(tracker, args.project)
             plotter.plot_daily_totals()
     else:
@@ -0,0 +1,248 @@
+"""
+Local agent (``presis --daemon``): keeps data files, config and the server connection warm.
+
+The agent listens on a Unix socket, by default ~/.presis/agent.sock. Each
+request and response is one JSON object on one line::
+
+    {"cmd": "toggle", "path": "/abs/data.json", "project": "alpha", "comment": "x"}
+    {"ok": true, "output": "Started time tracking for 'alpha'\\n"}
+
+Commands: ``toggle``, ``status``, ``sync``, ``flush``, ``ping`` and ``stop``.
+``output`` is what the command would have printed; a toggle that needs a
+comment answers ``{"ok": false, "prompt": ...}`` instead, to be sent again
+with one.
+
+Data files are loaded once and reloaded only when they change on disk.
+Changes are written at most every ``flush_delay`` seconds, and when the
+agent stops. Toggles made with a token are queued in the outbox and
+recorded locally straight away; the agent sends them, and pulls changes
+from the server, in the background.
+"""
+import os
+import io
+import json
+import time
+import socket
+import contextlib
+
+# Longest a request may take to read or answer, in the CLI
+CLIENT_TIMEOUT = 5
+
+
+def request(socket_path, payload, timeout=CLIENT_TIMEOUT):
+    """Send a request to the agent listening on ``socket_path``; returns its response, or None if none answers"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(payload).encode() + b"\n")
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+        return json.loads(line) if line else None
+    except (OSError, ValueError, AttributeError):
+        # No agent, a stale socket, or no Unix sockets on this platform
+        return None
+
+
+class Agent:
+    """State and request handling of the agent; see serve() for the socket server."""
+
+    def __init__(self, flush_delay=1.0, sync_interval=300):
+        import threading
+        self.flush_delay = flush_delay
+        # Seconds between background syncs, when logged in (0 disables them)
+        self.sync_interval = sync_interval
+        self.trackers = {}  # data file -> [tracker, version of the file when last read or written]
+        self.config = None
+        self.config_mtime = None
+        # Held while a request or the background thread works on the trackers and config
+        self.lock = threading.RLock()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.flush_at = None  # When dirty trackers are written
+        self.sync_at = time.monotonic() + sync_interval if sync_interval else None
+        self.to_sync = set()  # Data files toggled since the last sync
+
+    def get_config(self):
+        """The CLI config, re-read only if the file changed (after --login or --set-server, say)"""
+        import presis
+        try:
+            mtime = os.stat(presis.CONFIG_FILE).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self.config is None or mtime != self.config_mtime:
+            self.config = presis.get_config()
+            self.config_mtime = mtime
+        return self.config
+
+    def get_tracker(self, path):
+        """The tracker of a data file, reloaded if something else changed the file"""
+        from presis.time_tracker import TimeTracker
+        entry = self.trackers.get(path)
+        if entry is not None and (entry[0].dirty or entry[0].current_version() == entry[1]):
+            return entry[0]
+        tracker = TimeTracker(path, autoflush=False)
+        self.trackers[path] = [tracker, tracker.current_version()]
+        return tracker
+
+    def _settle(self, path):
+        """After a command: schedule the write of its changes, or note the version it left on disk"""
+        entry = self.trackers[path]
+        if entry[0].dirty:
+            if self.flush_at is None:
+                self.flush_at = time.monotonic() + self.flush_delay
+                self.wake.set()
+        else:
+            entry[1] = entry[0].current_version()
+        # Config may have been saved by the command
+        try:
+            self.config_mtime = os.stat(__import__("presis").CONFIG_FILE).st_mtime_ns
+        except OSError:
+            pass
+
+    def flush(self):
+        """Write every tracker with unsaved changes"""
+        with self.lock:
+            for path, entry in self.trackers.items():
+                if entry[0].dirty:
+                    entry[0].flush()
+                    entry[1] = entry[0].current_version()
+            self.flush_at = None
+
+    def sync(self):
+        """Sync every data file that was synced or toggled before, sending queued operations"""
+        import presis
+        with self.lock:
+            config = self.get_config()
+            if config.get("token"):
+                for path in list(self.trackers):
+                    if path in config.get("sync_cursors", {}) or path in self.to_sync:
+                        if presis.sync_with_server(config, self.get_tracker(path)):
+                            self.to_sync.discard(path)
+                        self._settle(path)
+            self.sync_at = time.monotonic() + self.sync_interval if self.sync_interval else None
+
+    def sync_soon(self, path):
+        """Have the background thread sync a data file now, e.g. to send a queued toggle"""
+        self.to_sync.add(path)
+        self.sync_at = time.monotonic()
+        self.wake.set()
+
+    def handle(self, payload):
+        """Run one request; returns the response"""
+        import presis
+        command = payload.get("cmd") if isinstance(payload, dict) else None
+        if command == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if command == "flush":
+            self.flush()
+            return {"ok": True}
+        if command == "stop":
+            self.stopping = True
+            self.wake.set()
+            return {"ok": True}
+        if command not in ("toggle", "status", "sync"):
+            return {"ok": False, "error": f"Unknown command: {command}"}
+        path = payload.get("path")
+        if not isinstance(path, str) or not os.path.isabs(path):
+            return {"ok": False, "error": "path must be the absolute path of a data file"}
+
+        output = io.StringIO()
+        with self.lock, contextlib.redirect_stdout(output):
+            config = self.get_config()
+            presis.create_data_file(path, config)
+            tracker = self.get_tracker(path)
+            project_name = payload.get("project")
+            if command == "toggle":
+                comment = payload.get("comment")
+                if comment is None and not config["token"]:
+                    project = tracker.get_project(project_name)
+                    running = project and project["sessions"] and project["sessions"][-1]["end"] is None
+                    prompt = ("Enter a closing comment for this session: " if running
+                              else "Enter a comment for this new session: ")
+                    return {"ok": False, "prompt": prompt}
+                presis.toggle_project_tracking(config, tracker, project_name, comment, send=False)
+                if config["token"]:
+                    self.sync_soon(path)
+            elif command == "status":
+                presis.print_status(tracker, project_name)
+            else:
+                presis.sync_with_server(config, tracker, project_name)
+            self._settle(path)
+        return {"ok": True, "output": output.getvalue()}
+
+    def run_background(self):
+        """Write coalesced changes and sync when they are due, until the agent stops"""
+        while not self.stopping:
+            deadlines = [t for t in (self.flush_at, self.sync_at) if t is not None]
+            self.wake.wait(max(0, min(deadlines) - time.monotonic()) if deadlines else None)
+            self.wake.clear()
+            now = time.monotonic()
+            if self.flush_at is not None and now >= self.flush_at:
+                self.flush()
+            if self.sync_at is not None and now >= self.sync_at:
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"Background sync failed: {e}")
+                    self.sync_at = now + self.sync_interval if self.sync_interval else None
+
+
+def serve(socket_path, flush_delay=1.0, sync_interval=300, ready=None):
+    """Run an agent on ``socket_path`` until it is stopped; returns False if one is running already.
+
+    ``ready``, a threading.Event, is set once requests are accepted.
+    """
+    import signal
+    import threading
+    import socketserver
+
+    if request(socket_path, {"cmd": "ping"}, timeout=1):
+        return False
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # Left behind by an agent that did not stop cleanly
+    os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+    agent = Agent(flush_delay, sync_interval)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    response = agent.handle(json.loads(line))
+                except ValueError:
+                    response = {"ok": False, "error": "Requests must be JSON objects, one per line"}
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+                if agent.stopping:
+                    threading.Thread(target=server.shutdown).start()
+                    return
+
+    # Only this user may talk to the agent
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(socket_path, Handler)
+    finally:
+        os.umask(umask)
+    background = threading.Thread(target=agent.run_background, daemon=True)
+    background.start()
+    if threading.current_thread() is threading.main_thread():
+        def stop(signum, frame):
+            agent.stopping = True
+            agent.wake.set()
+            threading.Thread(target=server.shutdown).start()
+        signal.signal(signal.SIGTERM, stop)
+    if ready is not None:
+        ready.set()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.stopping = True
+        agent.wake.set()
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        agent.flush()
+    return True
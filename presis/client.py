@@ -0,0 +1,76 @@
+"""
+HTTP client of the CLI: one pooled session per process, with retries and gzip.
+
+Requests to the server reuse a keep-alive connection, are retried with
+exponential backoff when the connection fails or the server answers 502,
+503 or 504, and large JSON bodies are sent gzipped (responses are
+decompressed by requests). Every endpoint the CLI posts to can safely be
+retried: sessions are merged by their start and queued operations carry
+idempotency keys.
+
+Settings come from ``~/.presis/config.json``, with these defaults::
+
+    "connect_timeout": 3.05,  seconds to open a connection
+    "read_timeout": 10,       seconds to wait for each part of a response
+    "retries": 3,             retries after the first attempt
+    "retry_backoff": 0.3      retries wait 0.3s, 0.6s, 1.2s...
+"""
+import json
+
+DEFAULTS = {"connect_timeout": 3.05, "read_timeout": 10, "retries": 3, "retry_backoff": 0.3}
+
+# Bodies smaller than this are sent uncompressed
+GZIP_MIN_SIZE = 1024
+
+_sessions = {}  # retry -> requests session
+
+
+def settings(config):
+    """The client settings of a config, with defaults for those it does not set"""
+    return {name: config.get(name, default) for name, default in DEFAULTS.items()}
+
+
+def get_session(config, retry=True):
+    """The requests session of this process, with or without retries, created on first use"""
+    if retry not in _sessions:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        options = settings(config)
+        retries = Retry(
+            total=options["retries"] if retry else 0,
+            backoff_factor=options["retry_backoff"],
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,  # POST too
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retries)
+        session = _sessions[retry] = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return _sessions[retry]
+
+
+def post(config, path, body, compress=False, headers=None, read_timeout=None, retry=True):
+    """POST a JSON body to the server of a config, authenticated with its token if it has one.
+
+    With ``compress``, bodies of at least GZIP_MIN_SIZE bytes are gzipped.
+    ``read_timeout`` overrides the configured one for slow requests, and
+    ``retry=False`` makes a single attempt, for requests that can fail fast.
+    Raises requests.exceptions.RequestException if the server cannot be reached.
+    """
+    data = json.dumps(body).encode()
+    headers = {"Content-Type": "application/json", **(headers or {})}
+    if config.get("token"):
+        headers["Authorization"] = f"Bearer {config['token']}"
+    if compress and len(data) >= GZIP_MIN_SIZE:
+        import gzip
+        data = gzip.compress(data, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    options = settings(config)
+    return get_session(config, retry).post(
+        f"{config['server_url']}{path}",
+        data=data,
+        headers=headers,
+        timeout=(options["connect_timeout"], read_timeout or options["read_timeout"]),
+    )
@@ -0,0 +1,67 @@
+"""
+Session export, one session per line as NDJSON or CSV.
+
+Records are produced and encoded one at a time, so an export never holds
+more than one encoded line on top of the timesheet itself.
+"""
+import io
+import csv
+import json
+from datetime import datetime
+
+from presis.timesheet_queries import session_interval, _window
+
+EXPORT_COLUMNS = ("project", "start", "end", "duration_seconds", "comment", "closing_comment")
+
+
+def session_records(projects, since=None, until=None, project_name=None, now=None):
+    """Yield an export record for each session overlapping the [since, until] dates.
+
+    Projects are exported by name, sessions in their stored order. Timestamps
+    are ISO 8601; running sessions have no end and last until ``now``.
+    """
+    window = _window(since, until)
+    now = now or datetime.now()
+    for project in sorted(projects, key=lambda p: p["project_name"]):
+        if project_name is not None and project["project_name"] != project_name:
+            continue
+        for session in project.get("sessions", []):
+            start, end = session_interval(session, now)
+            if window is not None and (end < window[0] or start >= window[1]):
+                continue
+            yield {
+                "project": project["project_name"],
+                "start": start.isoformat(),
+                "end": end.isoformat() if session.get("end") else None,
+                "duration_seconds": round((end - start).total_seconds()),
+                "comment": session.get("comment") or "",
+                "closing_comment": session.get("closing_comment") or "",
+            }
+
+
+def iter_ndjson(records):
+    """Encode records as NDJSON lines"""
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+
+def iter_csv(records):
+    """Encode records as CSV lines, starting with a header"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for record in records:
+        writer.writerow([record[column] for column in EXPORT_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # No records: just the header
+        yield buffer.getvalue()
+
+
+# Export format -> (mimetype, encoder)
+FORMATS = {
+    "ndjson": ("application/x-ndjson", iter_ndjson),
+    "csv": ("text/csv", iter_csv),
+}
@@ -0,0 +1,49 @@
+import bisect
+import hashlib
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to nodes.
+
+    Each node is placed on the ring at many points, so keys spread evenly and
+    adding a node only moves the keys that now fall on its points, about
+    1/n of them, instead of reshuffling everything.
+    """
+
+    def __init__(self, nodes=(), points_per_node=160):
+        self.points_per_node = points_per_node
+        self._points = []  # Sorted hash points
+        self._nodes = {}  # Hash point -> node
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    @property
+    def nodes(self):
+        return sorted(set(self._nodes.values()))
+
+    def add_node(self, node):
+        """Place a node on the ring."""
+        for i in range(self.points_per_node):
+            point = self._hash(f"{node}#{i}")
+            if point not in self._nodes:
+                bisect.insort(self._points, point)
+            self._nodes[point] = node
+
+    def remove_node(self, node):
+        """Take a node off the ring; its keys move to the next nodes along."""
+        for i in range(self.points_per_node):
+            point = self._hash(f"{node}#{i}")
+            if self._nodes.get(point) == node:
+                del self._nodes[point]
+                self._points.remove(point)
+
+    def get_node(self, key):
+        """Return the node owning a key."""
+        if not self._points:
+            raise ValueError("The hash ring has no nodes")
+        index = bisect.bisect(self._points, self._hash(str(key))) % len(self._points)
+        return self._nodes[self._points[index]]
@@ -0,0 +1,112 @@
+import json
+from datetime import datetime
+
+from presis.timesheet_queries import TIMESTAMP_FORMAT
+
+# Most entries accepted by one bulk request
+MAX_ENTRIES = 10000
+
+
+def parse_entry(entry):
+    """Validate a manual entry and return ``(project_name, session)``; raises ValueError.
+
+    Entries use the fields of the manual-entry API: ``project``, ``start_date``
+    and ``end_date`` (YYYY-MM-DD), ``start_time`` and ``end_time`` (HH:MM:SS),
+    and optional ``comment`` and ``closing_comment``.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError("Entry must be an object")
+    project_name = entry.get("project")
+    if not isinstance(project_name, str) or not project_name.strip():
+        raise ValueError("project is required")
+    missing = [field for field in ("start_date", "start_time", "end_date", "end_time") if not entry.get(field)]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    try:
+        start = datetime.strptime(f"{entry['start_date']} {entry['start_time']}", "%Y-%m-%d %H:%M:%S")
+        end = datetime.strptime(f"{entry['end_date']} {entry['end_time']}", "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        raise ValueError("Dates must be YYYY-MM-DD and times HH:MM:SS")
+    if end <= start:
+        raise ValueError("End must be after start")
+
+    session = {
+        "start": start.strftime(TIMESTAMP_FORMAT),
+        "end": end.strftime(TIMESTAMP_FORMAT),
+        "comment": str(entry.get("comment") or ""),
+        "rev": None,
+    }
+    if entry.get("closing_comment"):
+        session["closing_comment"] = str(entry["closing_comment"])
+    return project_name, session
+
+
+def read_ndjson(lines):
+    """Decode NDJSON lines into entries, skipping blank lines.
+
+    A line that is not valid JSON becomes a ValueError in its place, so that
+    ingest() reports it without rejecting the rest of the batch.
+    """
+    entries = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        if not line.strip():
+            continue
+        if len(entries) == MAX_ENTRIES:
+            raise ValueError(f"At most {MAX_ENTRIES} entries can be added at once")
+        try:
+            entries.append(json.loads(line))
+        except ValueError as e:
+            entries.append(ValueError(f"Invalid JSON: {getattr(e, 'msg', e)}"))
+    return entries
+
+
+def add_sessions(projects, entries, dry_run=False):
+    """Add ``(project_name, session)`` pairs to projects, skipping sessions already present.
+
+    Returns "added" or "duplicate" for each entry. Safe to replay on fresher
+    data. With ``dry_run`` the projects are left untouched.
+    """
+    by_name = {p["project_name"]: p for p in projects}
+    existing = {}
+    statuses = []
+    for project_name, session in entries:
+        project = by_name.get(project_name)
+        if project_name not in existing:
+            sessions = project["sessions"] if project else []
+            existing[project_name] = {(s.get("start"), s.get("end")) for s in sessions}
+        key = (session["start"], session["end"])
+        if key in existing[project_name]:
+            statuses.append("duplicate")
+            continue
+        existing[project_name].add(key)
+        statuses.append("added")
+        if dry_run:
+            continue
+        if project is None:
+            project = by_name[project_name] = {"project_name": project_name, "sessions": []}
+            projects.append(project)
+        project["sessions"].append(dict(session))
+    return statuses
+
+
+def ingest(tracker, entries):
+    """Validate entries in one pass and add the valid ones in a single change.
+
+    Returns one result per entry: ``{"index", "status"}`` with status
+    "added", "duplicate" or "error" (plus "error" with the reason).
+    """
+    results = []
+    valid = []
+    for index, entry in enumerate(entries):
+        try:
+            if isinstance(entry, ValueError):
+                raise entry
+            valid.append((index, parse_entry(entry)))
+        except ValueError as e:
+            results.append({"index": index, "status": "error", "error": str(e)})
+    statuses = tracker.add_manual_sessions([parsed for _, parsed in valid]) if valid else []
+    results.extend({"index": index, "status": status} for (index, _), status in zip(valid, statuses))
+    results.sort(key=lambda result: result["index"])
+    return results
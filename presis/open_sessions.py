@@ -0,0 +1,113 @@
+"""
+Index of running sessions, kept by RedisTimeTracker on every timesheet write.
+
+    timesheet:user:{id}:active  hash of project name -> start of its running session,
+                                on the user's server
+    open_sessions               sorted set of "{user_id}:{project_name}" members
+                                scored by session start (epoch seconds), on the primary
+
+"What is this user tracking" is one HGETALL, and the sessions running since
+before some time are one ZRANGEBYSCORE, without loading any timesheet.
+
+Timesheets written before the index existed are only indexed by their next
+write. To index all of them, run once:
+
+    python -m presis.open_sessions
+"""
+import argparse
+
+from presis.redis_backend import RedisBackend
+from presis.timesheet_queries import parse_timestamp, running_sessions
+
+KEY = "open_sessions"
+
+
+def active_key(user_id):
+    """Key of a user's running sessions"""
+    return f"timesheet:user:{user_id}:active"
+
+
+def member(user_id, project_name):
+    return f"{user_id}:{project_name}"
+
+
+def parse_member(value):
+    """``(user_id, project_name)`` of an open_sessions member"""
+    user_id, _, project_name = value.partition(":")
+    return user_id, project_name
+
+
+def score(start):
+    """Sort score of a session start timestamp"""
+    return parse_timestamp(start).timestamp()
+
+
+def update_active(pipe, user_id, started, stopped):
+    """Queue the changes of a write to a user's running sessions, on a pipeline to the user's server.
+
+    ``started`` maps the projects now running to their session start,
+    ``stopped`` lists the projects that are not.
+    """
+    if started:
+        pipe.hset(active_key(user_id), mapping=started)
+    if stopped:
+        pipe.hdel(active_key(user_id), *stopped)
+
+
+def update_index(pipe, user_id, started, stopped):
+    """Queue the same changes to open_sessions, on a pipeline to the primary (see update_active)"""
+    if started:
+        pipe.zadd(KEY, {member(user_id, name): score(start) for name, start in started.items()})
+    if stopped:
+        pipe.zrem(KEY, *(member(user_id, name) for name in stopped))
+
+
+def open_before(backend, cutoff, limit=None):
+    """``(user_id, project_name, start)`` of the sessions running since before ``cutoff``, oldest first.
+
+    ``cutoff`` is a datetime; ``start`` is the epoch seconds of the session start.
+    """
+    entries = backend.r.zrangebyscore(
+        KEY, "-inf", f"({cutoff.timestamp()}", withscores=True,
+        **({"start": 0, "num": limit} if limit else {}))
+    return [(*parse_member(value), start) for value, start in entries]
+
+
+def count(backend):
+    """Number of running sessions across all users"""
+    return backend.r.zcard(KEY)
+
+
+def rebuild(backend, batch_size=500):
+    """Index the running sessions of every stored timesheet; returns how many were indexed.
+
+    Writes made while it runs index themselves, but one landing between the
+    read and the update of its user may be indexed as it was before.
+    """
+    indexed = 0
+    for node in backend.nodes():
+        user_ids = [
+            key.split(":")[2] for key in node.r.scan_iter(match="timesheet:user:*", count=batch_size)
+            if key.count(":") == 2
+        ]
+        for user_id in user_ids:
+            data = backend.decode_timesheet(node.raw.get(f"timesheet:user:{user_id}")) or {}
+            started = running_sessions(data.get("projects", []))
+            stale = set(node.r.hkeys(active_key(user_id))) - set(started)
+            with node.r.pipeline() as user_pipe, backend.r.pipeline(transaction=False) as global_pipe:
+                update_active(user_pipe, user_id, started, stale)
+                update_index(global_pipe, user_id, started, stale)
+                user_pipe.execute()
+                global_pipe.execute()
+            indexed += len(started)
+    return indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the running sessions of every stored timesheet")
+    parser.parse_args()
+    print(f"Indexed {rebuild(RedisBackend.from_env())} running sessions")
+
+
+if __name__ == "__main__":
+    main()
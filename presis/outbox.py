@@ -0,0 +1,130 @@
+"""
+Outbox: operations the CLI queues for the server and sends in batches (see /api/ops).
+
+An operation is appended to the outbox file as soon as it is made, whether
+or not the server can be reached, and leaves it once the server has
+answered for it. Each carries a unique ``key``: the server records the keys
+it has applied, so an operation sent again because the response to its
+batch was lost is reported as a duplicate instead of being applied twice.
+A toggle carries the time it was made (``at``) and is recorded at that
+time, however late it is sent.
+"""
+import os
+import json
+
+from presis.timesheet_queries import parse_timestamp
+
+# Kinds of operations the server applies
+OPERATIONS = ("toggle",)
+
+# Most operations sent in one batch
+MAX_OPS = 1000
+
+
+def parse_op(op):
+    """Validate an operation sent by a client; returns it normalized or raises ValueError."""
+    if not isinstance(op, dict):
+        raise ValueError("Operation must be an object")
+    key = op.get("key")
+    if not isinstance(key, str) or not 0 < len(key) <= 64:
+        raise ValueError("Operation needs a key of at most 64 characters")
+    if op.get("op") not in OPERATIONS:
+        raise ValueError(f"op must be one of: {', '.join(OPERATIONS)}")
+    project_name = op.get("project_name")
+    if not isinstance(project_name, str) or not project_name:
+        raise ValueError("Operation needs a project_name")
+    comment = op.get("comment") or ""
+    if not isinstance(comment, str):
+        raise ValueError("comment must be a string")
+    try:
+        parse_timestamp(op.get("at"))
+    except (TypeError, ValueError):
+        raise ValueError("at must be a timestamp like 31/01/25 - 09:00:00")
+    return {"key": key, "op": op["op"], "project_name": project_name, "comment": comment, "at": op["at"]}
+
+
+def toggle_session(projects, project_name, comment, timestamp):
+    """Start a session of a project at ``timestamp``, or stop its running one; returns that session.
+
+    The project is created if needed. Changed sessions get ``rev: None``.
+    """
+    project = next((p for p in projects if p["project_name"] == project_name), None)
+    if project is None:
+        project = {"project_name": project_name, "sessions": []}
+        projects.append(project)
+    last_session = project["sessions"][-1] if project["sessions"] else None
+    if last_session and last_session["end"] is None:
+        last_session["end"] = timestamp
+        last_session["closing_comment"] = comment
+        last_session["rev"] = None
+        return last_session
+    session = {"start": timestamp, "end": None, "comment": comment, "rev": None}
+    project["sessions"].append(session)
+    return session
+
+
+def apply_ops(projects, ops, applied_keys):
+    """Apply operations whose key is not in ``applied_keys``; returns their results in order.
+
+    Each result has the key, project_name and a status: "applied", with the
+    session it started or stopped, or "duplicate".
+    """
+    results = []
+    seen = set(applied_keys)
+    for op in ops:
+        result = {"key": op["key"], "project_name": op["project_name"], "status": "duplicate"}
+        if op["key"] not in seen:
+            seen.add(op["key"])
+            session = toggle_session(projects, op["project_name"], op["comment"], op["at"])
+            result.update(status="applied", session=dict(session))
+        results.append(result)
+    return results
+
+
+class Outbox:
+    """Operations waiting to be sent, one JSON object per line of a file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, op, **fields):
+        """Queue an operation with a new key; returns it."""
+        import uuid  # Not needed by the servers and local commands that import this module
+        entry = dict(fields, op=op, key=uuid.uuid4().hex)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # A single short append, so a crash cannot leave other entries damaged
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def pending(self):
+        """The queued operations, oldest first."""
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # Cut short by a crash while it was being appended
+        return entries
+
+    def update(self, key, **fields):
+        """Change the fields of a queued operation."""
+        self._rewrite([dict(entry, **fields) if entry["key"] == key else entry for entry in self.pending()])
+
+    def discard(self, keys):
+        """Remove operations the server has answered for."""
+        keys = set(keys)
+        self._rewrite([entry for entry in self.pending() if entry["key"] not in keys])
+
+    def _rewrite(self, entries):
+        if not entries:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        os.replace(tmp_path, self.path)
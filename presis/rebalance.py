@@ -0,0 +1,87 @@
+"""
+Move per-user keys to the shard that owns them after the shard list changed.
+
+Add the new server to REDIS_SHARDS, then run:
+
+    python -m presis.rebalance --dry-run
+    python -m presis.rebalance
+
+Only the users whose position on the hash ring moved to the new server are
+copied (DUMP/RESTORE, keeping any TTL) and then deleted from their old server.
+Writes to a user being moved can be lost, so run it while the app is drained.
+"""
+import argparse
+from collections import Counter
+
+from presis.redis_backend import RedisBackend
+
+# Per-user keys and the position of the user ID in them
+USER_KEY_PATTERNS = (("user:*", 1), ("timesheet:user:*", 2))
+
+
+def misplaced_keys(backend, batch_size=500):
+    """Yield ``(key, source, target)`` for every per-user key not on its owner."""
+    for node in backend.nodes():
+        for pattern, id_position in USER_KEY_PATTERNS:
+            for key in node.r.scan_iter(match=pattern, count=batch_size):
+                user_id = key.split(":")[id_position]
+                if not user_id.isdigit():
+                    continue
+                target = backend.shard_for_user(user_id)
+                # Never "move" a key onto the server it is on: the DELETE would lose it
+                if not target.same_server(node):
+                    yield key, node, target
+
+
+def rebalance(backend, dry_run=False, batch_size=500):
+    """Move misplaced per-user keys to their owner; returns the count per (source, target)."""
+    moved = Counter()
+    pending = []
+
+    def move(batch):
+        with batch[0][1].raw.pipeline(transaction=False) as pipe:
+            for key, _, _ in batch:
+                pipe.dump(key)
+                pipe.pttl(key)
+            dumped = pipe.execute()
+        for (key, source, target), value, ttl in zip(batch, dumped[::2], dumped[1::2]):
+            if value is None:
+                continue  # Deleted since the scan
+            target.raw.restore(key, max(ttl, 0), value, replace=True)
+            source.raw.delete(key)
+            moved[source.name, target.name] += 1
+
+    for key, source, target in misplaced_keys(backend, batch_size):
+        if dry_run:
+            moved[source.name, target.name] += 1
+            continue
+        if pending and pending[0][1] is not source:
+            move(pending)
+            pending = []
+        pending.append((key, source, target))
+        if len(pending) >= batch_size:
+            move(pending)
+            pending = []
+    if pending:
+        move(pending)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move per-user Redis keys to the shard that owns them")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the keys that would move")
+    args = parser.parse_args()
+
+    backend = RedisBackend.from_env()
+    if backend.ring is None:
+        parser.error("REDIS_SHARDS is not set: there is nothing to rebalance")
+
+    moved = rebalance(backend, dry_run=args.dry_run)
+    verb = "Would move" if args.dry_run else "Moved"
+    for (source, target), count in sorted(moved.items()):
+        print(f"{verb} {count} keys from {source} to {target}")
+    print(f"{verb} {sum(moved.values())} keys in total")
+
+
+if __name__ == "__main__":
+    main()
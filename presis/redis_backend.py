@@ -1,19 +1,231 @@
+import os
+import random
 import redis
 import uuid
 import json
+from collections import Counter
+from contextlib import contextmanager
 from datetime import timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+from presis.compression import compress_value, decompress_value
+from presis.hash_ring import HashRing
+
+LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+def server_address(connection_kwargs):
+    """``(host, port, db)`` or ``(socket path, db)`` of the server some connection arguments reach"""
+    db = int(connection_kwargs.get("db") or 0)
+    if connection_kwargs.get("path"):
+        return (connection_kwargs["path"], db)
+    host = str(connection_kwargs.get("host") or "localhost").lower()
+    return ("localhost" if host in LOOPBACK_HOSTS else host, int(connection_kwargs.get("port") or 6379), db)
+
+
+def url_name(url, url_kwargs):
+    """Name of the server a redis:// URL reaches, without the URL's credentials"""
+    scheme = url.split("://")[0]
+    if url_kwargs.get("path"):
+        return f"{scheme}://{url_kwargs['path']}?db={url_kwargs.get('db') or 0}"
+    return f"{scheme}://{url_kwargs.get('host') or 'localhost'}:{url_kwargs.get('port') or 6379}/{url_kwargs.get('db') or 0}"
+
+
+class RedisShard:
+    """Connections to one Redis server: a text client, and a binary one for timesheets."""
+
+    def __init__(self, name, **connection_kwargs):
+        # Stable and free of credentials: shards are placed on the hash ring by name
+        self.name = name
+        # The server connected to, to recognise one listed twice; None if unknown
+        self.address = server_address(connection_kwargs)
+        self.pool = redis.ConnectionPool(decode_responses=True, **connection_kwargs)
+        self.r = redis.StrictRedis(connection_pool=self.pool)
+        # Timesheets may be stored compressed, so they are read and written as bytes
+        self.raw_pool = redis.ConnectionPool(decode_responses=False, **connection_kwargs)
+        self.raw = redis.StrictRedis(connection_pool=self.raw_pool)
+        # Read-only copies of this server, see reader()
+        self.replicas = []
+
+    @classmethod
+    def from_spec(cls, spec, **pool_settings):
+        """Build a shard from a redis:// URL, optionally prefixed by "name=", or a dict of
+        connection arguments with a "name".
+
+        An unnamed URL is named after its host, port and db, without its credentials.
+        A dict may also list the specs of the shard's ``replicas``.
+        """
+        if isinstance(spec, str):
+            name, _, url = spec.partition("=") if "=" in spec.split("://")[0] else ("", "", spec)
+            url_kwargs = redis.connection.parse_url(url)
+            return cls(name or url_name(url, url_kwargs), **{**pool_settings, **url_kwargs})
+        spec = dict(spec)
+        replicas = [cls.from_spec(replica, **pool_settings) for replica in spec.pop("replicas", [])]
+        shard = cls(spec.pop("name"), **{**pool_settings, **spec})
+        if "host" not in spec and "path" not in spec:
+            # Custom connections, e.g. in tests, are only the same server as themselves
+            shard.address = None
+        shard.replicas = replicas
+        return shard
+
+    def same_server(self, other):
+        """Whether another shard connects to the same Redis server as this one"""
+        return self is other or (self.address is not None and self.address == other.address)
+
+    def reader(self):
+        """Return a replica to read from, or this server if it has none."""
+        return random.choice(self.replicas) if self.replicas else self
 
 class RedisBackend:
-    def __init__(self, host="localhost", port=6379, db=0, password=None):
-        self.r = redis.StrictRedis(host=host, port=port, db=db, password=password, decode_responses=True)
+    """Access to Redis through a connection pool owned by the backend.
+
+    Use ``RedisBackend.shared()`` or ``RedisBackend.from_env()`` rather than
+    creating a backend per screen or request, so that every part of a process
+    reuses the same pool of connections.
+
+    With ``shards``, the per-user keys (``user:{id}`` and ``timesheet:user:{id}*``)
+    are spread over several Redis servers by consistent hashing of the user ID,
+    while global keys such as indexes, invitations and counters stay on the
+    primary server given by ``host``/``port``/``db``.
+
+    With ``replicas``, reads that can tolerate replication lag may be sent to
+    read-only copies of the primary instead; see ``RedisShard.reader()``.
+    """
+
+    # Backends handed out by shared(), keyed by their connection settings
+    _shared = {}
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None,
+                 max_connections=50, socket_timeout=5, socket_connect_timeout=5,
+                 socket_keepalive=True, health_check_interval=30,
+                 compress_min_bytes=1024, shards=None, replicas=None, **connection_kwargs):
+        pool_settings = dict(
+            connection_kwargs,
+            max_connections=max_connections,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout,
+            socket_keepalive=socket_keepalive,
+            health_check_interval=health_check_interval,
+        )
+        self.primary = RedisShard(
+            f"redis://{host}:{port}/{db}", host=host, port=port, db=db, password=password, **pool_settings)
+        self.pool, self.r = self.primary.pool, self.primary.r
+        self.raw_pool, self.raw = self.primary.raw_pool, self.primary.raw
+        self.primary.replicas = [RedisShard.from_spec(spec, **pool_settings) for spec in replicas or []]
+        # Servers holding per-user keys, and the ring choosing between them
+        # A server listed more than once, e.g. the primary under another URL, gets one node
+        self.shards = {}
+        for spec in shards or []:
+            shard = RedisShard.from_spec(spec, **pool_settings)
+            same = [node for node in self.nodes() if node.address is not None and node.address == shard.address]
+            self.shards[shard.name] = same[0] if same else shard
+        self.ring = HashRing(self.shards) if self.shards else None
+        # Timesheets of at least this many bytes are compressed; 0 disables compression
+        self.compress_min_bytes = compress_min_bytes
+        # Counters for this process; conflicts and retries are also summed in Redis
+        self.stats = Counter()
+        # Optional read cache of decoded timesheets, see enable_timesheet_cache()
+        self.timesheet_cache = None
+
+    @classmethod
+    def shared(cls, **settings):
+        """Return the process-wide backend for these connection settings."""
+        key = repr(sorted(settings.items()))
+        if key not in cls._shared:
+            cls._shared[key] = cls(**settings)
+        return cls._shared[key]
+
+    def shard_for_user(self, user_id):
+        """Return the server holding the keys of a user."""
+        if self.ring is None:
+            return self.primary
+        return self.shards[self.ring.get_node(user_id)]
+
+    def nodes(self):
+        """Return every server: the primary and all shards."""
+        return [self.primary] + [shard for shard in self.shards.values() if shard is not self.primary]
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """Return the shared backend configured by the REDIS_* environment variables."""
+        environ = os.environ if environ is None else environ
+        return cls.shared(
+            host=environ.get('REDIS_HOST', 'localhost'),
+            port=int(environ.get('REDIS_PORT', 6379)),
+            db=int(environ.get('REDIS_DB', 0)),
+            password=environ.get('REDIS_PASSWORD') or None,
+            max_connections=int(environ.get('REDIS_MAX_CONNECTIONS', 50)),
+            socket_timeout=float(environ.get('REDIS_SOCKET_TIMEOUT', 5)),
+            socket_connect_timeout=float(environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 5)),
+            socket_keepalive=environ.get('REDIS_SOCKET_KEEPALIVE', 'true').lower() == 'true',
+            health_check_interval=int(environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30)),
+            compress_min_bytes=int(environ.get('TIMESHEET_COMPRESS_MIN_BYTES', 1024)),
+            shards=[url.strip() for url in environ.get('REDIS_SHARDS', '').split(',') if url.strip()],
+            replicas=[url.strip() for url in environ.get('REDIS_REPLICAS', '').split(',') if url.strip()],
+        )
+
+    def reset_after_fork(self):
+        """Drop the connections and counters inherited from a parent process.
+
+        Call it in each worker of a pre-forking server that created the backend
+        before forking, so that workers never share a socket with each other.
+        """
+        for node in self.nodes():
+            for shard in [node] + node.replicas:
+                shard.pool.reset()
+                shard.raw_pool.reset()
+        self.stats.clear()
+
+    def enable_timesheet_cache(self, maxsize=1024, ttl=60):
+        """Cache decoded timesheets in this process, invalidated through pub/sub."""
+        from presis.timesheet_cache import TimesheetCache
+        self.timesheet_cache = TimesheetCache(self, maxsize=maxsize, ttl=ttl)
+        return self.timesheet_cache
+
+    def encode_timesheet(self, data):
+        """Serialize timesheet data for storage, compressing it if it is large."""
+        payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        return compress_value(payload, self.compress_min_bytes)
+
+    def decode_timesheet(self, stored):
+        """Load timesheet data written by encode_timesheet(), or a legacy plain JSON value."""
+        if stored is None:
+            return None
+        return json.loads(decompress_value(stored))
+
+    def pipeline(self, transaction=False):
+        """Return a pipeline on the pool; use it as a context manager."""
+        return self.r.pipeline(transaction=transaction)
+
+    @contextmanager
+    def batch(self, transaction=False):
+        """Queue commands on a pipeline and send them in one round trip on exit."""
+        with self.r.pipeline(transaction=transaction) as pipe:
+            yield pipe
+            pipe.execute()
+
+    def record_conflict(self):
+        """Count an optimistic concurrency conflict on a timesheet write."""
+        self.stats["timesheet_conflicts"] += 1
+        self.r.hincrby("stats:timesheet", "conflicts", 1)
+
+    def record_retry(self):
+        """Count a timesheet write that was re-applied after a conflict."""
+        self.stats["timesheet_retries"] += 1
+        self.r.hincrby("stats:timesheet", "retries", 1)
+
+    def get_stats(self):
+        """Return the counters of this process along with the totals across all processes."""
+        totals = self.r.hgetall("stats:timesheet")
+        return {
+            "process": dict(self.stats),
+            "total": {name: int(value) for name, value in totals.items()},
+        }
 
     def create_user(self, username, password):
         """Create a new user with a unique ID and store a hashed password."""
         user_id = str(uuid.uuid4())
         hashed_password = generate_password_hash(password)
-        self.r.hset(f"user:{username}", "user_id", user_id)
-        self.r.hset(f"user:{username}", "password", hashed_password)
+        self.r.hset(f"user:{username}", mapping={"user_id": user_id, "password": hashed_password})
         return user_id
 
     def authenticate_user(self, username, password):
@@ -1,33 +1,339 @@
+import copy
 import json
+import redis
+import logging
 from datetime import datetime, timedelta
-from collections import defaultdict
 from presis.redis_backend import RedisBackend
+from presis.timesheet_queries import TimesheetQueries, running_sessions
+from presis.sync import merge_client_changes, changes_since
+from presis.manual_entries import add_sessions
+from presis.outbox import apply_ops, toggle_session
+from presis.timesheet_events import channel as events_channel
+from presis import open_sessions
+from presis.reports import DailyReport
 
-class RedisTimeTracker:
-    """Redis-based implementation of TimeTracker that stores data in Redis instead of the filesystem"""
-    
-    def __init__(self, user_id, redis_backend):
+logger = logging.getLogger(__name__)
+
+class TimesheetConflictError(Exception):
+    """Raised when a timesheet write cannot be applied because of concurrent writers"""
+
+
+class RedisTimeTracker(TimesheetQueries):
+    """Redis-based implementation of TimeTracker that stores data in Redis instead of the filesystem
+
+    Writes use optimistic concurrency control: every write bumps a generation
+    counter stored next to the timesheet, and is committed with WATCH/MULTI so
+    that a write based on stale data is rejected. Mutations are kept as
+    callables and re-applied on top of the fresh data when that happens, so
+    concurrent requests for the same user never clobber each other.
+    """
+
+    # How many times a write is re-applied before giving up
+    MAX_RETRIES = 10
+    # How long the keys of applied client operations are remembered, in seconds
+    OP_KEYS_TTL = 30 * 24 * 3600
+
+    def __init__(self, user_id, redis_backend, autoflush=True, min_version=0, replica_reads=False):
         self.user_id = user_id
         self.redis = redis_backend
+        # When False, mutations are only written by an explicit flush()
+        self.autoflush = autoflush
+        # Oldest version a cached read may return, e.g. the last one this client wrote
+        self.min_version = min_version
+        # When True, projects may be read from a replica that has caught up to min_version
+        self.replica_reads = replica_reads
+        # Binary client of the server holding this user's keys
+        self.shard = redis_backend.shard_for_user(user_id)
+        self.key = f"timesheet:user:{user_id}"
+        self.version_key = f"timesheet:user:{user_id}:version"
+        # Project name -> timesheet version at which that project last changed
+        self.project_versions_key = f"timesheet:user:{user_id}:project_versions"
+        # Key of each client operation applied (see presis.outbox) -> version that applied it
+        self.op_keys_key = f"timesheet:user:{user_id}:op_keys"
+        # Project name -> start of its running session (see presis.open_sessions)
+        self.active_key = open_sessions.active_key(user_id)
         self._projects = None  # Cache projects in memory
-        
+        self._version = None  # Generation the cached projects were read at
+        self._shared = False  # True while _projects is also held by the timesheet cache
+        self._pending = []  # [mutation, result, touched project names] not yet written to Redis
+        self._applied_ops = set()  # Keys of the operations applied by the pending mutations
+        self._events = []  # Events of the pending mutations, published with them (see presis.timesheet_events)
+
     @property
     def projects(self):
-        """Get all projects for this user from Redis"""
+        """Get all projects for this user from Redis, or from the timesheet cache"""
         if self._projects is None:
-            # Get all projects for this user
-            raw_data = self.redis.r.get(f"timesheet:user:{self.user_id}")
-            if raw_data:
-                data = json.loads(raw_data)
-                self._projects = data.get("projects", [])
-            else:
-                self._projects = []
+            cache = self.redis.timesheet_cache
+            entry = cache.get(self.user_id, self.min_version) if cache is not None else None
+            if entry:
+                self._version, self._projects = entry
+                self._shared = True
+            elif not self._read_replica():
+                raw_data, version = self.shard.raw.mget(self.key, self.version_key)
+                self._set_state(raw_data, version)
+                self._share()
         return self._projects
-        
+
+    def _read_replica(self):
+        """Load projects from a replica; False if replicas are off, behind or unreachable"""
+        if not self.replica_reads or not self.shard.replicas:
+            return False
+        stats = self.redis.stats
+        try:
+            raw_data, version = self.shard.reader().raw.mget(self.key, self.version_key)
+        except redis.RedisError as e:
+            logger.warning(f"Reading timesheet from replica failed, using the primary: {e}")
+            stats["replica_errors"] += 1
+            return False
+        if int(version or 0) < self.min_version:
+            # The replica has not received this client's last write yet
+            stats["replica_stale_reads"] += 1
+            return False
+        # Not offered to the timesheet cache: it could be older than an invalidation already received
+        self._set_state(raw_data, version)
+        stats["replica_reads"] += 1
+        return True
+
+    @property
+    def dirty(self):
+        """True if there are mutations that have not been written yet"""
+        return bool(self._pending)
+
+    @property
+    def version(self):
+        """Generation counter of the cached projects (0 if never written)"""
+        if self._projects is None:
+            self.projects
+        return self._version
+
+    def current_version(self, project_name=None):
+        """Version of the stored timesheet, or of one of its projects, without loading it
+
+        A project's version is the timesheet version at which it last changed,
+        or 0 if it has not changed since versions were recorded.
+        """
+        if project_name is None:
+            return int(self.shard.r.get(self.version_key) or 0)
+        return int(self.shard.r.hget(self.project_versions_key, project_name) or 0)
+
+    def current_versions(self):
+        """Versions of the projects, without loading the timesheet (see current_version)
+
+        Projects missing from the result have not changed since versions were recorded.
+        """
+        return {name: int(version) for name, version in self.shard.r.hgetall(self.project_versions_key).items()}
+
+    def _set_state(self, raw_data, version):
+        """Replace the cached projects with a freshly read value"""
+        data = self.redis.decode_timesheet(raw_data)
+        self._projects = data.get("projects", []) if data else []
+        self._version = int(version or 0)
+        self._shared = False
+
+    def _share(self):
+        """Offer the cached projects to the timesheet cache of this process"""
+        cache = self.redis.timesheet_cache
+        if cache is not None:
+            cache.put(self.user_id, self._version, self._projects)
+            self._shared = True
+
+    def _mutate(self, mutation, touches=None):
+        """Apply a mutation to the cached projects and persist it.
+
+        ``mutation`` receives the projects list, changes it in place and may
+        return a result. It must be safe to call again on fresher data, since
+        it is replayed if another writer commits first. ``touches`` names the
+        projects it may change (None for all of them). Unless autoflush is
+        off, the mutation is written straight away.
+        """
+        projects = self.projects
+        if self._shared:
+            # Copy on write: other requests may be reading the cached projects
+            projects = self._projects = copy.deepcopy(projects)
+            self._shared = False
+        entry = [mutation, mutation(projects), touches]
+        self._pending.append(entry)
+        if self.autoflush:
+            self.flush()
+        return entry[1]
+
+    def flush(self):
+        """Write pending mutations in one commit, re-applying them to fresh data on conflict"""
+        if not self._pending:
+            return
+        stats = self.redis.stats
+        with self.shard.raw.pipeline() as pipe:
+            for attempt in range(self.MAX_RETRIES + 1):
+                try:
+                    pipe.watch(self.key, self.version_key)
+                    if int(pipe.get(self.version_key) or 0) != self._version:
+                        # Someone else committed since we read: start over from
+                        # their data and replay our mutations on top of it
+                        self.redis.record_conflict()
+                        self._set_state(*pipe.mget(self.key, self.version_key))
+                        self._applied_ops = set()
+                        self._events = []
+                        for entry in self._pending:
+                            entry[1] = entry[0](self._projects)
+                    self._write(pipe)
+                    self._pending = []
+                    stats["timesheet_commits"] += 1
+                    return
+                except redis.WatchError:
+                    # The watched keys changed between our check and EXEC
+                    self.redis.record_conflict()
+                    self._version = None
+                finally:
+                    pipe.reset()
+                if attempt < self.MAX_RETRIES:
+                    self.redis.record_retry()
+        raise TimesheetConflictError(
+            f"Gave up writing timesheet for user {self.user_id} after {self.MAX_RETRIES} retries")
+
+    def _touched_projects(self):
+        """Names of the projects changed by the pending mutations, or all if unknown"""
+        touched = {name for _, _, touches in self._pending for name in touches or ()}
+        if self._pending and all(touches is not None for _, _, touches in self._pending):
+            return touched
+        # A mutation that did not say what it changed, or a whole save_data() write
+        return touched | {p["project_name"] for p in self._projects}
+
+    def _stamp(self, touched, version):
+        """Give the unstamped sessions of the touched projects the version being written"""
+        if self._shared:
+            self._projects = copy.deepcopy(self._projects)
+            self._shared = False
+        for project in self._projects:
+            if project["project_name"] in touched:
+                for session in project.get("sessions", []):
+                    if session.get("rev") is None:
+                        session["rev"] = version
+
+    def _write(self, pipe):
+        """Queue the cached projects on a watching pipeline and execute it"""
+        pipe.multi()
+        written = self._queue_write(pipe)
+        pipe.execute()
+        self._committed(written)
+
+    def _queue_write(self, pipe):
+        """Queue the commands writing the cached projects on a pipeline in MULTI mode
+
+        The version must be watched. Returns what _committed() needs once they are executed.
+        """
+        # The version is watched, so the new one is known before EXEC
+        new_version = self._version + 1
+        touched = self._touched_projects()
+        self._stamp(touched, new_version)
+        started = running_sessions(self._projects, touched)
+        stopped = sorted(touched - started.keys())
+        pipe.set(self.key, self.redis.encode_timesheet({"projects": self._projects}))
+        pipe.incr(self.version_key)
+        if touched:
+            pipe.hset(self.project_versions_key, mapping={name: new_version for name in touched})
+        if self._applied_ops:
+            # Recorded in the same transaction as the changes they made
+            pipe.hset(self.op_keys_key, mapping={key: new_version for key in self._applied_ops})
+            pipe.expire(self.op_keys_key, self.OP_KEYS_TTL)
+        open_sessions.update_active(pipe, self.user_id, started, stopped)
+        if self.shard is self.redis.primary:
+            # Global keys live on the primary: in this transaction if it holds the user's keys
+            open_sessions.update_index(pipe, self.user_id, started, stopped)
+            if self.redis.timesheet_cache is not None:
+                pipe.publish(self.redis.timesheet_cache.CHANNEL, f"{self.user_id}:{new_version}")
+        for event in self._events:
+            event = dict(event, version=new_version)
+            if "session" in event:
+                # Sessions changed by this write, or copies of them, carry its version
+                event["session"] = dict(event["session"], rev=event["session"].get("rev") or new_version)
+            pipe.publish(events_channel(self.user_id), json.dumps(event))
+        return new_version, started, stopped
+
+    def _committed(self, written, primary=None):
+        """Record a write queued by _queue_write() as done, and update the primary's keys for it
+
+        Without a ``primary`` pipeline, to be executed by the caller, they are updated straight away.
+        """
+        new_version, started, stopped = written
+        self._version = new_version
+        self._applied_ops = set()
+        self._events = []
+        if self.shard is not self.redis.primary:
+            # Caches and the open session index are on the primary, which cannot join a shard's transaction
+            pipe = primary if primary is not None else self.redis.r.pipeline(transaction=False)
+            open_sessions.update_index(pipe, self.user_id, started, stopped)
+            if self.redis.timesheet_cache is not None:
+                pipe.publish(self.redis.timesheet_cache.CHANNEL, f"{self.user_id}:{new_version}")
+            if primary is None:
+                pipe.execute()
+        self._share()
+
+    @classmethod
+    def load_many(cls, user_ids, redis_backend):
+        """Trackers of several users on the same server, with deferred writes, read in one round trip"""
+        trackers = [cls(user_id, redis_backend, autoflush=False) for user_id in user_ids]
+        if trackers:
+            values = trackers[0].shard.raw.mget([key for t in trackers for key in (t.key, t.version_key)])
+            for i, tracker in enumerate(trackers):
+                tracker._set_state(values[2 * i], values[2 * i + 1])
+        return trackers
+
+    @classmethod
+    def flush_many(cls, trackers):
+        """Write the pending mutations of several users on the same server in one transaction
+
+        If any of them was written by someone else since it was read, each
+        tracker is flushed on its own instead, re-applying its mutations.
+        """
+        trackers = [t for t in trackers if t._pending]
+        if not trackers:
+            return
+        redis_backend, shard = trackers[0].redis, trackers[0].shard
+        with shard.raw.pipeline() as pipe:
+            try:
+                pipe.watch(*(key for t in trackers for key in (t.key, t.version_key)))
+                versions = pipe.mget([t.version_key for t in trackers])
+                if all(int(version or 0) == t._version for t, version in zip(trackers, versions)):
+                    pipe.multi()
+                    written = [t._queue_write(pipe) for t in trackers]
+                    pipe.execute()
+                    with redis_backend.r.pipeline(transaction=False) as primary:
+                        for tracker, done in zip(trackers, written):
+                            tracker._pending = []
+                            tracker._committed(done, primary)
+                        primary.execute()
+                    redis_backend.stats["timesheet_commits"] += len(trackers)
+                    return
+                redis_backend.record_conflict()
+            except redis.WatchError:
+                redis_backend.record_conflict()
+        for tracker in trackers:
+            tracker.flush()
+
+    def active_sessions(self):
+        """Start of the running session of each project, from the index without loading the timesheet"""
+        return self.shard.r.hgetall(self.active_key)
+
     def save_data(self):
-        """Save the projects data to Redis"""
-        self.redis.r.set(f"timesheet:user:{self.user_id}", json.dumps({"projects": self._projects}))
-        
+        """Save the projects data to Redis
+
+        Pending mutations are flushed. Otherwise the cached projects are written
+        as they are, which only succeeds if nobody has written since they were read.
+        """
+        if self._pending:
+            return self.flush()
+        with self.shard.raw.pipeline() as pipe:
+            try:
+                pipe.watch(self.key, self.version_key)
+                if int(pipe.get(self.version_key) or 0) != self._version:
+                    raise redis.WatchError()
+                self._write(pipe)
+                self.redis.stats["timesheet_commits"] += 1
+            except redis.WatchError:
+                self.redis.record_conflict()
+                raise TimesheetConflictError(
+                    f"Timesheet for user {self.user_id} was modified by another writer")
+
     def new_session(self, comment=None):
         """Creates a new working session dictionary with an optional comment."""
         tm = self.current_timestamp()
@@ -43,23 +349,45 @@ class RedisTimeTracker:
         """Finds a specific project in the projects list."""
         return next((p for p in self.projects if p["project_name"] == project_name), None)
 
-    def add_or_update_project(self, project_name, comment=None):
-        """Creates a new project or adds a timestamp to an existing one with comments."""
-        project = self.get_project(project_name)
-        if not project:
-            project = {"project_name": project_name, "sessions": [self.new_session(comment)]}
-            self.projects.append(project)
-        else:
-            last_session = project["sessions"][-1]
-            if last_session["end"] is None:
-                last_session["end"] = self.current_timestamp()
-                if comment is None:
-                    comment = ""
-                last_session["closing_comment"] = comment
-            else:
-                project["sessions"].append(self.new_session(comment))
-        self.save_data()
+    def _find_project(self, projects, project_name):
+        """Finds a project in the given projects list."""
+        return next((p for p in projects if p["project_name"] == project_name), None)
+
+    def add_or_update_project(self, project_name, comment=None, at=None):
+        """Creates a new project or adds a timestamp (now, or ``at``) to an existing one with comments."""
+        if comment is None:
+            comment = ""
+        # Take the timestamp once so that a replayed toggle records the same time
+        tm = at or self.current_timestamp()
+
+        def toggle(projects):
+            session = toggle_session(projects, project_name, comment, tm)
+            self._events.append({
+                "type": "stopped" if session["end"] else "started", "project_name": project_name, "session": session})
+
+        self._mutate(toggle, [project_name])
         
+    def close_sessions(self, sessions, closing_comment):
+        """Stop running sessions at given times: ``sessions`` maps project names to ``(start, end)``.
+
+        A project is only stopped if its running session is still the one that started at ``start``.
+        """
+        def running(projects):
+            for project in projects:
+                times = sessions.get(project["project_name"])
+                last = project["sessions"][-1] if times and project.get("sessions") else None
+                if last and last["end"] is None and last["start"] == times[0]:
+                    yield project["project_name"], last, times[1]
+
+        def close(projects):
+            for project_name, session, end in list(running(projects)):
+                session.update(end=end, closing_comment=closing_comment, rev=None)
+                self._events.append({"type": "stopped", "project_name": project_name, "session": session})
+
+        # Nothing to write if they were all stopped already
+        if any(running(self.projects)):
+            self._mutate(close, list(sessions))
+
     def format_timestamp(self, date_str, time_str):
         """Formats date and time strings into the timestamp format used by the application."""
         # Convert from YYYY-MM-DD to DD/MM/YY
@@ -69,78 +397,102 @@ class RedisTimeTracker:
         
     def add_manual_session(self, project_name, start_date, start_time, end_date, end_time, comment, closing_comment=None):
         """Adds a manual session with specified start and end times."""
-        project = self.get_project(project_name)
-        if not project:
-            project = {"project_name": project_name, "sessions": []}
-            self.projects.append(project)
-            
         start_timestamp = self.format_timestamp(start_date, start_time)
         end_timestamp = self.format_timestamp(end_date, end_time)
-        
-        new_session = {
-            "start": start_timestamp,
-            "end": end_timestamp,
-            "comment": comment,
-        }
-        
-        if closing_comment:
-            new_session["closing_comment"] = closing_comment
-            
-        project["sessions"].append(new_session)
-        self.save_data()
+
+        def add_session(projects):
+            project = self._find_project(projects, project_name)
+            if not project:
+                project = {"project_name": project_name, "sessions": []}
+                projects.append(project)
+
+            new_session = {
+                "start": start_timestamp,
+                "end": end_timestamp,
+                "comment": comment,
+                "rev": None,
+            }
+
+            if closing_comment:
+                new_session["closing_comment"] = closing_comment
+
+            project["sessions"].append(new_session)
+            self._events.append({"type": "entry", "project_name": project_name, "session": new_session})
+
+        self._mutate(add_session, [project_name])
+
+    def add_manual_sessions(self, entries):
+        """Add ``(project_name, session)`` pairs in one write, skipping sessions already present
+
+        Returns "added" or "duplicate" for each entry; nothing is written if
+        every entry is a duplicate.
+        """
+        if "added" not in add_sessions(self.projects, entries, dry_run=True):
+            return ["duplicate"] * len(entries)
+
+        def add(projects):
+            statuses = add_sessions(projects, entries)
+            self._events.extend(
+                {"type": "entry", "project_name": project_name, "session": session}
+                for (project_name, session), status in zip(entries, statuses) if status == "added")
+            return statuses
+
+        return self._mutate(add, list({project_name for project_name, _ in entries}))
         
     def update_project_raw(self, project_name, project_data):
         """Update a project with raw data (used for syncing)"""
-        project = self.get_project(project_name)
-        if project:
+        def replace(projects):
             # Find the index of the project in the list
-            index = next((i for i, p in enumerate(self.projects) if p["project_name"] == project_name), None)
-            if index is not None:
-                # Replace the project with the updated data
-                self.projects[index] = project_data
-                self.save_data()
-                return True
-        return False
+            index = next((i for i, p in enumerate(projects) if p["project_name"] == project_name), None)
+            if index is None:
+                return False
+            # Replace the project with the updated data
+            projects[index] = project_data
+            return True
+
+        if not self.get_project(project_name):
+            return False
+        return self._mutate(replace, [project_name])
         
     def merge_projects(self, source_project_name, destination_project_name):
         """Merge sessions from source project into destination project and then delete the source project"""
-        source_project = self.get_project(source_project_name)
-        destination_project = self.get_project(destination_project_name)
-        
-        # Validate that both projects exist
-        if not source_project or not destination_project:
-            return False, "Both source and destination projects must exist"
-            
         # Don't merge a project with itself
         if source_project_name == destination_project_name:
             return False, "Cannot merge a project with itself"
-        
-        # Get all sessions from source project
-        source_sessions = source_project.get("sessions", [])
-        
-        # Add each session from source to destination
-        # Create a dictionary of existing sessions to avoid duplicates
-        existing_sessions = {
-            f"{s.get('start')}_{s.get('end')}": True 
-            for s in destination_project['sessions']
-        }
-        
-        # Add non-duplicate sessions from source to destination
-        for session in source_sessions:
-            session_key = f"{session.get('start')}_{session.get('end')}"
-            if session_key not in existing_sessions:
-                destination_project['sessions'].append(session)
-                
-        # Sort sessions by start time
-        destination_project['sessions'].sort(
-            key=lambda x: x.get('start', ''))
-        
-        # Remove the source project
-        self.projects = [p for p in self.projects if p["project_name"] != source_project_name]
-        
-        # Save changes
-        self.save_data()
-        
+
+        def merge(projects):
+            source_project = self._find_project(projects, source_project_name)
+            destination_project = self._find_project(projects, destination_project_name)
+
+            # Validate that both projects exist
+            if not source_project or not destination_project:
+                return False
+
+            # Create a dictionary of existing sessions to avoid duplicates
+            existing_sessions = {
+                f"{s.get('start')}_{s.get('end')}": True
+                for s in destination_project['sessions']
+            }
+
+            # Add non-duplicate sessions from source to destination, as changes to sync
+            for session in source_project.get("sessions", []):
+                session_key = f"{session.get('start')}_{session.get('end')}"
+                if session_key not in existing_sessions:
+                    destination_project['sessions'].append(dict(session, rev=None))
+
+            # Sort sessions by start time
+            destination_project['sessions'].sort(
+                key=lambda x: x.get('start', ''))
+
+            # Remove the source project
+            projects[:] = [p for p in projects if p["project_name"] != source_project_name]
+            return True
+
+        if not self.get_project(source_project_name) or not self.get_project(destination_project_name):
+            return False, "Both source and destination projects must exist"
+        if not self._mutate(merge, [source_project_name, destination_project_name]):
+            return False, "Both source and destination projects must exist"
+
         return True, f"Successfully merged {source_project_name} into {destination_project_name}"
     
     def add_project_raw(self, project_data):
@@ -148,16 +500,99 @@ class RedisTimeTracker:
         project_name = project_data.get("project_name")
         if not project_name:
             return False
-            
-        # Check if project already exists
-        existing_project = self.get_project(project_name)
-        if existing_project:
-            return self.update_project_raw(project_name, project_data)
-            
-        # Add the new project
-        self.projects.append(project_data)
-        self.save_data()
-        return True
+
+        def add_or_replace(projects):
+            index = next((i for i, p in enumerate(projects) if p["project_name"] == project_name), None)
+            if index is None:
+                projects.append(project_data)
+            else:
+                projects[index] = project_data
+            return True
+
+        return self._mutate(add_or_replace, [project_name])
+
+    def apply_sync_changes(self, changes):
+        """Merge the sessions a client changed since its last sync; returns how many were applied"""
+        if not changes:
+            return 0
+        names = [change["project_name"] for change in changes]
+
+        def merge(projects):
+            applied = merge_client_changes(projects, changes)
+            if applied:
+                self._events.append({"type": "sync", "projects": names})
+            return applied
+
+        return self._mutate(merge, names)
+
+    def apply_ops(self, ops):
+        """Apply queued client operations, each key only once; returns their results (see presis.outbox)
+
+        The keys are written in the same transaction as the changes, and a
+        replayed write looks them up again, so concurrent retries of an
+        operation cannot both apply it.
+        """
+        if not ops:
+            return []
+        keys = [op["key"] for op in ops]
+
+        def applied_keys():
+            return {key for key, version in zip(keys, self.shard.r.hmget(self.op_keys_key, keys)) if version}
+
+        applied = applied_keys()
+        if applied.issuperset(keys):
+            # A batch sent again: all duplicates, nothing to write
+            return apply_ops(self.projects, ops, applied)
+
+        def apply(projects):
+            results = apply_ops(projects, ops, applied_keys())
+            for result in results:
+                if result["status"] == "applied":
+                    self._applied_ops.add(result["key"])
+                    self._events.append({
+                        "type": "stopped" if result["session"]["end"] else "started",
+                        "project_name": result["project_name"], "session": result["session"]})
+            return results
+
+        return self._mutate(apply, sorted({op["project_name"] for op in ops}))
+
+    def sync(self, cursor, changes, ops=()):
+        """Apply a delta sync request and return the response (see presis.sync)
+
+        Queued operations are applied before the changes, and their results
+        added to the response. Everything is written straight away, so that
+        the response carries the cursor that includes it.
+        """
+        results = self.apply_ops(ops)
+        self.apply_sync_changes(changes)
+        self.flush()
+        if cursor is None or cursor > self.version:
+            # First sync, or a cursor from another dataset
+            response = {"cursor": self.version, "full": True, "projects": self.projects, "deleted_projects": []}
+        else:
+            changed, deleted = self.changed_projects_since(cursor)
+            response = {
+                "cursor": self.version,
+                "full": False,
+                "projects": changes_since(self.projects, cursor, changed),
+                "deleted_projects": deleted,
+            }
+        if ops:
+            response["results"] = results
+        return response
+
+    def changed_projects_since(self, cursor):
+        """Names of the projects changed after version ``cursor``, and of those since removed
+
+        Only changes up to the version of the cached projects are considered,
+        so that the answer matches the data it will be sent with.
+        """
+        changed = {
+            name for name, version in self.shard.r.hgetall(self.project_versions_key).items()
+            if cursor < int(version) <= self.version
+        }
+        existing = {p["project_name"] for p in self.projects}
+        return changed & existing, sorted(changed - existing)
 
     def calculate_daily_hours(self, sessions, target_date):
         """Calculate the total number of hours worked on a given day, considering overlaps."""
@@ -202,31 +637,14 @@ class RedisTimeTracker:
         project = self.get_project(project_name)
         if not project:
             return []
-
-        fmt = "%d/%m/%y - %H:%M:%S"
-        all_dates = set()
-
-        for session in project["sessions"]:
-            start_time = datetime.strptime(session["start"], fmt)
-            end_time = datetime.strptime(session["end"], fmt) if session["end"] else datetime.now()
-
-            current_date = start_time.date()
-            while current_date <= end_time.date():
-                all_dates.add(current_date)
-                current_date += timedelta(days=1)
-
-        daily_hours = defaultdict(timedelta)
-        for date in sorted(all_dates):
-            total_time = self.calculate_daily_hours(project["sessions"], date.strftime("%d/%m/%y"))
-            daily_hours[date] = total_time
-
-        return [(date, daily_hours[date]) for date in sorted(daily_hours)]
+        return [(date, hours) for date, hours, _ in DailyReport(project["sessions"]).days()]
 
     def calculate_total_hours(self, project_name):
         """Calculate the total hours worked for a project."""
-        daily_totals = self.assemble_total_hours_per_day(project_name)
-        total_time = sum((hours for _, hours in daily_totals), timedelta())
-        return timedelta(seconds=round(total_time.total_seconds()))
+        project = self.get_project(project_name)
+        if not project:
+            return timedelta()
+        return DailyReport(project["sessions"]).total_hours()
 
     def print_daily_report(self, project_name):
         """Generate and print a daily report of hours worked per day."""
@@ -1,8 +1,13 @@
 import json
+import redis
+import logging
 import secrets
 from werkzeug.security import generate_password_hash, check_password_hash
 from presis.redis_backend import RedisBackend
 from presis.redis_time_tracker import RedisTimeTracker
+from presis import open_sessions
+
+logger = logging.getLogger(__name__)
 
 class RedisUser:
     """
@@ -21,6 +26,8 @@ class RedisUser:
         self.subscription_id = None
         self.stripe_customer_id = None
         self.api_token = None
+        # Running sessions older than this many hours are closed by presis.stale_sessions (None: its default)
+        self.stale_session_hours = None
         
         # If user_data is provided, populate the attributes
         if user_data:
@@ -32,6 +39,7 @@ class RedisUser:
             self.subscription_id = user_data.get('subscription_id')
             self.stripe_customer_id = user_data.get('stripe_customer_id')
             self.api_token = user_data.get('api_token')
+            self.stale_session_hours = user_data.get('stale_session_hours')
     
     def is_authenticated(self):
         """Required by Flask-Login"""
@@ -59,10 +67,18 @@ class RedisUser:
             'has_paid_plan': self.has_paid_plan,
             'subscription_id': self.subscription_id,
             'stripe_customer_id': self.stripe_customer_id,
-            'api_token': self.api_token
+            'api_token': self.api_token,
+            'stale_session_hours': self.stale_session_hours
         }
-        self.redis.r.set(f"user:{self.id}", json.dumps(user_data))
-        self.redis.r.set(f"user_email:{self.email}", self.id)
+        shard = self.redis.shard_for_user(self.id)
+        if shard is self.redis.primary:
+            with self.redis.batch() as pipe:
+                pipe.set(f"user:{self.id}", json.dumps(user_data))
+                pipe.set(f"user_email:{self.email}", self.id)
+        else:
+            # The record lives on the user's shard, the email index on the primary
+            shard.r.set(f"user:{self.id}", json.dumps(user_data))
+            self.redis.r.set(f"user_email:{self.email}", self.id)
         
     def generate_api_token(self):
         """Generate a new API token for the user"""
@@ -94,9 +110,25 @@ class RedisUserRepository:
     
     def _increment_next_id(self):
         """Increment the next available user ID"""
-        next_id = self._get_next_id()
-        self.redis.r.set("next_user_id", next_id + 1)
-        return next_id
+        # Atomic and a single round trip, so concurrent registrations get distinct IDs
+        with self.redis.pipeline() as pipe:
+            pipe.setnx("next_user_id", 1)
+            pipe.incr("next_user_id")
+            _, next_id = pipe.execute()
+        return next_id - 1
+    
+    def _iter_users(self, batch_size=100, replica=False):
+        """Yield all users, fetching their records in batches from every server"""
+        for node in self.redis.nodes():
+            client = node.reader().r if replica else node.r
+            user_keys = [
+                key for key in client.scan_iter(match="user:*", count=batch_size)
+                if key.split(":")[1].isdigit()
+            ]
+            for i in range(0, len(user_keys), batch_size):
+                for user_data in client.mget(user_keys[i:i + batch_size]):
+                    if user_data:
+                        yield RedisUser(self.redis, json.loads(user_data))
     
     def create(self, email, password, is_admin=False, has_paid_plan=False,
               subscription_id=None, stripe_customer_id=None, api_token=None):
@@ -131,12 +163,32 @@ class RedisUserRepository:
         if user_id is None:
             return None
             
-        user_data = self.redis.r.get(f"user:{user_id}")
+        user_data = self.redis.shard_for_user(user_id).r.get(f"user:{user_id}")
         if not user_data:
             return None
             
         return RedisUser(self.redis, json.loads(user_data))
     
+    def delete(self, user):
+        """Delete a user, their email index entry and their timesheet"""
+        shard = self.redis.shard_for_user(user.id)
+        keys = [
+            f"user:{user.id}",
+            f"timesheet:user:{user.id}",
+            f"timesheet:user:{user.id}:version",
+            f"timesheet:user:{user.id}:project_versions",
+            f"timesheet:user:{user.id}:op_keys",
+            open_sessions.active_key(user.id),
+        ]
+        running = [open_sessions.member(user.id, name) for name in shard.r.hkeys(open_sessions.active_key(user.id))]
+        if shard is self.redis.primary:
+            self.redis.r.delete(f"user_email:{user.email}", *keys)
+        else:
+            shard.r.delete(*keys)
+            self.redis.r.delete(f"user_email:{user.email}")
+        if running:
+            self.redis.r.zrem(open_sessions.KEY, *running)
+    
     def filter_by(self, **kwargs):
         """Filter users by criteria (simplified implementation)"""
         # Only support filtering by email or api_token
@@ -148,29 +200,21 @@ class RedisUserRepository:
         elif 'api_token' in kwargs:
             # Find the user with the given API token
             # This is inefficient, but API tokens are used less frequently
-            all_user_ids = self.redis.r.keys("user:*")
-            for user_key in all_user_ids:
-                if not user_key.startswith("user:") or user_key == "user_email:":
-                    continue
-                user_id = user_key.split(":")[1]
-                user = self.get(user_id)
-                if user and user.api_token == kwargs['api_token']:
+            for user in self._iter_users():
+                if user.api_token == kwargs['api_token']:
                     return SingleResult(user)
             return EmptyResult()
         return EmptyResult()
     
-    def all(self):
-        """Get all users"""
-        all_user_ids = self.redis.r.keys("user:*")
-        users = []
-        for user_key in all_user_ids:
-            if not user_key.startswith("user:") or user_key.startswith("user_email:"):
-                continue
-            user_id = user_key.split(":")[1]
-            user = self.get(user_id)
-            if user:
-                users.append(user)
-        return users
+    def all(self, replica=False):
+        """Get all users, from replicas if ``replica`` is True and they are reachable"""
+        if replica:
+            try:
+                return list(self._iter_users(replica=True))
+            except redis.RedisError as e:
+                logger.warning(f"Listing users from replicas failed, using the primaries: {e}")
+                self.redis.stats["replica_errors"] += 1
+        return list(self._iter_users())
 
 class EmptyResult:
     """Empty result from a query"""
@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+
+
+class ReportCache:
+    """In-process LRU cache of project reports, shared by the requests of one worker.
+
+    Entries are keyed by user and project and remember the project version
+    they were built from, so they are only dropped by changes to that project.
+    Versions are opaque: anything that changes whenever the project changes
+    (such as its ETag) will do.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # (user_id, project_name) -> (version, report)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, project_name, version):
+        """Return the report built at ``version``, or None on a miss."""
+        key = (str(user_id), project_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, project_name, version, report):
+        """Store the report of a project as built at ``version``."""
+        if self.maxsize <= 0:
+            return
+        key = (str(user_id), project_name)
+        with self._lock:
+            self._entries[key] = (version, report)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+from presis.timesheet_queries import parse_timestamp, union_duration
+
+
+def split_by_day(start, end):
+    """Yield ``(day, start, end)`` for each calendar day from start to end, clipped to that day."""
+    day = start.date()
+    while day <= end.date():
+        day_start = datetime.combine(day, datetime.min.time())
+        next_day = day_start + timedelta(days=1)
+        yield day, max(start, day_start), min(end, next_day)
+        day += timedelta(days=1)
+
+
+class DailyReport:
+    """Hours per day of a project's sessions, with overlapping sessions counted once.
+
+    Closed sessions are reduced to per-day hours when the report is built,
+    while running sessions are added by days() at read time, so a report can
+    be cached for a project version and stays exact as running sessions grow.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = {}  # day -> sessions on that day (running sessions on their start day)
+        self.running = []  # start of each running session
+        intervals = {}
+        for session in sessions:
+            session = dict(session)
+            start = parse_timestamp(session["start"])
+            if not session.get("end"):
+                self.running.append(start)
+                self.sessions.setdefault(start.date(), []).append(session)
+                continue
+            for day, day_start, day_end in split_by_day(start, parse_timestamp(session["end"])):
+                intervals.setdefault(day, []).append((day_start, day_end))
+                self.sessions.setdefault(day, []).append(session)
+
+        self.closed_hours = {day: union_duration(day_intervals) for day, day_intervals in intervals.items()}
+        # Running sessions can only add to the days from their start: keep those days'
+        # intervals so that days() can merge them without counting overlaps twice
+        first_running_day = min(self.running).date() if self.running else None
+        self.intervals = {
+            day: day_intervals for day, day_intervals in intervals.items()
+            if first_running_day is not None and day >= first_running_day
+        }
+
+    def days(self, now=None):
+        """Return ``(day, hours, sessions)`` for each day with tracked time, in order."""
+        hours = dict(self.closed_hours)
+        if self.running:
+            now = now or datetime.now()
+            live = {}
+            for start in self.running:
+                for day, day_start, day_end in split_by_day(start, max(start, now)):
+                    live.setdefault(day, list(self.intervals.get(day, []))).append((day_start, day_end))
+            for day, day_intervals in live.items():
+                hours[day] = union_duration(day_intervals)
+        return [(day, hours[day], self.sessions.get(day, [])) for day in sorted(hours)]
+
+    def total_hours(self, now=None):
+        """Total of the daily hours."""
+        return sum((hours for _, hours, _ in self.days(now)), timedelta())
+
+
+# Periods that grouped_hours() can group days by
+GROUPINGS = ("day", "week", "month")
+
+
+def period_start(day, group_by):
+    """First day of the day, week (starting on Monday) or month containing ``day``."""
+    if group_by == "week":
+        return day - timedelta(days=day.weekday())
+    if group_by == "month":
+        return day.replace(day=1)
+    return day
+
+
+def grouped_hours(days, group_by="day", since=None, until=None):
+    """Sum ``(day, hours, ...)`` rows from DailyReport.days() into ``[(period_start, hours)]``.
+
+    Days outside the optional [since, until] dates are left out.
+    """
+    if group_by not in GROUPINGS:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUPINGS)}")
+    totals = {}
+    for day, hours, *_ in days:
+        if (since and day < since) or (until and day > until):
+            continue
+        period = period_start(day, group_by)
+        totals[period] = totals.get(period, timedelta()) + hours
+    return sorted(totals.items())
@@ -0,0 +1,182 @@
+"""
+Close sessions left running for too long, across all users.
+
+    python -m presis.stale_sessions --dry-run
+    python -m presis.stale_sessions [--hours 12] [--batch-size 100]
+
+Reports count a running session up to now, so a forgotten one keeps adding
+hours. A session running for longer than its user's threshold (the
+``stale_session_hours`` of the user record, set on the profile page, or
+--hours) is closed at its start plus that threshold, with
+AUTO_CLOSE_COMMENT as closing comment so that it can be found and corrected.
+
+Candidates come from the open_sessions index (see presis.open_sessions), not
+from a scan of the timesheets. Users are handled in batches per server: the
+records and timesheets of a batch are read with one MGET each and its changes
+written in one transaction. If someone else wrote to one of the users
+meanwhile, that batch is written user by user instead. Index entries that
+turn out to be outdated are corrected. Run it periodically, e.g. hourly from
+cron.
+"""
+import json
+import argparse
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from presis import open_sessions
+from presis.redis_backend import RedisBackend
+from presis.redis_time_tracker import RedisTimeTracker
+from presis.timesheet_queries import TIMESTAMP_FORMAT, parse_timestamp, running_sessions
+
+DEFAULT_HOURS = 12
+# Bounds of the thresholds users may choose
+MIN_HOURS = 1
+MAX_HOURS = 168
+AUTO_CLOSE_COMMENT = "[closed automatically: left running]"
+
+
+def by_shard(backend, user_ids):
+    """The user IDs grouped by the server holding their keys"""
+    groups = defaultdict(list)
+    for user_id in user_ids:
+        groups[backend.shard_for_user(user_id)].append(user_id)
+    return groups
+
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def user_thresholds(backend, user_ids, default_hours=DEFAULT_HOURS, batch_size=500):
+    """Threshold in hours of each of the users that still exist"""
+    thresholds = {}
+    for shard, ids in by_shard(backend, user_ids).items():
+        for batch in batches(ids, batch_size):
+            for user_id, record in zip(batch, shard.r.mget([f"user:{user_id}" for user_id in batch])):
+                if record:
+                    hours = json.loads(record).get("stale_session_hours")
+                    thresholds[user_id] = min(max(hours, MIN_HOURS), MAX_HOURS) if hours else default_hours
+    return thresholds
+
+
+def running_starts(backend, user_ids, batch_size=500):
+    """Start of each running session of the users, as stored in their timesheets"""
+    starts = {}
+    for shard, ids in by_shard(backend, user_ids).items():
+        for batch in batches(ids, batch_size):
+            with shard.r.pipeline(transaction=False) as pipe:
+                for user_id in batch:
+                    pipe.hgetall(open_sessions.active_key(user_id))
+                starts.update(zip(batch, pipe.execute()))
+    return starts
+
+
+def find_stale(backend, default_hours=DEFAULT_HOURS, now=None):
+    """Stale sessions and orphaned index entries
+
+    Returns ``(stale, orphans)``: stale maps user IDs to ``{project_name: (start, end)}``,
+    the session start and the time to close it at, and orphans lists the
+    ``(user_id, project_name)`` entries with no running session behind them,
+    e.g. of users that no longer exist.
+    """
+    now = now or datetime.now()
+    # Sessions younger than every user's threshold are not even read
+    candidates = open_sessions.open_before(backend, now - timedelta(hours=min(default_hours, MIN_HOURS)))
+    by_user = defaultdict(list)
+    for user_id, project_name, _ in candidates:
+        by_user[user_id].append(project_name)
+    thresholds = user_thresholds(backend, list(by_user), default_hours)
+    # Index scores are epoch seconds, which do not map back to the stored local start
+    # around DST changes: sessions are matched by the start their user's index stores
+    starts = running_starts(backend, list(thresholds))
+
+    stale, orphans = {}, []
+    for user_id, projects in by_user.items():
+        limit = timedelta(hours=thresholds.get(user_id, 0))
+        for project_name in projects:
+            start = starts.get(user_id, {}).get(project_name)
+            if start is None:
+                orphans.append((user_id, project_name))
+            elif parse_timestamp(start) <= now - limit:
+                stale.setdefault(user_id, {})[project_name] = (
+                    start, (parse_timestamp(start) + limit).strftime(TIMESTAMP_FORMAT))
+    return stale, orphans
+
+
+def close_stale(backend, stale, orphans=(), batch_size=100):
+    """Close the sessions found by find_stale() and drop orphaned index entries; returns counts.
+
+    Sessions stopped or replaced since they were indexed are left alone,
+    and their index entries corrected.
+    """
+    summary = Counter()
+    for shard, user_ids in by_shard(backend, list(stale)).items():
+        for batch in batches(user_ids, batch_size):
+            trackers = RedisTimeTracker.load_many(batch, backend)
+            for tracker in trackers:
+                tracker.close_sessions(stale[tracker.user_id], AUTO_CLOSE_COMMENT)
+            RedisTimeTracker.flush_many(trackers)
+            summary["batches"] += 1
+
+            with shard.r.pipeline(transaction=False) as user_pipe, backend.r.pipeline(transaction=False) as index_pipe:
+                for tracker in trackers:
+                    outdated = []
+                    for project_name, (start, end) in stale[tracker.user_id].items():
+                        project = tracker.get_project(project_name)
+                        last = project["sessions"][-1] if project and project["sessions"] else None
+                        if last and last["start"] == start and last["end"] == end \
+                                and last.get("closing_comment") == AUTO_CLOSE_COMMENT:
+                            summary["closed"] += 1
+                        else:
+                            outdated.append(project_name)
+                    if len(outdated) < len(stale[tracker.user_id]):
+                        summary["users"] += 1
+                    if outdated:
+                        # The timesheet says otherwise: index what it says
+                        summary["outdated"] += len(outdated)
+                        started = running_sessions(tracker.projects, outdated)
+                        stopped = [name for name in outdated if name not in started]
+                        open_sessions.update_active(user_pipe, tracker.user_id, started, stopped)
+                        open_sessions.update_index(index_pipe, tracker.user_id, started, stopped)
+                user_pipe.execute()
+                index_pipe.execute()
+    # Unless their project was started again meanwhile
+    running = running_starts(backend, list({user_id for user_id, _ in orphans}))
+    orphans = [(user_id, name) for user_id, name in orphans if name not in running.get(user_id, {})]
+    if orphans:
+        backend.r.zrem(open_sessions.KEY, *(open_sessions.member(*orphan) for orphan in orphans))
+        summary["orphans"] = len(orphans)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Close sessions left running for longer than their user's threshold")
+    parser.add_argument("--hours", type=float, default=DEFAULT_HOURS,
+                        help=f"Threshold of users who have not set one (default {DEFAULT_HOURS})")
+    parser.add_argument("--batch-size", type=int, default=100, help="Users read and written together")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the sessions that would be closed")
+    args = parser.parse_args()
+    if not MIN_HOURS <= args.hours <= MAX_HOURS:
+        parser.error(f"--hours must be from {MIN_HOURS} to {MAX_HOURS}")
+
+    backend = RedisBackend.from_env()
+    stale, orphans = find_stale(backend, args.hours)
+    if args.dry_run:
+        for user_id, sessions in sorted(stale.items()):
+            for project_name, (start, end) in sorted(sessions.items()):
+                print(f"Would close user {user_id}'s '{project_name}', running since {start}, at {end}")
+        print(f"Would close {sum(map(len, stale.values()))} sessions of {len(stale)} users "
+              f"and drop {len(orphans)} index entries without a running session")
+        return
+
+    summary = close_stale(backend, stale, orphans, args.batch_size)
+    print(f"Closed {summary['closed']} sessions of {summary['users']} users in {summary['batches']} batches")
+    if summary["outdated"]:
+        print(f"Corrected {summary['outdated']} index entries of sessions stopped or replaced meanwhile")
+    if summary["orphans"]:
+        print(f"Dropped {summary['orphans']} index entries without a running session")
+
+
+if __name__ == "__main__":
+    main()
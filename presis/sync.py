@@ -0,0 +1,80 @@
+"""
+Delta sync (v2): sessions carry a ``rev``, the timesheet version at which they last changed.
+
+A session without ``rev`` predates revisions; ``rev: None`` marks a session
+changed locally and not yet stamped by the server. Clients send only their
+unstamped sessions along with the cursor (server version) of their last
+sync, and receive only the sessions stamped after that cursor. Sessions are
+identified by their start timestamp within a project.
+"""
+
+
+def unsynced_changes(projects):
+    """Projects with only the sessions changed since they were last stamped by the server."""
+    changes = []
+    for project in projects:
+        sessions = [s for s in project.get("sessions", []) if "rev" not in s or s["rev"] is None]
+        if sessions:
+            changes.append({"project_name": project["project_name"], "sessions": sessions})
+    return changes
+
+
+def merge_client_changes(projects, changes):
+    """Merge sessions sent by a client into the server's projects; returns the number changed.
+
+    New sessions are added. A session the client has stopped is stopped on
+    the server too if it is still running there; otherwise the server's copy wins.
+    Changed sessions get ``rev: None`` so that the next write stamps them.
+    """
+    by_name = {p["project_name"]: p for p in projects}
+    changed = 0
+    for change in changes:
+        project = by_name.get(change["project_name"])
+        if project is None:
+            project = by_name[change["project_name"]] = {"project_name": change["project_name"], "sessions": []}
+            projects.append(project)
+        by_start = {s["start"]: s for s in project["sessions"]}
+        for session in change["sessions"]:
+            existing = by_start.get(session["start"])
+            if existing is None:
+                existing = by_start[session["start"]] = dict(session, rev=None)
+                project["sessions"].append(existing)
+                changed += 1
+            elif existing.get("end") is None and session.get("end") is not None:
+                existing["end"] = session["end"]
+                existing["closing_comment"] = session.get("closing_comment", "")
+                existing["rev"] = None
+                changed += 1
+    return changed
+
+
+def changes_since(projects, cursor, project_names):
+    """The named projects with only their sessions stamped after ``cursor``."""
+    return [
+        {
+            "project_name": project["project_name"],
+            "sessions": [s for s in project.get("sessions", []) if (s.get("rev") or 0) > cursor],
+        }
+        for project in projects
+        if project["project_name"] in project_names
+    ]
+
+
+def apply_server_changes(projects, changed_projects, deleted_projects=()):
+    """Apply a sync response to local projects; the server's copy of a session wins."""
+    by_name = {p["project_name"]: p for p in projects}
+    for name in deleted_projects:
+        if name in by_name:
+            projects.remove(by_name.pop(name))
+    for change in changed_projects:
+        project = by_name.get(change["project_name"])
+        if project is None:
+            project = by_name[change["project_name"]] = {"project_name": change["project_name"], "sessions": []}
+            projects.append(project)
+        index = {s["start"]: i for i, s in enumerate(project["sessions"])}
+        for session in change["sessions"]:
+            if session["start"] in index:
+                project["sessions"][index[session["start"]]] = session
+            else:
+                index[session["start"]] = len(project["sessions"])
+                project["sessions"].append(session)
@@ -3,13 +3,100 @@ import os
 import json
 from datetime import datetime, timedelta
 from functools import reduce
-from collections import defaultdict
+from presis.timesheet_queries import TimesheetQueries
+from presis.sync import merge_client_changes, apply_server_changes
+from presis.manual_entries import add_sessions
+from presis.outbox import apply_ops
+from presis.reports import DailyReport
 
 
-class TimeTracker:
-    def __init__(self, json_file):
+class TimeTracker(TimesheetQueries):
+    # Changes received from a server are appended to a journal next to the data
+    # file, which is folded into the data file once it grows past this size
+    JOURNAL_MAX_BYTES = 256 * 1024
+    # How many keys of applied client operations are remembered
+    OP_KEYS_MAX = 10000
+
+    def __init__(self, json_file, autoflush=True):
         self.json_file = json_file
-        self.projects = self.load_data(json_file).get("projects", [])
+        self._projects = None  # Loaded on first use
+        # When False, changes are only written by an explicit flush()
+        self.autoflush = autoflush
+        self.dirty = False
+        # True once this tracker made a change of its own, which a sync must send
+        self.changed_locally = False
+        self._applied_ops = []  # Keys of applied operations, recorded when the data is next saved
+
+    @property
+    def projects(self):
+        if self._projects is None:
+            self._projects = self.load_data(self.json_file).get("projects", [])
+            self._replay_journal()
+        return self._projects
+
+    @projects.setter
+    def projects(self, projects):
+        self._projects = projects
+
+    def current_version(self, project_name=None):
+        """Version of the saved data file, from its size and modification time, without reading it.
+
+        Projects share the version of the whole file.
+        """
+        try:
+            stat = os.stat(self.json_file)
+        except (OSError, TypeError):
+            return "0"
+        version = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        if os.path.exists(self.journal_file):
+            journal = os.stat(self.journal_file)
+            version += f"-{journal.st_mtime_ns:x}-{journal.st_size:x}"
+        return version
+
+    def current_versions(self):
+        """Version of each project, which is the version of the whole file"""
+        version = self.current_version()
+        return {project["project_name"]: version for project in self.projects}
+
+    @property
+    def journal_file(self):
+        return f"{self.json_file}.journal"
+
+    @property
+    def op_keys_file(self):
+        return f"{self.json_file}.op_keys"
+
+    def _load_op_keys(self):
+        if not os.path.exists(self.op_keys_file):
+            return []
+        with open(self.op_keys_file, "r") as f:
+            return json.load(f)
+
+    def _replay_journal(self):
+        """Applies the server changes appended to the journal since the data file was written."""
+        if not self.json_file or not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    apply_server_changes(self._projects, entry["projects"], entry.get("deleted_projects", []))
+
+    def apply_server_changes(self, changed_projects, deleted_projects=()):
+        """Applies sessions received from the server, without reading or rewriting the whole data file.
+
+        The changes are appended to the journal in one write; the data file
+        is only rewritten when the journal has grown large.
+        """
+        if not changed_projects and not deleted_projects:
+            return
+        if self._projects is not None:
+            apply_server_changes(self._projects, changed_projects, deleted_projects)
+        entry = {"projects": changed_projects, "deleted_projects": list(deleted_projects)}
+        with open(self.journal_file, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        if os.path.getsize(self.journal_file) > self.JOURNAL_MAX_BYTES:
+            self.save_data()
 
     def load_data(self, path):
         """Reads the data from a JSON file."""
@@ -20,16 +107,39 @@ class TimeTracker:
 
     def save_data(self):
         """Writes the data to a JSON file."""
+        projects = self.projects
         with open(self.json_file, "w+") as f:
-            json.dump({"projects": self.projects}, f, indent=2)
+            json.dump({"projects": projects}, f, indent=2)
+        # The data file now includes everything the journal held
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        if self._applied_ops:
+            # Only once the changes they made are saved
+            keys = (self._load_op_keys() + self._applied_ops)[-self.OP_KEYS_MAX:]
+            with open(self.op_keys_file, "w") as f:
+                json.dump(keys, f)
+            self._applied_ops = []
+        self.dirty = False
 
-    def new_session(self, comment=None):
+    def flush(self):
+        """Writes the data if it changed since it was last saved."""
+        if self.dirty:
+            self.save_data()
+
+    def _changed(self):
+        """Records a change, writing it out unless writes are deferred to flush()."""
+        self.dirty = True
+        self.changed_locally = True
+        if self.autoflush:
+            self.save_data()
+
+    def new_session(self, comment=None, at=None):
         """Creates a new working session dictionary with an optional comment."""
-        tm = self.current_timestamp()
+        tm = at or self.current_timestamp()
         print(f'starting new session at: {tm}')
         if comment is None:
             comment = input("Enter a comment for this new session: ")
-        return { "start": tm, "end": None, "comment": comment }
+        return { "start": tm, "end": None, "comment": comment, "rev": None }
 
     def current_timestamp(self):
         """Returns the current timestamp with a specific format."""
@@ -39,24 +149,25 @@ class TimeTracker:
         """Finds a specific project in the projects list."""
         return next((p for p in self.projects if p["project_name"] == project_name), None)
 
-    def add_or_update_project(self, project_name, comment=None):
-        """Creates a new project or adds a timestamp to an existing one with comments."""
+    def add_or_update_project(self, project_name, comment=None, at=None):
+        """Creates a new project or adds a timestamp (now, or ``at``) to an existing one with comments."""
         project = self.get_project(project_name)
         if not project:
-            project = {"project_name": project_name, "sessions": [self.new_session(comment)]}
+            project = {"project_name": project_name, "sessions": [self.new_session(comment, at)]}
             print(f'creating project {project_name}')
             self.projects.append(project)
         else:
             last_session = project["sessions"][-1]
             if last_session["end"] is None:
-                last_session["end"] = self.current_timestamp()
+                last_session["end"] = at or self.current_timestamp()
                 if comment is None:
                     comment = input("Enter a closing comment for this session: ")
                 last_session["closing_comment"] = comment
+                last_session["rev"] = None
                 print(f'ended session at: {last_session["end"]}')
             else:
-                project["sessions"].append(self.new_session(comment))
-        self.save_data()
+                project["sessions"].append(self.new_session(comment, at))
+        self._changed()
         
     def format_timestamp(self, date_str, time_str):
         """Formats date and time strings into the timestamp format used by the application."""
@@ -79,13 +190,24 @@ class TimeTracker:
             "start": start_timestamp,
             "end": end_timestamp,
             "comment": comment,
+            "rev": None,
         }
         
         if closing_comment:
             new_session["closing_comment"] = closing_comment
             
         project["sessions"].append(new_session)
-        self.save_data()
+        self._changed()
+
+    def add_manual_sessions(self, entries):
+        """Add ``(project_name, session)`` pairs in one write, skipping sessions already present
+
+        Returns "added" or "duplicate" for each entry.
+        """
+        statuses = add_sessions(self.projects, entries)
+        if "added" in statuses:
+            self._changed()
+        return statuses
         
     def update_project_raw(self, project_name, project_data):
         """Update a project with raw data (used for syncing)"""
@@ -96,7 +218,7 @@ class TimeTracker:
             if index is not None:
                 # Replace the project with the updated data
                 self.projects[index] = project_data
-                self.save_data()
+                self._changed()
                 return True
         return False
         
@@ -123,11 +245,11 @@ class TimeTracker:
             for s in destination_project['sessions']
         }
         
-        # Add non-duplicate sessions from source to destination
+        # Add non-duplicate sessions from source to destination, as changes to sync
         for session in source_sessions:
             session_key = f"{session.get('start')}_{session.get('end')}"
             if session_key not in existing_sessions:
-                destination_project['sessions'].append(session)
+                destination_project['sessions'].append(dict(session, rev=None))
                 
         # Sort sessions by start time
         destination_project['sessions'].sort(
@@ -137,7 +259,7 @@ class TimeTracker:
         self.projects = [p for p in self.projects if p["project_name"] != source_project_name]
         
         # Save changes
-        self.save_data()
+        self._changed()
         
         return True, f"Successfully merged {source_project_name} into {destination_project_name}"
     
@@ -154,9 +276,42 @@ class TimeTracker:
             
         # Add the new project
         self.projects.append(project_data)
-        self.save_data()
+        self._changed()
         return True
 
+    def apply_sync_changes(self, changes):
+        """Merge the sessions a client changed since its last sync; returns how many were applied"""
+        changed = merge_client_changes(self.projects, changes)
+        if changed:
+            self._changed()
+        return changed
+
+    def apply_ops(self, ops):
+        """Apply queued client operations, each key only once; returns their results (see presis.outbox)"""
+        if not ops:
+            return []
+        results = apply_ops(self.projects, ops, set(self._load_op_keys()) | set(self._applied_ops))
+        applied = [result["key"] for result in results if result["status"] == "applied"]
+        if applied:
+            self._applied_ops.extend(applied)
+            self._changed()
+        return results
+
+    def sync(self, cursor, changes, ops=()):
+        """Apply a delta sync request and return the response (see presis.sync)
+
+        Queued operations are applied before the changes, and their results
+        added to the response. Files keep no revisions, so the whole dataset
+        is always sent back.
+        """
+        results = self.apply_ops(ops)
+        self.apply_sync_changes(changes)
+        self.flush()
+        response = {"cursor": None, "full": True, "projects": self.projects, "deleted_projects": []}
+        if ops:
+            response["results"] = results
+        return response
+
     def calculate_daily_hours(self, sessions, target_date):
         """Calculate the total number of hours worked on a given day, considering overlaps."""
         fmt = "%d/%m/%y - %H:%M:%S"
@@ -200,31 +355,14 @@ class TimeTracker:
         project = self.get_project(project_name)
         if not project:
             return []
-
-        fmt = "%d/%m/%y - %H:%M:%S"
-        all_dates = set()
-
-        for session in project["sessions"]:
-            start_time = datetime.strptime(session["start"], fmt)
-            end_time = datetime.strptime(session["end"], fmt) if session["end"] else datetime.now()
-
-            current_date = start_time.date()
-            while current_date <= end_time.date():
-                all_dates.add(current_date)
-                current_date += timedelta(days=1)
-
-        daily_hours = defaultdict(timedelta)
-        for date in sorted(all_dates):
-            total_time = self.calculate_daily_hours(project["sessions"], date.strftime("%d/%m/%y"))
-            daily_hours[date] = total_time
-
-        return [(date, daily_hours[date]) for date in sorted(daily_hours)]
+        return [(date, hours) for date, hours, _ in DailyReport(project["sessions"]).days()]
 
     def calculate_total_hours(self, project_name):
         """Calculate the total hours worked for a project."""
-        daily_totals = self.assemble_total_hours_per_day(project_name)
-        total_time = sum((hours for _, hours in daily_totals), timedelta())
-        return timedelta(seconds=round(total_time.total_seconds()))
+        project = self.get_project(project_name)
+        if not project:
+            return timedelta()
+        return DailyReport(project["sessions"]).total_hours()
 
     def print_daily_report(self, project_name):
         """Generate and print a daily report of hours worked per day."""
@@ -0,0 +1,148 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TimesheetCache:
+    """In-process LRU cache of decoded timesheets, shared by the trackers of one worker.
+
+    Entries are keyed by user and remember the version they were read at. Every
+    timesheet commit publishes ``{user_id}:{version}`` on ``CHANNEL``, and a
+    listener thread in each worker drops entries older than the published
+    version, so repeat reads are served without fetching anything from Redis.
+
+    Entries are only served while the listener is subscribed: if the connection
+    drops, invalidations may have been missed, so the cache is emptied and
+    bypassed until the listener has subscribed again.
+    """
+
+    CHANNEL = "timesheet:invalidate"
+
+    def __init__(self, redis_backend, maxsize=1024, ttl=60):
+        self.redis = redis_backend
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (version, projects, stored_at)
+        # Latest version invalidated per user, for the maxsize users written most recently, even
+        # those without an entry: a read that finishes after a newer write's invalidation is not stored
+        self._invalidated = OrderedDict()  # user_id -> version
+        self._lock = threading.Lock()
+        self._listening = threading.Event()
+        self._listener = None
+        self._pid = None
+
+    def get(self, user_id, min_version=0):
+        """Return ``(version, projects)`` for a user, or None on a miss.
+
+        The returned projects are shared: callers must copy them before
+        changing them.
+        """
+        self._ensure_listener()
+        if not self._listening.is_set():
+            return None
+        with self._lock:
+            entry = self._entries.get(str(user_id))
+            if entry is None:
+                self.redis.stats["timesheet_cache_misses"] += 1
+                return None
+            version, projects, stored_at = entry
+            if version < min_version or time.monotonic() - stored_at > self.ttl:
+                del self._entries[str(user_id)]
+                self.redis.stats["timesheet_cache_misses"] += 1
+                return None
+            self._entries.move_to_end(str(user_id))
+            self.redis.stats["timesheet_cache_hits"] += 1
+            return version, projects
+
+    def put(self, user_id, version, projects):
+        """Store the projects of a user as read or written at ``version``."""
+        if not self._listening.is_set():
+            return
+        with self._lock:
+            entry = self._entries.get(str(user_id))
+            if entry is not None and entry[0] > version:
+                return
+            if self._invalidated.get(str(user_id), 0) > version:
+                return
+            self._entries[str(user_id)] = (version, projects, time.monotonic())
+            self._entries.move_to_end(str(user_id))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id, version):
+        """Drop the entry of a user if it is older than ``version``, and refuse older ones from now on."""
+        with self._lock:
+            if self._invalidated.get(str(user_id), 0) < version:
+                self._invalidated[str(user_id)] = version
+            self._invalidated.move_to_end(str(user_id))
+            while len(self._invalidated) > self.maxsize:
+                self._invalidated.popitem(last=False)
+            entry = self._entries.get(str(user_id))
+            if entry is not None and entry[0] < version:
+                del self._entries[str(user_id)]
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _ensure_listener(self):
+        """Start the invalidation listener, again in a child after a fork."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._entries.clear()
+            self._listening.clear()
+            self._listener = threading.Thread(
+                target=self._listen, name="timesheet-cache-invalidation", daemon=True)
+            self._listener.start()
+
+    def stop(self):
+        """Let the listener end within a second; it is started again when the cache is next used"""
+        self._pid = None
+
+    def wait_until_listening(self, timeout=None):
+        """Block until invalidations are being received; returns False on timeout."""
+        self._ensure_listener()
+        return self._listening.wait(timeout)
+
+    def _listen(self):
+        """Apply invalidations published by any worker, reconnecting when needed."""
+        pid = os.getpid()
+        delay = 0.1
+        while self._pid == pid:
+            pubsub = self.redis.r.pubsub()
+            try:
+                pubsub.subscribe(self.CHANNEL)
+                # Wait for the subscription to be confirmed before serving entries
+                while not pubsub.get_message(timeout=1.0):
+                    pass
+                self._listening.set()
+                delay = 0.1
+                while self._pid == pid:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        user_id, _, version = message["data"].rpartition(":")
+                        self.invalidate(user_id, int(version))
+            except Exception as e:
+                logger.warning(f"Timesheet cache invalidation listener failed: {e}")
+            finally:
+                # Invalidations may be missed from here on: stop trusting entries
+                self._listening.clear()
+                self.clear()
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
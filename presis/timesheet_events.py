@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Timesheet commits publish their events on the channel of the user, on the user's shard
+CHANNEL_PATTERN = "timesheet:user:*:events"
+
+
+def channel(user_id):
+    """The pub/sub channel of a user's timesheet events"""
+    return f"timesheet:user:{user_id}:events"
+
+
+def format_sse(event):
+    """An event as a Server-Sent Events message, named by its type"""
+    lines = f"event: {event['type']}\n"
+    if event.get("version"):
+        lines += f"id: {event['version']}\n"
+    return lines + f"data: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+class EventHub:
+    """Hands the timesheet events published by any worker to the streams of this worker.
+
+    Events are published by RedisTimeTracker in the transaction of the write
+    that made them: ``started`` and ``stopped`` with the toggled session,
+    ``entry`` with a manually added one, and ``sync`` with the names of the
+    projects a client's sync changed. Each carries the project_name (or
+    projects) and the timesheet version it was written at.
+
+    A listener thread per Redis server subscribes to every user's channel,
+    and passes the events of users with an open stream to their queues. If a
+    listener loses its connection, events may have been missed: once it has
+    subscribed again, every stream is sent a ``resync`` event.
+    """
+
+    # Events a slow stream may fall behind by before it is sent a resync instead
+    QUEUE_SIZE = 100
+
+    def __init__(self, redis_backend):
+        self.redis = redis_backend
+        self._streams = {}  # user_id -> set of queues
+        self._lock = threading.Lock()
+        self._pid = None
+        self._listening = set()  # Names of the servers whose listener is subscribed
+
+    def subscribe(self, user_id):
+        """A queue receiving the events of a user, until unsubscribe()"""
+        self._ensure_listeners()
+        events = queue.Queue(self.QUEUE_SIZE)
+        with self._lock:
+            self._streams.setdefault(str(user_id), set()).add(events)
+        return events
+
+    def unsubscribe(self, user_id, events):
+        with self._lock:
+            streams = self._streams.get(str(user_id), set())
+            streams.discard(events)
+            if not streams:
+                self._streams.pop(str(user_id), None)
+
+    def publish(self, user_id, event):
+        """Pass an event to the streams of a user in this worker"""
+        with self._lock:
+            streams = list(self._streams.get(str(user_id), ()))
+        for events in streams:
+            self._put(events, event)
+
+    def _put(self, events, event):
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            # The stream is not keeping up: replace what it has not read with a resync
+            with events.mutex:
+                events.queue.clear()
+            events.put_nowait({"type": "resync"})
+
+    def _resync_all(self):
+        with self._lock:
+            streams = [events for user_streams in self._streams.values() for events in user_streams]
+        for events in streams:
+            self._put(events, {"type": "resync"})
+
+    def _ensure_listeners(self):
+        """Start a listener per server, again in a child after a fork"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._streams.clear()
+            self._listening.clear()
+            for node in self.redis.nodes():
+                threading.Thread(
+                    target=self._listen, args=(node,), name=f"timesheet-events-{node.name}", daemon=True
+                ).start()
+
+    def stop(self):
+        """Let the listeners end within a second; they are started again by the next subscribe()"""
+        self._pid = None
+
+    def wait_until_listening(self, timeout=None):
+        """Block until every server's events are being received; returns False on timeout."""
+        self._ensure_listeners()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self._listening) < len(self.redis.nodes()):
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _listen(self, node):
+        """Pass on the events published on one server, reconnecting when needed"""
+        pid = os.getpid()
+        delay = 0.1
+        subscribed_before = False
+        while self._pid == pid:
+            pubsub = node.r.pubsub()
+            try:
+                pubsub.psubscribe(CHANNEL_PATTERN)
+                while not pubsub.get_message(timeout=1.0):
+                    pass
+                self._listening.add(node.name)
+                if subscribed_before:
+                    self._resync_all()
+                subscribed_before = True
+                delay = 0.1
+                while self._pid == pid:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "pmessage":
+                        user_id = message["channel"].split(":")[2]
+                        self.publish(user_id, json.loads(message["data"]))
+            except Exception as e:
+                logger.warning(f"Timesheet event listener for {node.name} failed: {e}")
+            finally:
+                self._listening.discard(node.name)
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
@@ -0,0 +1,162 @@
+import base64
+from datetime import datetime, timedelta
+
+TIMESTAMP_FORMAT = "%d/%m/%y - %H:%M:%S"
+
+# Fields that project_summaries() can return for each project
+SUMMARY_FIELDS = ("name", "active", "total_hours", "session_count", "last_start", "sessions")
+# Cheap to compute and small; session histories are only sent when asked for
+DEFAULT_SUMMARY_FIELDS = ("name", "active", "session_count")
+
+
+def parse_timestamp(timestamp):
+    """Parse a "dd/mm/yy - HH:MM:SS" session timestamp, about ten times faster than strptime."""
+    if len(timestamp) == 19:
+        try:
+            return datetime(2000 + int(timestamp[6:8]), int(timestamp[3:5]), int(timestamp[0:2]),
+                            int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))
+        except ValueError:
+            pass
+    return datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+
+
+def running_sessions(projects, names=None):
+    """Start of the running session of each project (of those in ``names``) that has one"""
+    return {
+        project["project_name"]: project["sessions"][-1]["start"]
+        for project in projects
+        if (names is None or project["project_name"] in names)
+        and project.get("sessions") and project["sessions"][-1].get("end") is None
+    }
+
+
+def encode_cursor(project_name):
+    """Opaque pagination cursor pointing after a project."""
+    return base64.urlsafe_b64encode(project_name.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Project name a cursor points after; raises ValueError if it is malformed."""
+    try:
+        return base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except (UnicodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def session_interval(session, now=None):
+    """Start and end of a session as datetimes; open sessions end now."""
+    start = parse_timestamp(session["start"])
+    end = parse_timestamp(session["end"]) if session.get("end") else (now or datetime.now())
+    return start, end
+
+
+def union_duration(intervals):
+    """Total time covered by (start, end) intervals, counting overlaps once."""
+    total = timedelta()
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is not None and start <= current_end:
+            current_end = max(current_end, end)
+            continue
+        if current_end is not None:
+            total += current_end - current_start
+        current_start, current_end = start, end
+    if current_end is not None:
+        total += current_end - current_start
+    return timedelta(seconds=round(total.total_seconds()))
+
+
+class TimesheetQueries:
+    """Read-only queries over ``self.projects`` shared by TimeTracker and RedisTimeTracker.
+
+    They build small per-project summaries in one pass over the sessions,
+    instead of handing out or serializing every project's full history.
+    """
+
+    def project_summaries(self, fields=None, limit=None, cursor=None, since=None, until=None):
+        """Return ``(summaries, next_cursor)`` for projects ordered by name.
+
+        ``fields`` selects keys from SUMMARY_FIELDS, ``limit`` and ``cursor``
+        page through the projects, and ``since``/``until`` (dates) restrict the
+        sessions and hours to the ones overlapping that window. ``next_cursor``
+        is None on the last page.
+        """
+        fields = tuple(fields or DEFAULT_SUMMARY_FIELDS)
+        unknown = [field for field in fields if field not in SUMMARY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        after = decode_cursor(cursor) if cursor else None
+
+        projects = sorted(
+            (p for p in self.projects if after is None or p["project_name"] > after),
+            key=lambda p: p["project_name"],
+        )
+        page = projects[:limit] if limit else projects
+        window = _window(since, until)
+        now = datetime.now()
+        summaries = [self._summarize(project, fields, window, now) for project in page]
+        next_cursor = encode_cursor(page[-1]["project_name"]) if limit and len(projects) > limit else None
+        return summaries, next_cursor
+
+    def active_sessions(self):
+        """Start of the running session of each project that has one"""
+        return running_sessions(self.projects)
+
+    def sessions_between(self, project_name, start, end, now=None):
+        """Return ``(session, start, end)`` for the project's sessions overlapping [start, end).
+
+        ``start`` and ``end`` are datetimes; running sessions end ``now``.
+        Sessions outside the window are skipped without building anything for them.
+        """
+        project = next((p for p in self.projects if p["project_name"] == project_name), None)
+        if project is None:
+            return []
+        now = now or datetime.now()
+        overlapping = []
+        for session in project.get("sessions", []):
+            session_start, session_end = session_interval(session, now)
+            if session_end >= start and session_start < end:
+                overlapping.append((session, session_start, session_end))
+        return overlapping
+
+    def _summarize(self, project, fields, window, now):
+        """Build the requested fields of one project's summary."""
+        sessions = project.get("sessions", [])
+        needs_intervals = window is not None or "total_hours" in fields
+        if needs_intervals:
+            selected, intervals = [], []
+            for session in sessions:
+                start, end = session_interval(session, now)
+                if window is not None:
+                    if end < window[0] or start >= window[1]:
+                        continue
+                    start, end = max(start, window[0]), min(end, window[1])
+                selected.append(session)
+                intervals.append((start, end))
+        else:
+            selected = sessions
+
+        summary = {}
+        for field in fields:
+            if field == "name":
+                summary["name"] = project["project_name"]
+            elif field == "active":
+                summary["active"] = bool(sessions) and sessions[-1].get("end") is None
+            elif field == "total_hours":
+                summary["total_hours"] = round(union_duration(intervals).total_seconds() / 3600, 2)
+            elif field == "session_count":
+                summary["session_count"] = len(selected)
+            elif field == "last_start":
+                summary["last_start"] = max((s["start"] for s in selected), key=parse_timestamp, default=None)
+            elif field == "sessions":
+                summary["sessions"] = selected
+        return summary
+
+
+def _window(since, until):
+    """The [since, until] date window as datetimes, or None if neither is given."""
+    if since is None and until is None:
+        return None
+    start = datetime.combine(since, datetime.min.time()) if since else datetime.min
+    end = datetime.combine(until + timedelta(days=1), datetime.min.time()) if until else datetime.max
+    return start, end
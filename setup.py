@@ -20,6 +20,6 @@ setup(
     entry_points={
         # If your package has scripts or executables, you can specify them here.
         # Example:
-        'console_scripts': ['presis=presis.__init__:main'],
+        'console_scripts': ['presis=presis:main'],
     },
 )
\ No newline at end of file
@@ -3,6 +3,11 @@ conftest.py - Pytest configuration file
 """
 import os
 import sys
+import time
+import shutil
+import socket
+import importlib
+import subprocess
 import pytest
 import stripe
 from flask import Flask, request, jsonify, render_template_string, flash
@@ -283,3 +288,61 @@ def stripe_test_cards():
 def test_price_id():
     """Stripe test price ID - replace with your test price ID if needed"""
     return 'price_1PPH0zBLvzmZ9ZyKpAcXdxAe'  # This is just a placeholder
+
+# Local redis-server processes for tests that need real Redis semantics across processes
+@pytest.fixture
+def redis_server_factory(tmp_path):
+    """Start redis-server processes on free ports; skips the test if Redis is not installed"""
+    executable = shutil.which('redis-server')
+    if not executable:
+        pytest.skip("redis-server is not installed")
+    processes = []
+
+    def start(*args):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        workdir = tmp_path / f"redis-{port}"
+        workdir.mkdir()
+        processes.append(subprocess.Popen(
+            [executable, '--port', str(port), '--bind', '127.0.0.1', '--save', '',
+             '--appendonly', 'no', '--dir', str(workdir), *args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ))
+        # Wait until the server accepts connections
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                return port
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError(f"redis-server did not start on port {port}")
+
+    yield start
+
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+@pytest.fixture
+def redis_app(monkeypatch):
+    """The real app module, storing everything on a fake Redis server"""
+    fakeredis = pytest.importorskip("fakeredis")
+    from presis.redis_backend import RedisBackend
+    server = fakeredis.FakeServer()
+    monkeypatch.setenv("PRESIS_NO_FSDB", "true")
+    monkeypatch.setenv("SECRET_KEY", "test")
+    monkeypatch.setattr(RedisBackend, "from_env", classmethod(
+        lambda cls, environ=None: RedisBackend(connection_class=fakeredis.FakeRedisConnection, server=server)))
+    # Imported as it is run, from its own directory where its config module is
+    monkeypatch.syspath_prepend(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+    monkeypatch.delitem(sys.modules, "app", raising=False)
+    module = importlib.import_module("app")
+    module.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    yield module
+    # Listener threads would otherwise keep polling the fake server for the rest of the run
+    module.event_hub.stop()
+    if module.redis_backend.timesheet_cache:
+        module.redis_backend.timesheet_cache.stop()
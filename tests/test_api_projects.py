@@ -0,0 +1,69 @@
+import os
+import sys
+import pytest
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture
+def api(redis_app):
+    """A test client and the headers authenticating it"""
+    user = redis_app.user_repository.create("user@example.com", "pw")
+    return redis_app.app.test_client(), {"Authorization": f"Bearer {user.generate_api_token()}"}
+
+
+def test_project_hours_are_not_cached_while_a_session_runs(api):
+    client, headers = api
+    client.post("/api/projects/alpha/toggle", headers=headers, json={})
+    for query in ("?fields=name,total_hours", "?fields=total_hours"):
+        assert client.get("/api/projects" + query, headers=headers).headers.get("ETag") is None
+    assert client.get("/api/projects?fields=name,active", headers=headers).headers.get("ETag")
+
+    client.post("/api/projects/alpha/toggle", headers=headers, json={})
+    assert client.get("/api/projects?fields=name,total_hours", headers=headers).headers.get("ETag")
+
+
+def test_manual_entry_returns_the_project_with_the_new_session(monkeypatch, request):
+    monkeypatch.setenv("TIMESHEET_CACHE_SIZE", "100")
+    redis_app = request.getfixturevalue("redis_app")
+    assert redis_app.redis_backend.timesheet_cache.wait_until_listening(timeout=5)
+    client, headers = request.getfixturevalue("api")
+    client.post("/api/projects/alpha/toggle", headers=headers, json={})
+    # Served from the cache from now on, and copied by the next change
+    assert len(client.get("/api/projects/alpha", headers=headers).get_json()["project"]["sessions"]) == 1
+
+    entry = {"start_date": "2025-01-01", "start_time": "09:00:00", "end_date": "2025-01-01", "end_time": "10:00:00"}
+    response = client.post("/api/projects/alpha/manual-entry", headers=headers, json=entry)
+    assert len(response.get_json()["project"]["sessions"]) == 2
+    assert response.get_json()["project"] == client.get("/api/projects/alpha", headers=headers).get_json()["project"]
+
+
+def test_reports_are_revalidated_until_a_session_runs(api):
+    client, headers = api
+    entry = {"start_date": "2025-01-01", "start_time": "09:00:00", "end_date": "2025-01-01", "end_time": "10:30:00"}
+    # Created stopped: a manual entry into a new project would also start a session
+    for name in ("alpha", "beta"):
+        client.post(f"/api/projects/{name}/toggle", headers=headers, json={})
+        client.post(f"/api/projects/{name}/toggle", headers=headers, json={})
+    client.post("/api/projects/alpha/manual-entry", headers=headers, json=entry)
+    client.post("/api/projects/beta/manual-entry", headers=headers, json=dict(entry, start_time="10:00:00"))
+
+    for url in ("/api/projects/alpha/report", "/api/report"):
+        response = client.get(url + "?from=2025-01-01&to=2025-01-01", headers=headers)
+        etag = response.headers["ETag"]
+        assert client.get(url, headers=dict(headers, **{"If-None-Match": etag})).status_code == 304
+    assert response.get_json()["total_hours"] == 2.0
+    assert [(p["project"], p["periods"]) for p in response.get_json()["projects"]] == [
+        ("alpha", [{"start": "2025-01-01", "hours": 1.5}]), ("beta", [{"start": "2025-01-01", "hours": 0.5}])]
+    report = client.get("/api/projects/alpha/report?group_by=month", headers=headers).get_json()
+    assert (report["project"], report["group_by"], report["total_hours"]) == ("alpha", "month", 1.5)
+
+    client.post("/api/projects/alpha/toggle", headers=headers, json={})
+    for url in ("/api/projects/alpha/report", "/api/report"):
+        response = client.get(url, headers=dict(headers, **{"If-None-Match": etag}))
+        assert response.status_code == 200 and response.headers.get("ETag") is None
+    # Another project's session does not keep this one from being revalidated
+    etag = client.get("/api/projects/beta/report", headers=headers).headers["ETag"]
+    assert client.get("/api/projects/beta/report", headers=dict(headers, **{"If-None-Match": etag})).status_code == 304
+    assert client.get("/api/projects/gamma/report", headers=headers).status_code == 404
@@ -0,0 +1,54 @@
+import io
+import os
+import sys
+import csv
+import json
+from datetime import date, datetime
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import presis
+from presis import export
+from presis.time_tracker import TimeTracker
+
+PROJECTS = [
+    {"project_name": "beta", "sessions": [
+        {"start": "03/01/25 - 09:00:00", "end": None, "comment": "running"},
+    ]},
+    {"project_name": "alpha", "sessions": [
+        {"start": "01/01/25 - 09:00:00", "end": "01/01/25 - 10:30:00", "comment": "a, b", "closing_comment": "done"},
+        {"start": "02/01/25 - 23:00:00", "end": "03/01/25 - 01:00:00", "comment": ""},
+    ]},
+]
+
+
+def test_records_are_windowed_and_timed():
+    now = datetime(2025, 1, 3, 12, 0, 0)
+    records = list(export.session_records(PROJECTS, since=date(2025, 1, 3), now=now))
+    assert records == [
+        {"project": "alpha", "start": "2025-01-02T23:00:00", "end": "2025-01-03T01:00:00",
+         "duration_seconds": 7200, "comment": "", "closing_comment": ""},
+        {"project": "beta", "start": "2025-01-03T09:00:00", "end": None,
+         "duration_seconds": 3 * 3600, "comment": "running", "closing_comment": ""},
+    ]
+    assert list(export.session_records(PROJECTS, until=date(2025, 1, 1), project_name="beta")) == []
+
+
+def test_cli_streams_csv_and_ndjson(tmp_path):
+    data_file = tmp_path / "data.json"
+    data_file.write_text(json.dumps({"projects": PROJECTS}))
+    tracker = TimeTracker(str(data_file))
+
+    out = io.StringIO()
+    presis.export_sessions(tracker, "csv", project_name="alpha", out=out)
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert [row["comment"] for row in rows] == ["a, b", ""]
+    assert rows[0]["duration_seconds"] == "5400"
+
+    out = io.StringIO()
+    presis.export_sessions(tracker, "ndjson", until=date(2025, 1, 1), out=out)
+    assert [json.loads(line)["closing_comment"] for line in out.getvalue().splitlines()] == ["done"]
+
+    # Only a header when there is nothing to export
+    assert "".join(export.iter_csv([])) == "project,start,end,duration_seconds,comment,closing_comment\r\n"
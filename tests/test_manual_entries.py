@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import pytest
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import presis
+from presis import manual_entries
+from presis.time_tracker import TimeTracker
+
+
+def entry(project, day, comment="", start="09:00:00", end="10:00:00"):
+    return {"project": project, "start_date": f"2025-01-{day:02d}", "start_time": start,
+            "end_date": f"2025-01-{day:02d}", "end_time": end, "comment": comment}
+
+
+def test_entries_are_validated_and_deduplicated(tmp_path):
+    data_file = tmp_path / "data.json"
+    data_file.write_text(json.dumps({"projects": [{"project_name": "alpha", "sessions": [
+        {"start": "01/01/25 - 09:00:00", "end": "01/01/25 - 10:00:00", "comment": "existing"},
+    ]}]}))
+    tracker = TimeTracker(str(data_file))
+
+    results = manual_entries.ingest(tracker, [
+        entry("alpha", 1),
+        entry("alpha", 2, "new"),
+        entry("beta", 2, "other project"),
+        entry("beta", 2, "repeated"),
+        entry("beta", 3, end="08:00:00"),
+        {"start_date": "2025-01-04"},
+        ValueError("Invalid JSON: Expecting value"),
+    ])
+    assert [r["status"] for r in results] == ["duplicate", "added", "added", "duplicate", "error", "error", "error"]
+    assert results[4]["error"] == "End must be after start"
+    assert results[6]["error"] == "Invalid JSON: Expecting value"
+
+    projects = TimeTracker(str(data_file)).projects
+    assert [s["comment"] for s in projects[0]["sessions"]] == ["existing", "new"]
+    assert projects[1] == {"project_name": "beta", "sessions": [
+        {"start": "02/01/25 - 09:00:00", "end": "02/01/25 - 10:00:00", "comment": "other project", "rev": None},
+    ]}
+
+
+def test_entries_are_written_to_redis_in_one_commit():
+    fakeredis = pytest.importorskip("fakeredis")
+    from presis.redis_backend import RedisBackend
+    from presis.redis_time_tracker import RedisTimeTracker
+
+    backend = RedisBackend(connection_class=fakeredis.FakeRedisConnection, server=fakeredis.FakeServer())
+    entries = [entry(project, day) for project in ("alpha", "beta") for day in range(1, 29)]
+    results = manual_entries.ingest(RedisTimeTracker(1, backend), entries)
+    assert all(r["status"] == "added" for r in results)
+    assert backend.stats["timesheet_commits"] == 1
+
+    # Importing the same entries again writes nothing
+    results = manual_entries.ingest(RedisTimeTracker(1, backend), entries)
+    assert all(r["status"] == "duplicate" for r in results)
+    assert backend.stats["timesheet_commits"] == 1
+    assert RedisTimeTracker(1, backend).current_version() == 1
+
+
+def test_cli_imports_ndjson_locally_when_offline(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(presis, "save_config", lambda config: None)
+    data_file = tmp_path / "data.json"
+    data_file.write_text(json.dumps({"projects": []}))
+    entries_file = tmp_path / "entries.ndjson"
+    entries_file.write_text("\n".join([
+        json.dumps(entry("alpha", 1)), "", "{not json", json.dumps(dict(entry(None, 2), project=None)),
+    ]))
+
+    tracker = TimeTracker(str(data_file))
+    presis.import_entries({"token": None}, tracker, str(entries_file), "default")
+    output = capsys.readouterr().out
+    assert "Entry 1: Invalid JSON" in output
+    assert "Imported 1 entries, skipped 0 duplicates." in output
+    assert [p["project_name"] for p in TimeTracker(str(data_file)).projects] == ["alpha"]
@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import pytest
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from presis.redis_backend import RedisBackend
+from presis.redis_user import RedisUserRepository
+from presis.redis_time_tracker import RedisTimeTracker
+
+
+@pytest.fixture
+def backend():
+    """RedisBackend talking to an in-memory fake Redis server"""
+    # Health checks would add PINGs to the round trip counts
+    return RedisBackend(
+        connection_class=fakeredis.FakeRedisConnection,
+        server=fakeredis.FakeServer(),
+        health_check_interval=0,
+    )
+
+
+@pytest.fixture
+def round_trips(backend, monkeypatch):
+    """Count the requests sent to Redis; a pipeline is sent as one request"""
+    # Open the pooled connections before counting
+    backend.r.ping()
+    backend.raw.ping()
+    sent = []
+    connection_class = backend.pool.connection_class
+    send_packed_command = connection_class.send_packed_command
+
+    def counting_send(self, command, *args, **kwargs):
+        sent.append(command)
+        return send_packed_command(self, command, *args, **kwargs)
+
+    monkeypatch.setattr(connection_class, "send_packed_command", counting_send)
+    return sent
+
+
+def test_shared_backend_is_reused():
+    first = RedisBackend.shared(host="localhost", port=6390)
+    assert RedisBackend.shared(host="localhost", port=6390) is first
+    assert RedisBackend.shared(host="localhost", port=6391) is not first
+
+
+def test_from_env_configures_pool():
+    backend = RedisBackend.from_env({
+        "REDIS_HOST": "redis.internal",
+        "REDIS_MAX_CONNECTIONS": "7",
+        "REDIS_SOCKET_TIMEOUT": "2.5",
+        "REDIS_HEALTH_CHECK_INTERVAL": "15",
+    })
+    kwargs = backend.pool.connection_kwargs
+    assert backend.pool.max_connections == 7
+    assert kwargs["host"] == "redis.internal"
+    assert kwargs["socket_timeout"] == 2.5
+    assert kwargs["socket_keepalive"] is True
+    assert kwargs["health_check_interval"] == 15
+
+
+def test_batch_sends_one_round_trip(backend, round_trips):
+    with backend.batch() as pipe:
+        for i in range(10):
+            pipe.set(f"key:{i}", i)
+    assert len(round_trips) == 1
+    assert backend.r.get("key:9") == "9"
+
+
+def test_user_methods_round_trips(backend, round_trips):
+    repository = RedisUserRepository(backend)
+    round_trips.clear()
+
+    # Email check, ID allocation and the pipelined save
+    user = repository.create("a@example.com", "secret")
+    assert len(round_trips) == 3
+    assert user.id == 1
+    assert repository.create("b@example.com", "secret").id == 2
+
+    round_trips.clear()
+    user.save()
+    assert len(round_trips) == 1
+
+    backend.create_user("kivy", "secret")
+    assert backend.authenticate_user("kivy", "secret")
+
+
+def test_listing_users_is_batched(backend, round_trips):
+    repository = RedisUserRepository(backend)
+    for i in range(25):
+        repository.create(f"user{i}@example.com", "secret")
+
+    round_trips.clear()
+    users = repository.all()
+    assert len(users) == 25
+    # One SCAN and one MGET instead of a GET per user
+    assert len(round_trips) == 2
+
+
+def test_tracker_round_trips(backend, round_trips):
+    tracker = RedisTimeTracker(1, backend)
+    tracker.projects
+    assert len(round_trips) == 1
+
+    round_trips.clear()
+    tracker.add_or_update_project("alpha", "start")
+    # WATCH, version check and MULTI/EXEC
+    assert len(round_trips) == 3
+
+
+def test_request_unit_of_work_round_trips(backend, round_trips):
+    # A toggle request: load, check the project, toggle it, then flush at the end
+    tracker = RedisTimeTracker(1, backend, autoflush=False)
+    tracker.get_project("alpha")
+    tracker.add_or_update_project("alpha", "start")
+    tracker.get_project("alpha")
+    tracker.flush()
+    assert len(round_trips) == 4
+
+
+def test_large_timesheets_are_compressed(backend):
+    tracker = RedisTimeTracker(1, backend)
+    for day in range(1, 29):
+        tracker.add_manual_session("alpha", f"2025-02-{day:02d}", "09:00:00", f"2025-02-{day:02d}", "17:00:00", "work")
+
+    stored = backend.raw.get("timesheet:user:1")
+    assert stored[:1] == b"\x01"
+    plain = json.dumps({"projects": tracker.projects}).encode()
+    assert len(stored) < len(plain) / 4
+    assert RedisTimeTracker(1, backend).projects == tracker.projects
+
+
+def test_legacy_uncompressed_timesheets_are_read(backend):
+    projects = [{"project_name": "alpha", "sessions": [
+        {"start": "01/01/25 - 10:00:00", "end": "01/01/25 - 11:00:00", "comment": "legacy"},
+    ]}]
+    backend.r.set("timesheet:user:1", json.dumps({"projects": projects}))
+
+    tracker = RedisTimeTracker(1, backend)
+    assert tracker.projects == projects
+    tracker.add_or_update_project("alpha", "start")
+    assert len(RedisTimeTracker(1, backend).get_project("alpha")["sessions"]) == 2
+
+
+def test_compression_can_be_disabled(backend):
+    backend.compress_min_bytes = 0
+    assert backend.encode_timesheet({"projects": [{"project_name": "x" * 5000}]})[:1] == b"{"
+
+
+def test_reset_after_fork_drops_inherited_connections(backend):
+    backend.r.set("key", "value")
+    backend.stats["timesheet_commits"] += 1
+    inherited = backend.pool._available_connections[0]
+
+    backend.reset_after_fork()
+    assert backend.pool._available_connections == []
+    assert not backend.stats
+    # New connections are opened on demand
+    assert backend.r.get("key") == "value"
+    assert backend.pool._available_connections[0] is not inherited
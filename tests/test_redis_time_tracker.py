@@ -0,0 +1,159 @@
+import os
+import sys
+import pytest
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from presis.redis_backend import RedisBackend
+from presis.redis_time_tracker import RedisTimeTracker, TimesheetConflictError
+
+
+@pytest.fixture
+def backend():
+    """RedisBackend talking to an in-memory fake Redis server"""
+    return RedisBackend(connection_class=fakeredis.FakeRedisConnection, server=fakeredis.FakeServer())
+
+
+def stored_projects(backend, user_id):
+    return backend.decode_timesheet(backend.raw.get(f"timesheet:user:{user_id}"))["projects"]
+
+
+def test_toggle_persists_and_bumps_version(backend):
+    tracker = RedisTimeTracker(1, backend)
+    assert tracker.version == 0
+
+    tracker.add_or_update_project("alpha", "start")
+    assert tracker.version == 1
+    tracker.add_or_update_project("alpha", "stop")
+    assert tracker.version == 2
+
+    sessions = stored_projects(backend, 1)[0]["sessions"]
+    assert len(sessions) == 1
+    assert sessions[0]["end"] is not None
+    assert sessions[0]["closing_comment"] == "stop"
+
+
+def test_concurrent_writers_do_not_lose_sessions(backend):
+    first = RedisTimeTracker(1, backend)
+    second = RedisTimeTracker(1, backend)
+    # Both requests read the same generation before either writes
+    assert first.projects == second.projects == []
+
+    first.add_or_update_project("alpha", "from worker one")
+    second.add_or_update_project("beta", "from worker two")
+
+    names = sorted(p["project_name"] for p in stored_projects(backend, 1))
+    assert names == ["alpha", "beta"]
+    assert second.version == 2
+    assert backend.stats["timesheet_conflicts"] == 1
+    assert backend.get_stats()["total"]["conflicts"] == 1
+
+
+def test_conflicting_toggles_on_same_project_are_replayed(backend):
+    RedisTimeTracker(1, backend).add_or_update_project("alpha", "start")
+
+    first = RedisTimeTracker(1, backend)
+    second = RedisTimeTracker(1, backend)
+    first.projects, second.projects
+
+    # The first stops the session; the second's toggle is replayed on top and
+    # starts a new one instead of stopping the already stopped session again
+    first.add_or_update_project("alpha", "stop")
+    second.add_or_update_project("alpha", "restart")
+
+    sessions = stored_projects(backend, 1)[0]["sessions"]
+    assert len(sessions) == 2
+    assert sessions[0]["closing_comment"] == "stop"
+    assert sessions[1]["end"] is None
+    assert sessions[1]["comment"] == "restart"
+
+
+def test_save_data_refuses_to_overwrite_newer_data(backend):
+    stale = RedisTimeTracker(1, backend)
+    stale.projects
+    RedisTimeTracker(1, backend).add_or_update_project("alpha", "start")
+
+    stale.projects.append({"project_name": "beta", "sessions": []})
+    with pytest.raises(TimesheetConflictError):
+        stale.save_data()
+    assert [p["project_name"] for p in stored_projects(backend, 1)] == ["alpha"]
+
+
+def test_merge_projects(backend):
+    tracker = RedisTimeTracker(1, backend)
+    tracker.add_manual_session("alpha", "2025-01-01", "10:00:00", "2025-01-01", "11:00:00", "a")
+    tracker.add_manual_session("beta", "2025-01-02", "10:00:00", "2025-01-02", "11:00:00", "b")
+
+    success, _ = tracker.merge_projects("beta", "alpha")
+    assert success
+    projects = stored_projects(backend, 1)
+    assert [p["project_name"] for p in projects] == ["alpha"]
+    assert len(projects[0]["sessions"]) == 2
+
+
+def test_deferred_writes_are_committed_once(backend):
+    tracker = RedisTimeTracker(1, backend, autoflush=False)
+    tracker.add_or_update_project("alpha", "start")
+    tracker.add_manual_session("beta", "2025-01-01", "10:00:00", "2025-01-01", "11:00:00", "b")
+    assert tracker.dirty
+    assert backend.r.get("timesheet:user:1") is None
+
+    tracker.flush()
+    assert not tracker.dirty
+    assert tracker.version == 1
+    assert [p["project_name"] for p in stored_projects(backend, 1)] == ["alpha", "beta"]
+
+
+def test_project_versions_only_change_with_their_project(backend):
+    tracker = RedisTimeTracker(1, backend)
+    tracker.add_or_update_project("alpha", "start")
+    tracker.add_or_update_project("beta", "start")
+    assert tracker.current_version() == 2
+    assert tracker.current_version("alpha") == 1
+    assert tracker.current_version("beta") == 2
+
+    tracker.merge_projects("beta", "alpha")
+    assert tracker.current_version("alpha") == tracker.current_version("beta") == 3
+    assert RedisTimeTracker(1, backend).current_version("gamma") == 0
+
+
+def test_concurrent_retries_of_an_operation_apply_it_once(backend):
+    op = {"key": "k1", "op": "toggle", "project_name": "alpha", "comment": "start", "at": "01/01/25 - 09:00:00"}
+    first = RedisTimeTracker(1, backend, autoflush=False)
+    second = RedisTimeTracker(1, backend, autoflush=False)
+    # Both requests find the key unused before either of them writes
+    assert first.apply_ops([op])[0]["status"] == "applied"
+    assert second.apply_ops([op])[0]["status"] == "applied"
+    first.flush()
+    # The second write conflicts, is replayed and finds the key taken
+    second.flush()
+
+    sessions = stored_projects(backend, 1)[0]["sessions"]
+    assert [(s["start"], s["end"]) for s in sessions] == [("01/01/25 - 09:00:00", None)]
+    assert RedisTimeTracker(1, backend).sync(2, [], [op])["results"][0]["status"] == "duplicate"
+
+
+def test_running_sessions_are_indexed_by_every_write(backend):
+    from datetime import datetime
+    from presis import open_sessions
+    first, second = RedisTimeTracker(1, backend), RedisTimeTracker(2, backend)
+    first.add_or_update_project("alpha", "start", at="01/01/25 - 09:00:00")
+    first.add_or_update_project("beta", "start", at="01/01/25 - 11:00:00")
+    second.add_or_update_project("alpha", "start", at="01/01/25 - 10:00:00")
+    second.add_manual_session("gamma", "2025-01-01", "08:00:00", "2025-01-01", "09:00:00", "done")
+    first.add_or_update_project("alpha", "stop")
+
+    assert RedisTimeTracker(1, backend).active_sessions() == {"beta": "01/01/25 - 11:00:00"}
+    assert [(user, project) for user, project, _ in open_sessions.open_before(backend, datetime(2025, 1, 2))] == [
+        ("2", "alpha"), ("1", "beta")]
+    assert open_sessions.open_before(backend, datetime(2025, 1, 1, 10, 30)) == [
+        ("2", "alpha", datetime(2025, 1, 1, 10).timestamp())]
+
+    # Timesheets written before the index are indexed by a rebuild
+    backend.r.delete(open_sessions.KEY, open_sessions.active_key(1), open_sessions.active_key(2))
+    assert open_sessions.rebuild(backend) == 2
+    assert open_sessions.count(backend) == 2
+    assert second.active_sessions() == {"alpha": "01/01/25 - 10:00:00"}
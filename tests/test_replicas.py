@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import pytest
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from presis.redis_backend import RedisBackend
+from presis.redis_user import RedisUserRepository
+from presis.redis_time_tracker import RedisTimeTracker
+
+
+@pytest.fixture
+def backend():
+    """Fake primary with one fake replica, which is only updated by replicate()"""
+    replica = {"name": "replica", "connection_class": fakeredis.FakeRedisConnection, "server": fakeredis.FakeServer()}
+    return RedisBackend(
+        connection_class=fakeredis.FakeRedisConnection, server=fakeredis.FakeServer(), replicas=[replica])
+
+
+def replicate(backend):
+    """Copy every key of the primary to its replica"""
+    replica = backend.primary.replicas[0].raw
+    replica.flushall()
+    for key in backend.raw.scan_iter():
+        replica.restore(key, 0, backend.raw.dump(key))
+
+
+def test_tracker_reads_replica_unless_it_is_behind(backend):
+    RedisTimeTracker(1, backend).add_or_update_project("alpha", "start")
+    replicate(backend)
+    RedisTimeTracker(1, backend).add_or_update_project("beta", "start")
+
+    # Another client accepts the replica's slightly older copy
+    tracker = RedisTimeTracker(1, backend, replica_reads=True)
+    assert [p["project_name"] for p in tracker.projects] == ["alpha"]
+    assert backend.stats["replica_reads"] == 1
+
+    # The client that wrote version 2 is sent to the primary
+    tracker = RedisTimeTracker(1, backend, min_version=2, replica_reads=True)
+    assert [p["project_name"] for p in tracker.projects] == ["alpha", "beta"]
+    assert backend.stats["replica_stale_reads"] == 1
+
+
+def test_writes_after_replica_read_go_to_primary(backend):
+    RedisTimeTracker(1, backend).add_or_update_project("alpha", "start")
+    replicate(backend)
+    RedisTimeTracker(1, backend).add_or_update_project("beta", "start")
+
+    tracker = RedisTimeTracker(1, backend, replica_reads=True)
+    tracker.add_or_update_project("gamma", "start")
+    names = [p["project_name"] for p in RedisTimeTracker(1, backend).projects]
+    assert names == ["alpha", "beta", "gamma"]
+
+
+def test_unreachable_replica_falls_back_to_primary(backend):
+    backend.primary.replicas[0].pool.connection_kwargs["server"].connected = False
+    repository = RedisUserRepository(backend)
+    repository.create("a@example.com", "pw")
+    RedisTimeTracker(1, backend).add_or_update_project("alpha", "start")
+
+    assert len(RedisTimeTracker(1, backend, replica_reads=True).projects) == 1
+    assert [u.email for u in repository.all(replica=True)] == ["a@example.com"]
+    assert backend.stats["replica_errors"] == 2
+
+
+def test_primary_replica_pair(redis_server_factory):
+    primary_port = redis_server_factory()
+    replica_port = redis_server_factory('--replicaof', '127.0.0.1', str(primary_port))
+    backend = RedisBackend(port=primary_port, replicas=[f"redis://127.0.0.1:{replica_port}/0"])
+    tracker = RedisTimeTracker(1, backend)
+    tracker.add_or_update_project("alpha", "start")
+
+    # Reads never return data older than the client's own last write
+    for _ in range(100):
+        reader = RedisTimeTracker(1, backend, min_version=tracker.version, replica_reads=True)
+        assert [p["project_name"] for p in reader.projects] == ["alpha"]
+        if backend.stats["replica_reads"]:
+            break
+        time.sleep(0.05)
+    assert backend.stats["replica_reads"] == 1
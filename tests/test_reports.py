@@ -0,0 +1,97 @@
+import os
+import sys
+import pytest
+from datetime import date, datetime, timedelta
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from presis.reports import DailyReport, grouped_hours
+from presis.report_cache import ReportCache
+
+
+def test_running_sessions_are_added_at_read_time():
+    report = DailyReport([
+        {"start": "01/01/25 - 22:00:00", "end": "02/01/25 - 02:00:00", "comment": "late"},
+        {"start": "02/01/25 - 09:00:00", "end": "02/01/25 - 11:00:00", "comment": "closed"},
+        # Overlaps the closed session above, which is only counted once
+        {"start": "02/01/25 - 10:00:00", "end": None, "comment": "running"},
+    ])
+    days = report.days(now=datetime(2025, 1, 2, 12, 0, 0))
+    assert [(day, hours) for day, hours, _ in days] == [
+        (date(2025, 1, 1), timedelta(hours=2)),
+        (date(2025, 1, 2), timedelta(hours=5)),
+    ]
+    assert [s["comment"] for s in days[1][2]] == ["late", "closed", "running"]
+
+    # The same report, read later, counts the running session up to then
+    assert report.total_hours(now=datetime(2025, 1, 3, 1, 0, 0)) == timedelta(hours=2 + 17 + 1)
+
+
+def test_report_cache_is_versioned_and_bounded():
+    cache = ReportCache(maxsize=2)
+    cache.put(1, "alpha", "v1", "alpha report")
+    cache.put(1, "beta", "v1", "beta report")
+    assert cache.get(1, "alpha", "v1") == "alpha report"
+    assert cache.get(1, "alpha", "v2") is None
+
+    # The least recently used report is dropped
+    cache.put(2, "alpha", "v1", "other user")
+    assert cache.get(1, "beta", "v1") is None
+    assert cache.get(1, "alpha", "v1") == "alpha report"
+    assert len(cache) == 2
+
+
+def test_days_are_grouped_into_weeks_and_months():
+    report = DailyReport([
+        {"start": "31/01/25 - 09:00:00", "end": "31/01/25 - 11:00:00", "comment": ""},
+        {"start": "02/02/25 - 09:00:00", "end": "02/02/25 - 10:00:00", "comment": ""},
+        {"start": "03/02/25 - 09:00:00", "end": "03/02/25 - 09:30:00", "comment": ""},
+    ])
+    days = report.days()
+    assert grouped_hours(days, "week") == [
+        (date(2025, 1, 27), timedelta(hours=3)),
+        (date(2025, 2, 3), timedelta(minutes=30)),
+    ]
+    assert grouped_hours(days, "month", since=date(2025, 2, 1)) == [(date(2025, 2, 1), timedelta(hours=1.5))]
+    with pytest.raises(ValueError):
+        grouped_hours(days, "year")
+
+
+def test_calendar_events_are_revalidated_until_one_is_running(redis_app):
+    redis_app.user_repository.create("user@example.com", "pw")
+    client = redis_app.app.test_client()
+    client.post("/login", data={"email": "user@example.com", "password": "pw"})
+    client.post("/project/create", data={"project_name": "alpha"})
+    client.post("/project/alpha/toggle", data={"comment": "done"})
+    client.post("/project/alpha/add-entry", data={
+        "start_date": "2025-01-01", "start_time": "22:00:00", "end_date": "2025-01-02", "end_time": "01:30:00",
+        "comment": "late", "closing_comment": "shipped"})
+    client.post("/project/alpha/add-entry", data={
+        "start_date": "2025-01-05", "start_time": "09:00:00", "end_date": "2025-01-05", "end_time": "10:00:00"})
+
+    url = "/project/alpha/events?start=2025-01-01T00:00:00Z&end=2025-01-02T00:00:00Z"
+    response = client.get(url)
+    assert response.get_json() == [{
+        "title": "late",
+        "start": "2025-01-01T22:00:00",
+        "end": "2025-01-02T01:30:00",
+        "extendedProps": {
+            "date": "2025-01-01", "hours": 3.5, "timeRange": "01/01/25 - 22:00:00 - 02/01/25 - 01:30:00",
+            "comment": "late", "closingComment": "shipped"},
+    }]
+    etag = response.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    # Running, but outside the window: the events shown stay the same until the next write
+    client.post("/project/alpha/toggle", data={})
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and len(response.get_json()) == 1
+    etag = response.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    events = client.get("/project/alpha/events?start=2025-01-01&end=2100-01-01").get_json()
+    assert events[-1]["extendedProps"]["timeRange"].endswith(" - ongoing")
+    assert client.get("/project/alpha/events?start=2025-01-01&end=2100-01-01").headers.get("ETag") is None
+
+    assert client.get("/project/alpha/events?start=2025-01-01").status_code == 400
+    assert client.get("/project/beta/events?start=2025-01-01&end=2025-01-02").status_code == 404
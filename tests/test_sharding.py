@@ -0,0 +1,124 @@
+import os
+import sys
+from collections import Counter
+import pytest
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from presis.hash_ring import HashRing
+from presis.redis_backend import RedisBackend
+from presis.redis_user import RedisUserRepository
+from presis.redis_time_tracker import RedisTimeTracker
+from presis.rebalance import rebalance
+
+
+def fake_shard(name):
+    return {"name": name, "connection_class": fakeredis.FakeRedisConnection, "server": fakeredis.FakeServer()}
+
+
+def make_backend(shards):
+    return RedisBackend(
+        connection_class=fakeredis.FakeRedisConnection, server=fakeredis.FakeServer(), shards=shards)
+
+
+def test_ring_spreads_keys_and_moves_few_on_growth():
+    ring = HashRing(["a", "b", "c"])
+    before = {user_id: ring.get_node(user_id) for user_id in range(3000)}
+    counts = Counter(before.values())
+    assert all(800 < count < 1200 for count in counts.values())
+
+    ring.add_node("d")
+    moved = [user_id for user_id in before if ring.get_node(user_id) != before[user_id]]
+    # Only keys taken over by the new node move, about a quarter of them
+    assert all(ring.get_node(user_id) == "d" for user_id in moved)
+    assert 550 < len(moved) < 950
+
+
+def test_user_keys_live_on_their_shard():
+    shards = [fake_shard("one"), fake_shard("two")]
+    backend = make_backend(shards)
+    repository = RedisUserRepository(backend)
+    users = [repository.create(f"user{i}@example.com", "pw") for i in range(20)]
+    for user in users:
+        RedisTimeTracker(user.id, backend).add_or_update_project("alpha", "start")
+
+    shard_names = set()
+    for user in users:
+        shard = backend.shard_for_user(user.id)
+        shard_names.add(shard.name)
+        assert shard.r.exists(f"user:{user.id}", f"timesheet:user:{user.id}") == 2
+        assert repository.get(user.id).email == user.email
+        assert repository.filter_by(email=user.email).first().id == user.id
+    assert shard_names == {"one", "two"}
+    # Global keys stay on the primary
+    assert backend.r.get("next_user_id") is not None
+    assert sorted(u.id for u in repository.all()) == sorted(u.id for u in users)
+
+    repository.delete(users[0])
+    assert repository.get(users[0].id) is None
+    assert repository.filter_by(email=users[0].email).first() is None
+
+
+def test_rebalance_moves_only_keys_of_the_new_shard():
+    shards = [fake_shard("one"), fake_shard("two")]
+    backend = make_backend(shards)
+    repository = RedisUserRepository(backend)
+    users = [repository.create(f"user{i}@example.com", "pw") for i in range(30)]
+    for user in users:
+        RedisTimeTracker(user.id, backend).add_or_update_project("alpha", "start")
+
+    # The same servers plus a new one, as after adding it to REDIS_SHARDS
+    grown = RedisBackend(
+        connection_class=fakeredis.FakeRedisConnection,
+        server=backend.pool.connection_kwargs["server"],
+        shards=shards + [fake_shard("three")],
+    )
+    planned = rebalance(grown, dry_run=True)
+    assert set(target for _, target in planned) == {"three"}
+
+    moved = rebalance(grown)
+    assert moved == planned
+    assert rebalance(grown, dry_run=True) == Counter()
+    grown_repository = RedisUserRepository(grown)
+    for user in users:
+        assert grown_repository.get(user.id).email == user.email
+        tracker = RedisTimeTracker(user.id, grown)
+        assert tracker.version == 1
+        assert tracker.projects[0]["project_name"] == "alpha"
+
+
+def test_primary_listed_with_credentials_is_one_server():
+    server = fakeredis.FakeServer()
+    settings = dict(connection_class=fakeredis.FakeRedisConnection, server=server, host="redis", password="pw")
+    backend = RedisBackend(**settings)
+    repository = RedisUserRepository(backend)
+    users = [repository.create(f"user{i}@example.com", "pw") for i in range(20)]
+
+    # The primary under its own URL, plus a new server
+    grown = RedisBackend(**settings, shards=["redis://:pw@redis:6379", fake_shard("two")])
+    assert grown.shards["redis://redis:6379/0"] is grown.primary and len(grown.nodes()) == 2
+    assert len(RedisUserRepository(grown).all()) == 20
+    moved = rebalance(grown)
+    assert set(moved) == {("redis://redis:6379/0", "two")}
+    assert sorted(u.id for u in RedisUserRepository(grown).all()) == sorted(u.id for u in users)
+    # Named shards are placed by name whatever their URL, and loopback addresses are one server
+    local = RedisBackend(connection_class=fakeredis.FakeRedisConnection, server=server,
+                         shards=["one=redis://:new@127.0.0.1:6379/0", fake_shard("two")])
+    assert local.shards["one"] is local.primary
+
+
+def test_shards_on_separate_servers(redis_server_factory):
+    ports = [redis_server_factory() for _ in range(3)]
+    backend = RedisBackend(
+        port=ports[0], shards=[f"redis://127.0.0.1:{port}/0" for port in ports[1:]])
+    repository = RedisUserRepository(backend)
+    users = [repository.create(f"user{i}@example.com", "pw") for i in range(10)]
+    for user in users:
+        RedisTimeTracker(user.id, backend).add_or_update_project("alpha", "start")
+
+    assert {backend.shard_for_user(user.id).name for user in users} == set(backend.shards)
+    assert backend.r.keys("timesheet:*") == []
+    assert sorted(u.id for u in repository.all()) == sorted(u.id for u in users)
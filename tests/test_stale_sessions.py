@@ -0,0 +1,83 @@
+import os
+import sys
+from datetime import datetime
+import pytest
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from presis import open_sessions
+from presis.redis_backend import RedisBackend
+from presis.redis_user import RedisUserRepository
+from presis.redis_time_tracker import RedisTimeTracker
+from presis.stale_sessions import AUTO_CLOSE_COMMENT, find_stale, close_stale
+
+NOW = datetime(2025, 1, 2, 12, 0)
+
+
+@pytest.fixture(params=[False, True], ids=["single", "sharded"])
+def backend(request):
+    """One server, or a primary and a shard holding the users"""
+    shards = [{"name": "shard", "connection_class": fakeredis.FakeRedisConnection, "server": fakeredis.FakeServer()}]
+    return RedisBackend(connection_class=fakeredis.FakeRedisConnection, server=fakeredis.FakeServer(),
+                        shards=shards if request.param else None)
+
+
+def last_session(backend, user, project_name):
+    return RedisTimeTracker(user.id, backend).get_project(project_name)["sessions"][-1]
+
+
+def test_sessions_running_past_their_user_threshold_are_closed(backend):
+    repository = RedisUserRepository(backend)
+    users = [repository.create(f"user{i}@example.com", "pw") for i in range(6)]
+    users[0].stale_session_hours = 30
+    users[0].save()
+    for user in users:
+        tracker = RedisTimeTracker(user.id, backend)
+        tracker.add_or_update_project("old", "forgot", at="01/01/25 - 09:00:00")
+        tracker.add_or_update_project("recent", "working", at="02/01/25 - 10:00:00")
+    RedisTimeTracker(users[1].id, backend).add_or_update_project("old", "done")
+    # Deleted without its entries being removed
+    backend.r.zadd(open_sessions.KEY, {open_sessions.member(99, "gone"): 0})
+    # Scored an hour off, as around a DST change: the stored start still matches
+    backend.r.zadd(open_sessions.KEY, {open_sessions.member(users[3].id, "old"): open_sessions.score(
+        "01/01/25 - 10:00:00")})
+
+    stale, orphans = find_stale(backend, default_hours=12, now=NOW)
+    assert sorted(stale) == sorted(str(user.id) for user in users[2:]) and orphans == [("99", "gone")]
+    # Stopped after the index was read
+    RedisTimeTracker(users[2].id, backend).add_or_update_project("old", "done")
+    summary = close_stale(backend, stale, orphans, batch_size=2)
+
+    assert (summary["closed"], summary["users"], summary["outdated"], summary["orphans"]) == (3, 3, 1, 1)
+    closed = last_session(backend, users[3], "old")
+    assert (closed["end"], closed["closing_comment"]) == ("01/01/25 - 21:00:00", AUTO_CLOSE_COMMENT)
+    assert last_session(backend, users[2], "old")["closing_comment"] == "done"
+    assert last_session(backend, users[0], "old")["end"] is None
+    assert all(last_session(backend, user, "recent")["end"] is None for user in users)
+    # Only the sessions within their thresholds are left in the index
+    assert sorted(open_sessions.parse_member(m)[1] for m in backend.r.zrange(open_sessions.KEY, 0, -1)) == \
+        ["old"] + ["recent"] * 6
+    assert find_stale(backend, default_hours=12, now=NOW) == ({}, [])
+
+
+def test_profile_page_sets_the_threshold(redis_app):
+    user = redis_app.user_repository.create("user@example.com", "pw")
+    client = redis_app.app.test_client()
+    client.post("/login", data={"email": "user@example.com", "password": "pw"})
+    page = client.get("/profile")
+    assert page.status_code == 200 and b'name="stale_session_hours"' in page.data
+
+    client.post("/profile/stale-sessions", data={"stale_session_hours": "30"})
+    assert redis_app.user_repository.get(user.id).stale_session_hours == 30
+    client.post("/profile/stale-sessions", data={"stale_session_hours": "500"})
+    assert redis_app.user_repository.get(user.id).stale_session_hours == 30
+    client.post("/profile/stale-sessions", data={"stale_session_hours": ""})
+    assert redis_app.user_repository.get(user.id).stale_session_hours is None
+
+    # Filesystem storage has no maintenance job, so no setting either
+    with redis_app.app.test_request_context("/profile"):
+        redis_app.login_user(user)
+        assert 'name="stale_session_hours"' not in redis_app.render_template("profile.html", stale_sessions=False)
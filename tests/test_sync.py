@@ -0,0 +1,306 @@
+import os
+import sys
+import gzip
+import json
+import pytest
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import presis
+from presis.time_tracker import TimeTracker
+from presis.outbox import Outbox, parse_op
+from presis.redis_backend import RedisBackend
+from presis.redis_time_tracker import RedisTimeTracker
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self):
+        return self.payload
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    """Route the CLI's /api/v2/sync and /api/ops calls to a Redis tracker, recording the requests"""
+    backend = RedisBackend(connection_class=fakeredis.FakeRedisConnection, server=fakeredis.FakeServer())
+    requests_sent = []
+
+    def post(session, url, data=None, headers=None, **kwargs):
+        if headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        body = json.loads(data)
+        requests_sent.append(body)
+        tracker = RedisTimeTracker(1, backend, autoflush=False)
+        if url.endswith("/api/ops"):
+            result = tracker.sync(body["cursor"], body["changes"], [parse_op(op) for op in body["ops"]])
+        else:
+            assert url.endswith("/api/v2/sync")
+            result = tracker.sync(body["cursor"], body["changes"])
+        # Round trip through JSON like the real API
+        return FakeResponse(json.loads(json.dumps(result)))
+
+    monkeypatch.setattr(presis.requests.Session, "post", post)
+    monkeypatch.setattr(presis, "save_config", lambda config: None)
+    monkeypatch.setattr(presis, "OUTBOX_FILE", str(tmp_path / "outbox.ndjson"))
+    return backend, requests_sent
+
+
+def make_client(tmp_path, name):
+    data_file = tmp_path / f"{name}.json"
+    data_file.write_text(json.dumps({"projects": []}))
+    return TimeTracker(str(data_file)), {"server_url": "http://server", "token": "t"}
+
+
+def test_clients_exchange_only_changed_sessions(server, tmp_path):
+    backend, requests_sent = server
+    laptop, laptop_config = make_client(tmp_path, "laptop")
+    desktop, desktop_config = make_client(tmp_path, "desktop")
+
+    laptop.add_manual_session("alpha", "2025-01-01", "09:00:00", "2025-01-01", "10:00:00", "one")
+    laptop.add_manual_session("alpha", "2025-01-02", "09:00:00", "2025-01-02", "10:00:00", "two")
+    assert presis.sync_with_server(laptop_config, laptop)
+    assert presis.sync_with_server(desktop_config, desktop)
+    assert len(desktop.projects[0]["sessions"]) == 2
+
+    # An incremental sync sends and receives the new session only
+    desktop.add_manual_session("alpha", "2025-01-03", "09:00:00", "2025-01-03", "10:00:00", "three")
+    assert presis.sync_with_server(desktop_config, desktop)
+    assert [s["comment"] for s in requests_sent[-1]["changes"][0]["sessions"]] == ["three"]
+    assert presis.sync_with_server(laptop_config, laptop)
+    assert requests_sent[-1]["changes"] == []
+    assert [s["comment"] for s in laptop.projects[0]["sessions"]] == ["one", "two", "three"]
+
+    # Local data was saved with server revisions, so nothing is resent
+    reloaded = TimeTracker(laptop.json_file)
+    assert all(isinstance(s["rev"], int) for s in reloaded.projects[0]["sessions"])
+
+
+def test_stopping_a_session_and_merging_projects_are_synced(server, tmp_path):
+    backend, requests_sent = server
+    laptop, laptop_config = make_client(tmp_path, "laptop")
+    desktop, desktop_config = make_client(tmp_path, "desktop")
+    laptop.add_or_update_project("alpha", "start")
+    laptop.add_manual_session("beta", "2025-01-02", "09:00:00", "2025-01-02", "10:00:00", "b")
+    presis.sync_with_server(laptop_config, laptop)
+    presis.sync_with_server(desktop_config, desktop)
+
+    desktop.add_or_update_project("alpha", "stop")
+    presis.sync_with_server(desktop_config, desktop)
+    server_tracker = RedisTimeTracker(1, backend)
+    server_tracker.merge_projects("beta", "alpha")
+
+    presis.sync_with_server(laptop_config, laptop)
+    assert [p["project_name"] for p in laptop.projects] == ["alpha"]
+    sessions = laptop.projects[0]["sessions"]
+    assert sessions[0]["closing_comment"] == "stop"
+    assert [s["comment"] for s in sessions] == ["start", "b"]
+
+
+def test_toggle_is_sent_with_the_sync_without_rewriting_local_history(server, tmp_path):
+    backend, requests_sent = server
+    laptop, laptop_config = make_client(tmp_path, "laptop")
+    laptop.add_manual_session("alpha", "2025-01-01", "09:00:00", "2025-01-01", "10:00:00", "one")
+    presis.sync_with_server(laptop_config, laptop)
+    with open(laptop.json_file) as f:
+        synced_data = f.read()
+
+    laptop = TimeTracker(laptop.json_file)
+    presis.toggle_project_tracking(laptop_config, laptop, "alpha", "start")
+    # One request carried the toggle, and the data file was neither read nor rewritten
+    assert requests_sent[-1]["changes"] == []
+    assert [op["comment"] for op in requests_sent[-1]["ops"]] == ["start"]
+    assert laptop._projects is None
+    with open(laptop.json_file) as f:
+        assert f.read() == synced_data
+    assert [s["comment"] for s in TimeTracker(laptop.json_file).projects[0]["sessions"]] == ["one", "start"]
+    assert Outbox(presis.OUTBOX_FILE).pending() == []
+
+    # Another device's change comes back with the next toggle
+    RedisTimeTracker(1, backend).add_or_update_project("beta", "elsewhere")
+    presis.toggle_project_tracking(laptop_config, TimeTracker(laptop.json_file), "alpha", "stop")
+    assert requests_sent[-1]["cursor"] == 2
+    projects = TimeTracker(laptop.json_file).projects
+    assert [p["project_name"] for p in projects] == ["alpha", "beta"]
+    assert projects[0]["sessions"][-1]["closing_comment"] == "stop"
+
+
+def test_offline_toggles_are_queued_and_applied_once(server, tmp_path, monkeypatch):
+    backend, requests_sent = server
+    laptop, laptop_config = make_client(tmp_path, "laptop")
+    presis.sync_with_server(laptop_config, laptop)
+    post = presis.requests.Session.post
+
+    def offline(session, url, **kwargs):
+        raise presis.requests.exceptions.ConnectionError("offline")
+
+    monkeypatch.setattr(presis.requests.Session, "post", offline)
+    presis.toggle_project_tracking(laptop_config, laptop, "alpha", "offline")
+    # Recorded locally straight away, and queued for the server
+    assert laptop.get_project("alpha")["sessions"][0]["comment"] == "offline"
+    queued = Outbox(presis.OUTBOX_FILE).pending()
+    assert [(op["project_name"], op["local"]) for op in queued] == [("alpha", True)]
+
+    # The server applies the toggle but its answer is lost, so it is sent again
+    def answer_lost(session, url, **kwargs):
+        post(session, url, **kwargs)
+        raise presis.requests.exceptions.ConnectionError("timed out")
+
+    monkeypatch.setattr(presis.requests.Session, "post", answer_lost)
+    assert not presis.sync_with_server(laptop_config, TimeTracker(laptop.json_file))
+    monkeypatch.setattr(presis.requests.Session, "post", post)
+    assert presis.sync_with_server(laptop_config, TimeTracker(laptop.json_file))
+    assert requests_sent[-1]["ops"][0]["key"] == queued[0]["key"]
+    # Started once, not started and then stopped by the resent toggle
+    sessions = RedisTimeTracker(1, backend).get_project("alpha")["sessions"]
+    assert [(s["start"], s["end"]) for s in sessions] == [(queued[0]["at"], None)]
+    assert Outbox(presis.OUTBOX_FILE).pending() == []
+
+
+def test_offline_changes_are_sent_on_next_sync(server, tmp_path, monkeypatch):
+    backend, requests_sent = server
+    laptop, laptop_config = make_client(tmp_path, "laptop")
+    presis.sync_with_server(laptop_config, laptop)
+
+    laptop_config["token"] = None
+    presis.toggle_project_tracking(laptop_config, laptop, "alpha", "offline")
+    laptop_config["token"] = "t"
+    presis.sync_with_server(laptop_config, TimeTracker(laptop.json_file))
+    assert requests_sent[-1]["changes"][0]["project_name"] == "alpha"
+    assert RedisTimeTracker(1, backend).get_project("alpha")["sessions"][0]["comment"] == "offline"
+
+
+def test_replies_of_servers_without_delta_sync_are_applied(tmp_path, monkeypatch):
+    server_session = {"start": "01/01/25 - 09:00:00", "end": "01/01/25 - 10:00:00", "comment": "desktop"}
+
+    def post(session, url, data=None, headers=None, **kwargs):
+        if not url.endswith("/api/sync"):
+            return FakeResponse({"error": "Not found"}, status_code=404)
+        projects = json.loads(gzip.decompress(data) if headers.get("Content-Encoding") == "gzip" else data)["projects"]
+        return FakeResponse({"data": {"projects": projects + [{"project_name": "beta", "sessions": [server_session]}]}})
+
+    monkeypatch.setattr(presis.requests.Session, "post", post)
+    monkeypatch.setattr(presis, "save_config", lambda config: None)
+    monkeypatch.setattr(presis, "OUTBOX_FILE", str(tmp_path / "outbox.ndjson"))
+    laptop, config = make_client(tmp_path, "laptop")
+    laptop.add_or_update_project("alpha", "start")
+
+    assert presis.sync_with_server(config, laptop)
+    local = TimeTracker(laptop.json_file)
+    assert [p["project_name"] for p in local.projects] == ["alpha", "beta"]
+    assert local.get_project("beta")["sessions"] == [server_session]
+
+
+def test_servers_without_delta_sync_are_revalidated_per_data_file(tmp_path, monkeypatch):
+    sent_etags = []
+
+    def post(session, url, data=None, headers=None, **kwargs):
+        if not url.endswith("/api/sync"):
+            return FakeResponse({"error": "Not found"}, status_code=404)
+        sent_etags.append(headers.get("If-None-Match"))
+        response = FakeResponse({"data": {"projects": []}})
+        response.headers["ETag"] = "timesheet-1-1"
+        return response
+
+    monkeypatch.setattr(presis.requests.Session, "post", post)
+    monkeypatch.setattr(presis, "save_config", lambda config: None)
+    monkeypatch.setattr(presis, "OUTBOX_FILE", str(tmp_path / "outbox.ndjson"))
+    laptop, config = make_client(tmp_path, "laptop")
+    work, _ = make_client(tmp_path, "work")
+
+    for tracker in (laptop, work, laptop):
+        presis.sync_with_server(config, tracker)
+    assert sent_etags == [None, None, "timesheet-1-1"]
+    # A recreated data file has received nothing yet
+    os.remove(laptop.json_file)
+    presis.create_data_file(laptop.json_file, config)
+    presis.sync_with_server(config, TimeTracker(laptop.json_file))
+    assert sent_etags[-1] is None
+
+
+def test_cli_imports_network_and_plotting_modules_on_demand():
+    import subprocess
+    code = "import sys, presis; print(sorted(m for m in ('requests', 'matplotlib', 'redis') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.join(os.path.dirname(__file__), '..'))
+    assert result.stdout.strip() == "[]"
+
+
+def test_status_reads_only_the_local_data(tmp_path, capsys):
+    tracker, _ = make_client(tmp_path, "status")
+    tracker.add_or_update_project("alpha", "working")
+    tracker.add_or_update_project("beta", "done")
+    tracker.add_or_update_project("beta", "done")
+    capsys.readouterr()
+
+    presis.print_status(TimeTracker(tracker.json_file))
+    output = capsys.readouterr().out
+    assert output.startswith("'alpha' running since") and "beta" not in output
+    presis.print_status(TimeTracker(tracker.json_file), "beta")
+    assert capsys.readouterr().out == "'beta' is not being tracked\n"
+
+
+def test_gzipped_request_bodies_are_inflated_for_the_app():
+    from werkzeug.test import Client
+    from werkzeug.wrappers import Request, Response
+    from presis.compression import GzipRequestMiddleware
+
+    @Request.application
+    def echo(request):
+        return Response(request.get_data())
+
+    client = Client(GzipRequestMiddleware(echo, max_size=1000))
+    body = json.dumps({"changes": ["x" * 900]}).encode()
+    response = client.post("/", data=gzip.compress(body), headers={"Content-Encoding": "gzip"})
+    assert response.get_data() == body
+    assert client.post("/", data=b"plain").get_data() == b"plain"
+
+    assert client.post("/", data=gzip.compress(b"x" * 1001), headers={"Content-Encoding": "gzip"}).status_code == 413
+    assert client.post("/", data=b"not gzip", headers={"Content-Encoding": "gzip"}).status_code == 400
+
+
+def test_agent_runs_cli_commands_and_coalesces_writes(tmp_path, monkeypatch, capsys):
+    import threading
+    from presis import agent
+    monkeypatch.chdir(tmp_path)  # A short socket path
+    monkeypatch.setattr(presis, "CONFIG_FILE", str(tmp_path / "config.json"))
+    monkeypatch.setattr(presis, "AGENT_SOCKET", "agent.sock")
+    ready = threading.Event()
+    thread = threading.Thread(target=agent.serve, args=("agent.sock", 60, 0, ready))
+    thread.start()
+    assert ready.wait(5)
+    data_file = tmp_path / "data.json"
+
+    def cli(*args):
+        monkeypatch.setattr(sys, "argv", ["presis", *args, "-p", str(data_file)])
+        presis.main()
+        return capsys.readouterr().out
+
+    try:
+        assert "Started time tracking for 'alpha'" in cli("alpha", "-c", "start")
+        assert cli("-s").startswith("'alpha' running since")
+        assert cli("alpha", "-c", "stop").endswith("Stopped time tracking for 'alpha'\n")
+        # Both toggles are still held by the agent
+        assert json.loads(data_file.read_text()) == {"projects": []}
+
+        # Other commands run in the CLI, once the agent has written its changes
+        cli("alpha", "-r")
+        sessions = json.loads(data_file.read_text())["projects"][0]["sessions"]
+        assert [(s["comment"], s["closing_comment"]) for s in sessions] == [("start", "stop")]
+
+        # A file changed by something else is reloaded
+        data_file.write_text(json.dumps({"projects": [{"project_name": "beta", "sessions": [
+            {"start": "01/01/25 - 09:00:00", "end": None, "comment": ""}]}]}))
+        assert cli("-s").startswith("'beta' running since")
+        cli("alpha", "-c", "again")
+    finally:
+        assert agent.request("agent.sock", {"cmd": "stop"}) == {"ok": True}
+        thread.join(5)
+    assert not os.path.exists("agent.sock")
+    assert [p["project_name"] for p in json.loads(data_file.read_text())["projects"]] == ["beta", "alpha"]
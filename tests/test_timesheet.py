@@ -146,3 +146,25 @@ def test_late_night_timesheet_entries():
 #     daily_hours = plotter.get_total_hours_per_day()
 #     expected = defaultdict(float, {1: 1.9, 2: 8.5})
 #     assert daily_hours == expected
+
+def test_deferred_writes_are_saved_on_flush():
+    test_file = create_test_file('test_deferred.json', "deferred", [])
+
+    tracker = TimeTracker(test_file, autoflush=False)
+    tracker.add_manual_session("deferred", "2025-01-01", "10:00:00", "2025-01-01", "11:00:00", "deferred entry")
+    assert tracker.dirty
+    assert TimeTracker(test_file).projects[0]['sessions'] == []
+
+    tracker.flush()
+    assert not tracker.dirty
+    assert len(TimeTracker(test_file).projects[0]['sessions']) == 1
+
+
+def test_version_changes_when_data_is_saved(tmp_path):
+    tracker = TimeTracker(str(tmp_path / "data.json"))
+    assert tracker.current_version() == "0"
+    tracker.add_or_update_project("alpha", "start")
+    first = tracker.current_version()
+    assert first != "0"
+    tracker.add_or_update_project("alpha", "stop")
+    assert tracker.current_version("alpha") != first
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import multiprocessing
+import pytest
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from presis.redis_backend import RedisBackend
+from presis.redis_time_tracker import RedisTimeTracker
+
+
+def make_worker(server, **cache_settings):
+    """A backend standing in for one web worker, with its timesheet cache enabled"""
+    backend = RedisBackend(connection_class=fakeredis.FakeRedisConnection, server=server, health_check_interval=0)
+    cache = backend.enable_timesheet_cache(**cache_settings)
+    assert cache.wait_until_listening(timeout=5)
+    return backend
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def test_repeat_reads_are_served_from_cache(server, monkeypatch):
+    worker = make_worker(server)
+    RedisTimeTracker(1, worker).add_or_update_project("alpha", "start")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cached reads must not call Redis")
+
+    monkeypatch.setattr(worker.r, "mget", fail)
+    for _ in range(3):
+        assert RedisTimeTracker(1, worker).get_project("alpha")["sessions"][0]["end"] is None
+    assert worker.stats["timesheet_cache_hits"] == 3
+
+
+def test_writes_invalidate_other_workers(server):
+    first = make_worker(server)
+    second = make_worker(server)
+    RedisTimeTracker(1, first).add_or_update_project("alpha", "start")
+    assert RedisTimeTracker(1, second).version == 1
+
+    RedisTimeTracker(1, first).add_or_update_project("beta", "start")
+    assert wait_for(lambda: len(second.timesheet_cache) == 0)
+
+    tracker = RedisTimeTracker(1, second)
+    assert tracker.version == 2
+    assert tracker.get_project("beta") is not None
+
+
+def test_min_version_bypasses_older_entries(server):
+    first = make_worker(server)
+    second = make_worker(server)
+    RedisTimeTracker(1, first).add_or_update_project("alpha", "start")
+    RedisTimeTracker(1, second).projects
+
+    # The entry could still be cached if the invalidation were slow, but a
+    # client that knows it wrote version 2 never gets version 1
+    second.timesheet_cache.put(1, 1, [])
+    RedisTimeTracker(1, first).add_or_update_project("beta", "start")
+    assert RedisTimeTracker(1, second, min_version=2).get_project("beta") is not None
+
+
+def test_reads_older_than_an_invalidation_are_not_cached(server):
+    first = make_worker(server)
+    second = make_worker(server)
+    RedisTimeTracker(1, first).add_or_update_project("alpha", "start")
+    # second reads version 1, first commits version 2, and its invalidation reaches
+    # second before second stores what it read
+    RedisTimeTracker(1, first).add_or_update_project("beta", "start")
+    assert wait_for(lambda: second.timesheet_cache._invalidated.get("1") == 2)
+    second.timesheet_cache.put(1, 1, [])
+    assert second.timesheet_cache.get(1) is None
+
+    assert RedisTimeTracker(1, second).get_project("beta") is not None
+    assert second.timesheet_cache.get(1)[0] == 2
+
+
+def test_cached_projects_are_copied_before_changes(server):
+    worker = make_worker(server)
+    RedisTimeTracker(1, worker).add_or_update_project("alpha", "start")
+
+    reader = RedisTimeTracker(1, worker)
+    writer = RedisTimeTracker(1, worker, autoflush=False)
+    writer.add_or_update_project("beta", "start")
+
+    assert writer.get_project("beta") is not None
+    assert reader.get_project("beta") is None
+
+
+def test_cache_is_bounded_by_size_and_age(server):
+    worker = make_worker(server, maxsize=2, ttl=60)
+    cache = worker.timesheet_cache
+    for user_id in (1, 2, 3):
+        cache.put(user_id, 1, [])
+    assert len(cache) == 2
+    assert cache.get(1) is None
+
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get(3) is None
+
+
+def _toggle_in_process(port, worker, rounds, results):
+    """Worker process: toggle a project and read it back through the cache"""
+    backend = RedisBackend(port=port)
+    backend.enable_timesheet_cache().wait_until_listening(timeout=5)
+    for _ in range(rounds):
+        tracker = RedisTimeTracker(1, backend)
+        tracker.add_or_update_project(f"worker-{worker}", "")
+        written = tracker.version
+        # Read your own writes, even when served from the cache
+        reread = RedisTimeTracker(1, backend, min_version=written)
+        sessions = reread.get_project(f"worker-{worker}")["sessions"]
+        if reread.version < written or not sessions:
+            results.put(("stale", worker))
+            return
+    results.put(("done", worker))
+
+
+def test_cache_across_processes(redis_server_factory):
+    port = redis_server_factory()
+    workers, rounds = 4, 20
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_toggle_in_process, args=(port, worker, rounds, results))
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+
+    assert sorted(outcomes) == [("done", worker) for worker in range(workers)]
+    backend = RedisBackend(port=port)
+    tracker = RedisTimeTracker(1, backend)
+    assert tracker.version == workers * rounds
+    # Every toggle was applied: each worker opened and closed rounds / 2 sessions
+    for worker in range(workers):
+        assert len(tracker.get_project(f"worker-{worker}")["sessions"]) == rounds // 2
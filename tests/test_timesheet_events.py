@@ -0,0 +1,78 @@
+import os
+import sys
+import queue
+import pytest
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from presis.redis_backend import RedisBackend
+from presis.redis_time_tracker import RedisTimeTracker
+from presis.timesheet_events import EventHub, format_sse
+
+
+def make_backend(server):
+    """A backend standing in for one web worker"""
+    return RedisBackend(connection_class=fakeredis.FakeRedisConnection, server=server, health_check_interval=0)
+
+
+def received(events):
+    items = []
+    while True:
+        try:
+            items.append(events.get(timeout=0.5))
+        except queue.Empty:
+            return items
+
+
+def test_events_of_any_worker_reach_the_user_streams():
+    server = fakeredis.FakeServer()
+    hub = EventHub(make_backend(server))
+    mine, other_user = hub.subscribe(1), hub.subscribe(2)
+    assert hub.wait_until_listening(timeout=5)
+
+    tracker = RedisTimeTracker(1, make_backend(server))
+    tracker.add_or_update_project("alpha", "start")
+    tracker.add_manual_session("beta", "2025-01-01", "09:00:00", "2025-01-01", "10:00:00", "manual")
+    tracker.add_or_update_project("alpha", "stop")
+
+    events = received(mine)
+    assert [(e["type"], e["project_name"], e["version"]) for e in events] == [
+        ("started", "alpha", 1), ("entry", "beta", 2), ("stopped", "alpha", 3)]
+    assert events[2]["session"]["closing_comment"] == "stop" and events[2]["session"]["rev"] == 3
+    assert format_sse(events[0]).startswith("event: started\nid: 1\ndata: {")
+    assert received(other_user) == []
+
+
+def test_replayed_writes_publish_their_events_once():
+    server = fakeredis.FakeServer()
+    hub = EventHub(make_backend(server))
+    events = hub.subscribe(1)
+    assert hub.wait_until_listening(timeout=5)
+    first = RedisTimeTracker(1, make_backend(server), autoflush=False)
+    second = RedisTimeTracker(1, make_backend(server))
+    first.add_or_update_project("alpha", "start")
+    second.add_or_update_project("beta", "start")
+
+    # first's write conflicts with second's and is replayed on top of it
+    first.flush()
+    assert [(e["project_name"], e["version"]) for e in received(events)] == [("beta", 1), ("alpha", 2)]
+
+
+def test_streams_over_the_worker_limit_are_refused(redis_app, monkeypatch):
+    monkeypatch.setattr(redis_app, "event_streams", redis_app.threading.BoundedSemaphore(1))
+    redis_app.user_repository.create("user@example.com", "pw")
+    client = redis_app.app.test_client()
+    client.post("/login", data={"email": "user@example.com", "password": "pw"})
+
+    stream = client.get("/events")
+    assert stream.status_code == 200
+    assert client.get("/events").status_code == 503
+    # Pages refused a stream poll the version instead
+    before = client.get("/events/version").get_json()["version"]
+    client.post("/project/create", data={"project_name": "alpha"})
+    assert client.get("/events/version").get_json()["version"] > before
+    stream.close()
+    assert client.get("/events").status_code == 200
@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import pytest
+from datetime import date, datetime
+
+# Add the project root to the Python path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from presis.time_tracker import TimeTracker
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    """Tracker with three projects, one of them active"""
+    data_file = tmp_path / "data.json"
+    data_file.write_text(json.dumps({"projects": [
+        {"project_name": "gamma", "sessions": [
+            {"start": "01/01/25 - 09:00:00", "end": "01/01/25 - 10:00:00", "comment": ""},
+        ]},
+        {"project_name": "alpha", "sessions": [
+            {"start": "01/01/25 - 10:00:00", "end": "01/01/25 - 12:00:00", "comment": ""},
+            # Overlaps the first session and is only counted once
+            {"start": "01/01/25 - 11:00:00", "end": "01/01/25 - 12:30:00", "comment": ""},
+            {"start": "03/01/25 - 23:00:00", "end": "04/01/25 - 01:00:00", "comment": ""},
+        ]},
+        {"project_name": "beta", "sessions": [
+            {"start": "02/01/25 - 10:00:00", "end": None, "comment": ""},
+        ]},
+    ]}))
+    return TimeTracker(str(data_file))
+
+
+def test_summaries_are_projected_and_paginated(tracker):
+    fields = ["name", "active", "total_hours", "session_count"]
+    first, cursor = tracker.project_summaries(fields=fields, limit=2)
+    assert first == [
+        {"name": "alpha", "active": False, "total_hours": 4.5, "session_count": 3},
+        {"name": "beta", "active": True, "total_hours": first[1]["total_hours"], "session_count": 1},
+    ]
+    second, cursor = tracker.project_summaries(fields=fields, limit=2, cursor=cursor)
+    assert [p["name"] for p in second] == ["gamma"]
+    assert cursor is None
+    # Session histories are left out unless asked for
+    default, _ = tracker.project_summaries(limit=2)
+    assert default[0] == {"name": "alpha", "active": False, "session_count": 3}
+
+
+def test_date_window_limits_sessions_and_hours(tracker):
+    projects, _ = tracker.project_summaries(
+        fields=["name", "total_hours", "sessions"], since=date(2025, 1, 4), until=date(2025, 1, 4))
+    alpha = projects[0]
+    assert alpha["total_hours"] == 1.0
+    assert [s["start"] for s in alpha["sessions"]] == ["03/01/25 - 23:00:00"]
+    assert projects[2]["sessions"] == []
+
+
+def test_unknown_fields_and_bad_cursors_are_rejected(tracker):
+    with pytest.raises(ValueError):
+        tracker.project_summaries(fields=["name", "password"])
+    with pytest.raises(ValueError):
+        tracker.project_summaries(cursor="not a cursor!")
+
+
+def test_sessions_between_returns_only_overlapping_sessions(tracker):
+    now = datetime(2025, 1, 2, 12, 0, 0)
+    overlapping = tracker.sessions_between("alpha", datetime(2025, 1, 4), datetime(2025, 1, 5), now=now)
+    assert [(s["start"], end) for s, start, end in overlapping] == [
+        ("03/01/25 - 23:00:00", datetime(2025, 1, 4, 1, 0, 0)),
+    ]
+    active = tracker.sessions_between("beta", datetime(2025, 1, 1), datetime(2025, 2, 1), now=now)
+    assert active[0][2] == now
+    assert tracker.sessions_between("missing", datetime(2025, 1, 1), datetime(2025, 2, 1)) == []